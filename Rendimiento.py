@@ -0,0 +1,254 @@
+# Copyright (C) 2025 Julio A. Galindo Q.
+# This file is part of Numerical-Simulation-of-Core-Descent-in-Upward-Inclined-Boreholes.
+#
+# Numerical-Simulation-of-Core-Descent-in-Upward-Inclined-Boreholes is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Numerical-Simulation-of-Core-Descent-in-Upward-Inclined-Boreholes is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Numerical-Simulation-of-Core-Descent-in-Upward-Inclined-Boreholes.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# Copyright (C) 2025 Julio A. Galindo Q.
+# Este archivo es parte de Numerical-Simulation-of-Core-Descent-in-Upward-Inclined-Boreholes.
+#
+# Numerical-Simulation-of-Core-Descent-in-Upward-Inclined-Boreholes es software libre: puedes redistribuirlo y/o modificarlo
+# bajo los términos de la Licencia Pública General GNU según lo publicado por
+# la Free Software Foundation, ya sea la versión 3 de la licencia o
+# (a tu elección) cualquier versión posterior.
+#
+# Numerical-Simulation-of-Core-Descent-in-Upward-Inclined-Boreholes se distribuye con la esperanza de que sea útil,
+# pero SIN NINGUNA GARANTÍA; sin ni siquiera la garantía implícita de
+# COMERCIABILIDAD o ADECUACIÓN A UN PROPÓSITO PARTICULAR. Consulta la
+# Licencia Pública General GNU para más detalles.
+#
+# Deberías haber recibido una copia de la Licencia Pública General GNU
+# junto con Numerical-Simulation-of-Core-Descent-in-Upward-Inclined-Boreholes.  Si no, consulta <http://www.gnu.org/licenses/>.
+
+
+# Suite de rendimiento sin pantalla: integrador, curvas límite y main completo.
+# Guarda cada corrida en un historial JSON y marca regresiones contra una línea base.
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+import Simulacion
+from Simulacion import SimuladorTestigo, parametros_lote, simular_lote, simular_analitico, simular_tren
+
+Simulacion.modo_sin_pantalla()
+
+CONFIG_BASE = {
+    "longitud_testigo_m": 3.0,
+    "longitud_pozo_m": 100.0,
+    "caudal_lpm": 30,
+    "viscosidad_marsh_seg": 30,
+    "angulo_deg": 60,
+    "rango_viscosidad": [30, 42, 2],
+    "rango_angulo": [30, 60, 10],
+    "rango_caudal": [20, 80, 10],
+    "tiempo_max_simulacion_seg": 1000
+}
+
+def medir(funcion, repeticiones=3):
+    # Mejor tiempo de pared de varias repeticiones y pico de memoria de una corrida
+    tiempos = []
+    resultado = None
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    funcion()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(tiempos), pico, resultado
+
+class _Contador:
+    # Envuelve aceleracion para contar evaluaciones
+    def __init__(self, sim):
+        self.n = 0
+        self.original = sim.aceleracion
+
+    def __call__(self, v, x=None):
+        self.n += 1
+        return self.original(v, x)
+
+def caso_rk4(diametro, repeticiones):
+    sim = SimuladorTestigo(dict(CONFIG_BASE), diametro)
+    contador = _Contador(sim)
+    sim.aceleracion = contador
+    tiempo, pico, (T, _, _, _) = medir(sim.simular, repeticiones)
+    llamadas = contador.n // (repeticiones + 1)
+    return {"tiempo_s": tiempo, "memoria_pico_mb": pico / 2**20,
+            "pasos_por_s": len(T) / tiempo, "aceleracion_por_s": llamadas / tiempo}
+
+def _barrido(n, semilla=0):
+    rng = np.random.default_rng(semilla)
+    p = parametros_lote([(d, CONFIG_BASE) for d in ("NQ", "HQ", "PQ")])
+    p = p[rng.integers(0, 3, n)]
+    p["angulo_deg"] = rng.uniform(10, 90, n)
+    p["caudal_lpm"] = rng.uniform(10, 120, n)
+    p["viscosidad_marsh_seg"] = rng.uniform(28, 45, n)
+    p["tiempo_max_simulacion_seg"] = 200
+    return p
+
+def caso_lote(n, repeticiones):
+    p = _barrido(n)
+    tiempo, pico, r = medir(lambda: simular_lote(p), repeticiones)
+    pasos = int(r["pasos"].sum())
+    return {"tiempo_s": tiempo, "memoria_pico_mb": pico / 2**20, "casos_por_s": n / tiempo,
+            "pasos_por_s": pasos / tiempo, "aceleracion_por_s": 4 * pasos / tiempo}
+
+def caso_tren(n, piezas, repeticiones):
+    # n trenes de piezas de 0.1 a 0.6 m (mismo barrido que caso_lote)
+    p = _barrido(n)
+    largos = np.random.default_rng(1).uniform(0.1, 0.6, (n, piezas))
+    tiempo, pico, r = medir(lambda: simular_tren(p, largos), repeticiones)
+    pasos = int(r["pasos"].max())
+    return {"tiempo_s": tiempo, "memoria_pico_mb": pico / 2**20, "piezas_por_s": n * piezas / tiempo,
+            "pasos_por_s": pasos / tiempo}
+
+def caso_analitico(n, repeticiones):
+    p = _barrido(n)
+    tiempo, pico, _ = medir(lambda: simular_analitico(p), repeticiones)
+    return {"tiempo_s": tiempo, "memoria_pico_mb": pico / 2**20, "casos_por_s": n / tiempo}
+
+def caso_curvas(diametro, familia, resolucion, repeticiones):
+    sim = SimuladorTestigo(dict(CONFIG_BASE), diametro)
+    caudales = np.linspace(sim.Q_min, sim.max_caudal_bombeo, resolucion)
+    if familia == "viscosidad":
+        viscosidades = np.linspace(28, 45, max(resolucion // 10, 2))
+        evaluar = lambda: sim.curvas_angulo_critico(viscosidades, caudales)
+    elif familia == "angulo":
+        angulos = np.linspace(0, 90, max(resolucion // 10, 2))
+        evaluar = lambda: sim.curvas_viscosidad_critica(angulos, caudales)
+    else:
+        angulos = np.linspace(0, 90, resolucion)
+        evaluar = lambda: sim.curvas_viscosidad_critica(angulos, caudales[::10])
+
+    def funcion():
+        sim.nucleo.cache.clear()   # medir la evaluación, no los aciertos del LRU
+        return evaluar()
+
+    tiempo, pico, curvas = medir(funcion, repeticiones)
+    return {"tiempo_s": tiempo, "memoria_pico_mb": pico / 2**20, "puntos_por_s": curvas.size / tiempo}
+
+def caso_reporte(diametro, directorio):
+    sim = SimuladorTestigo(dict(CONFIG_BASE), diametro)
+    sim.salida = directorio
+    tiempo, pico, _ = medir(sim.graficar_reporte, 1)
+    return {"tiempo_s": tiempo, "memoria_pico_mb": pico / 2**20}
+
+def caso_main(entradas, directorio):
+    # main completo (subproceso: incluye el arranque del intérprete y los imports)
+    config = {f"{d}_{i}": dict(CONFIG_BASE, diametro=d) for i in range(entradas) for d in ("NQ", "HQ", "PQ")}
+    ruta = os.path.join(directorio, "config.json")
+    with open(ruta, "w") as f:
+        json.dump(config, f)
+    comando = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Simulacion.py"),
+               ruta, "--salida", os.path.join(directorio, "figuras")]
+    t0 = time.perf_counter()
+    subprocess.run(comando, check=True, stdout=subprocess.DEVNULL)
+    return {"tiempo_s": time.perf_counter() - t0}
+
+def ejecutar(rapido=False):
+    rep = 1 if rapido else 3
+    resultados = {}
+    with tempfile.TemporaryDirectory() as directorio:
+        for diam in ("NQ", "HQ", "PQ"):
+            resultados[f"rk4_{diam}"] = caso_rk4(diam, rep)
+        for n in ((200,) if rapido else (200, 2000)):
+            resultados[f"lote_{n}"] = caso_lote(n, rep)
+        for n, piezas in (((20, 10),) if rapido else ((20, 10), (200, 30))):
+            resultados[f"tren_{n}x{piezas}"] = caso_tren(n, piezas, rep)
+        for n in ((10000,) if rapido else (10000, 100000)):
+            resultados[f"analitico_{n}"] = caso_analitico(n, rep)
+        for familia in ("viscosidad", "angulo", "caudal"):
+            for resolucion in ((100, 1000) if rapido else (100, 1000, 10000)):
+                for diam in ("NQ", "HQ", "PQ"):
+                    resultados[f"curvas_{familia}_{resolucion}_{diam}"] = caso_curvas(diam, familia, resolucion, rep)
+        for diam in ("NQ", "HQ", "PQ"):
+            resultados[f"reporte_{diam}"] = caso_reporte(diam, directorio)
+        entradas = 1 if rapido else 3
+        resultados[f"main_{3 * entradas}_entradas"] = caso_main(entradas, directorio)
+    return resultados
+
+def _version_codigo():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def regresiones(resultados, linea_base, tolerancia):
+    # Casos cuyo tiempo supera al de la línea base en más de la tolerancia relativa
+    lista = []
+    for caso, medidas in resultados.items():
+        base = linea_base.get(caso)
+        if base and medidas["tiempo_s"] > base["tiempo_s"] * (1 + tolerancia):
+            lista.append((caso, base["tiempo_s"], medidas["tiempo_s"]))
+    return lista
+
+def main():
+    parser = argparse.ArgumentParser(description="Suite de rendimiento del simulador de testigo (sin pantalla).")
+    parser.add_argument("--rapido", action="store_true", help="Menos repeticiones y tamaños más chicos.")
+    parser.add_argument("--historial", default="rendimiento_historial.json", help="Archivo JSON donde se agregan las corridas.")
+    parser.add_argument("--linea_base", default="rendimiento_base.json", help="Archivo JSON con la línea base.")
+    parser.add_argument("--guardar_linea_base", action="store_true", help="Guardar esta corrida como nueva línea base.")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Aumento relativo de tiempo tolerado antes de marcar regresión.")
+    args = parser.parse_args()
+
+    resultados = ejecutar(args.rapido)
+    corrida = {
+        "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "version": _version_codigo(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "rapido": args.rapido,
+        "resultados": resultados,
+    }
+
+    historial = []
+    if os.path.exists(args.historial):
+        with open(args.historial) as f:
+            historial = json.load(f)
+    historial.append(corrida)
+    with open(args.historial, "w") as f:
+        json.dump(historial, f, indent=1)
+
+    for caso, medidas in resultados.items():
+        extra = ", ".join(f"{k} {v:.3g}" for k, v in medidas.items() if k != "tiempo_s")
+        print(f"{caso:32s} {medidas['tiempo_s']:10.4f} s  {extra}")
+
+    if args.guardar_linea_base:
+        with open(args.linea_base, "w") as f:
+            json.dump(resultados, f, indent=1)
+        return
+
+    if os.path.exists(args.linea_base):
+        with open(args.linea_base) as f:
+            linea_base = json.load(f)
+        lista = regresiones(resultados, linea_base, args.tolerancia)
+        for caso, antes, ahora in lista:
+            print(f"REGRESIÓN {caso}: {antes:.4f} s -> {ahora:.4f} s")
+        if lista:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -33,29 +33,714 @@
 
 
 import numpy as np
-import matplotlib
-matplotlib.use('Qt5Agg')
-import matplotlib.pyplot as plt
-from matplotlib.offsetbox import AnchoredText
+import math
 import textwrap
 import argparse
 import json
-import tkinter as tk
+import os
+import hashlib
+import struct
+import time
+import contextlib
+import bisect
+import asyncio
+import collections
+import itertools
+
+# matplotlib y tkinter se importan solo al graficar; sin pantalla se usa Agg
+_plt = None
+_backend = "Qt5Agg"
+
+def modo_sin_pantalla():
+    global _backend
+    if _plt is None:
+        _backend = "Agg"
+
+def _pyplot():
+    global _plt
+    if _plt is None:
+        import matplotlib
+        matplotlib.use(_backend)
+        import matplotlib.pyplot as plt
+        _plt = plt
+    return _plt
+
+DIAMETROS = {
+    "NQ": {"d_t": 0.045, "d_b": 0.0476},
+    "HQ": {"d_t": 0.0611, "d_b": 0.0635},
+    "PQ": {"d_t": 0.083, "d_b": 0.085}
+}
+
+# Parámetros de un caso por carril para la integración en lote
+PARAMETROS_LOTE = np.dtype([
+    ("d_t", "f8"),
+    ("d_b", "f8"),
+    ("longitud_testigo_m", "f8"),
+    ("longitud_pozo_m", "f8"),
+    ("caudal_lpm", "f8"),
+    ("viscosidad_marsh_seg", "f8"),
+    ("angulo_deg", "f8"),
+    ("densidad_roca_kgm3", "f8"),
+    ("densidad_fluido_kgm3", "f8"),
+    ("tiempo_max_simulacion_seg", "f8"),
+    ("coef_arrastre", "f8"),
+])
+
+VERSION_MODELO = "1"   # cambiar cuando cambie la física o la numérica: invalida la caché
+
+class Perfil:
+    # Instrumentación opcional (--perfil o variable SIMULACION_PERFIL): tiempo y
+    # memoria pico (sobre la del inicio de la fase) por fase y diámetro, y
+    # contadores de pasos y evaluaciones. Desactivada no agrega costo.
+    # Se exporta en formato de traza de Chrome (chrome://tracing, Perfetto).
+    def __init__(self):
+        import tracemalloc
+        self._tracemalloc = tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.eventos = []
+        self.contadores = {}
+        self._picos = []
+
+    @contextlib.contextmanager
+    def fase(self, nombre, diametro=None):
+        # El pico de una fase anidada también cuenta para la fase que la contiene
+        if self._picos:
+            self._picos[-1] = max(self._picos[-1], self._tracemalloc.get_traced_memory()[1])
+        self._tracemalloc.reset_peak()
+        base = self._tracemalloc.get_traced_memory()[0]
+        self._picos.append(0)
+        inicio_us = time.time_ns() // 1000
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            duracion = time.perf_counter() - t0
+            pico = max(self._picos.pop(), self._tracemalloc.get_traced_memory()[1])
+            if self._picos:
+                self._picos[-1] = max(self._picos[-1], pico)
+            self.eventos.append({"name": nombre, "cat": diametro or "", "ph": "X",
+                                 "ts": inicio_us, "dur": duracion * 1e6, "pid": os.getpid(), "tid": 0,
+                                 "args": {"memoria_pico_mb": (pico - base) / 2**20}})
+
+    def contar(self, nombre, n=1):
+        self.contadores[nombre] = self.contadores.get(nombre, 0) + n
+
+    def instrumentar(self, sim, registros):
+        # Cuenta registros y evaluaciones de aceleracion de una integración
+        original = sim.aceleracion
+        n = [0]
+
+        def aceleracion(v, x=None):
+            n[0] += 1
+            return original(v, x)
+
+        sim.aceleracion = aceleracion
+        pasos = 0
+        try:
+            for registro in registros:
+                pasos += 1
+                yield registro
+        finally:
+            del sim.aceleracion
+            self.contar(f"registros_{sim.integrador}", pasos)
+            self.contar("aceleracion", n[0])
+
+    def datos(self):
+        return {"eventos": self.eventos, "contadores": self.contadores}
+
+    def combinar(self, datos):
+        self.eventos.extend(datos["eventos"])
+        for nombre, n in datos["contadores"].items():
+            self.contar(nombre, n)
+
+    def guardar(self, ruta):
+        resumen = {}
+        for e in self.eventos:
+            fases = resumen.setdefault(e["cat"] or "-", {})
+            f = fases.setdefault(e["name"], {"llamadas": 0, "tiempo_s": 0.0, "memoria_pico_mb": 0.0})
+            f["llamadas"] += 1
+            f["tiempo_s"] += e["dur"] / 1e6
+            f["memoria_pico_mb"] = max(f["memoria_pico_mb"], e["args"]["memoria_pico_mb"])
+        with open(ruta, "w") as f:
+            json.dump({"traceEvents": self.eventos, "contadores": self.contadores, "resumen": resumen}, f, indent=1)
+
+_perfil = None
+
+def activar_perfil():
+    global _perfil
+    _perfil = Perfil()
+    return _perfil
+
+def _fase(nombre, diametro=None):
+    if _perfil is None:
+        return contextlib.nullcontext()
+    return _perfil.fase(nombre, diametro)
+
+class CacheResultados:
+    # Caché en disco direccionada por contenido: un .npz comprimido por clave,
+    # con desalojo LRU (por fecha de último uso) al superar max_bytes.
+    def __init__(self, directorio, max_bytes=500 * 2**20):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        os.makedirs(directorio, exist_ok=True)
+
+    def clave(self, tipo, campos):
+        texto = json.dumps({"tipo": tipo, "version": VERSION_MODELO, "campos": campos},
+                           sort_keys=True, default=lambda o: np.asarray(o).tolist())
+        return hashlib.sha256(texto.encode()).hexdigest()
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, f"{clave}.npz")
+
+    def cargar(self, clave):
+        ruta = self._ruta(clave)
+        try:
+            with np.load(ruta) as datos:
+                resultado = {k: datos[k] for k in datos.files}
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+        try:
+            os.utime(ruta)
+        except FileNotFoundError:
+            pass
+        return resultado
+
+    def guardar(self, clave, datos):
+        ruta = self._ruta(clave)
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, "wb") as f:
+            np.savez_compressed(f, **datos)
+        os.replace(temporal, ruta)
+        self._podar()
+
+    def _podar(self):
+        archivos = []
+        for nombre in os.listdir(self.directorio):
+            if not nombre.endswith(".npz"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directorio, nombre))
+            except FileNotFoundError:
+                continue
+            archivos.append((st.st_mtime, st.st_size, nombre))
+        total = sum(a[1] for a in archivos)
+        for _, tamano, nombre in sorted(archivos):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directorio, nombre))
+            except FileNotFoundError:
+                pass
+            total -= tamano
+
+class Levantamiento:
+    # Levantamiento del pozo por estaciones (profundidad medida desde el collar,
+    # inclinación y opcionalmente el diámetro de la sección). Los segmentos van
+    # de estación a estación con el ángulo medio de sus extremos; antes de la
+    # primera y después de la última se mantiene el ángulo de la estación.
+    # El diámetro de una estación rige hasta la siguiente.
+    def __init__(self, profundidad_m, angulo_deg, diametro=None):
+        self.profundidad = np.asarray(profundidad_m, dtype=float)
+        angulo = np.asarray(angulo_deg, dtype=float)
+        if self.profundidad.ndim != 1 or self.profundidad.shape != angulo.shape or not self.profundidad.size:
+            raise ValueError("El levantamiento necesita listas de profundidad y ángulo del mismo largo.")
+        if np.any(np.diff(self.profundidad) <= 0):
+            raise ValueError("Las profundidades del levantamiento deben ser estrictamente crecientes.")
+
+        # Segmento i = [limites[i], limites[i + 1]); el primero y el último sin cota
+        self.limites = np.concatenate(([-np.inf], self.profundidad, [np.inf]))
+        self.angulo = np.concatenate((angulo[:1], 0.5 * (angulo[:-1] + angulo[1:]), angulo[-1:]))
+        self.d_b = None
+        if diametro is not None:
+            d_b = np.array([DIAMETROS[d]["d_b"] if isinstance(d, str) else float(d) for d in diametro])
+            if d_b.shape != angulo.shape:
+                raise ValueError("La columna de diámetros del levantamiento no coincide con las estaciones.")
+            self.d_b = np.concatenate((d_b[:1], d_b))
+        self._limites = self.limites.tolist()
+        self._i = len(self.angulo) - 1
+
+    @classmethod
+    def desde_config(cls, spec):
+        # Diccionario de columnas o ruta a un CSV con encabezado
+        # profundidad_m,angulo_deg[,diametro]
+        if isinstance(spec, str):
+            tabla = np.genfromtxt(spec, delimiter=",", names=True, dtype=None, encoding="utf-8")
+            spec = {nombre: np.atleast_1d(tabla[nombre]).tolist() for nombre in tabla.dtype.names}
+        return cls(spec["profundidad_m"], spec["angulo_deg"], spec.get("diametro"))
+
+    def __len__(self):
+        return len(self.angulo)
+
+    def segmento(self, x):
+        # Puntero al último segmento usado: O(1) al avanzar de a un segmento,
+        # bisección O(log n) si el salto es mayor
+        i = self._i
+        lim = self._limites
+        if lim[i] <= x < lim[i + 1]:
+            return i
+        if i > 0 and lim[i - 1] <= x < lim[i]:
+            i -= 1
+        elif i + 2 < len(lim) and lim[i + 1] <= x < lim[i + 2]:
+            i += 1
+        else:
+            i = min(max(bisect.bisect_right(lim, x) - 1, 0), len(lim) - 2)
+        self._i = i
+        return i
+
+    def segmentos(self, x):
+        return np.searchsorted(self.limites, x, side="right") - 1
+
+    def parametros(self, p):
+        # Un registro PARAMETROS_LOTE por segmento a partir del caso p
+        q = np.repeat(np.atleast_1d(p)[:1], len(self))
+        q["angulo_deg"] = self.angulo
+        if self.d_b is not None:
+            q["d_b"] = self.d_b
+        return q
+
+    def campos(self):
+        return {"profundidad": self.profundidad, "angulo": self.angulo, "d_b": self.d_b}
+
+# Reología: tasa de corte nominal en la pared G = 4 |vrel| / (r1 (1 - (r1/r2)^2)),
+# la de la fórmula newtoniana (tau = mu G). Todas las tablas de fluidos usan la
+# misma grilla logarítmica, así el índice de una tasa se obtiene sin búsqueda.
+CORTE_MIN, CORTE_MAX, CORTE_PUNTOS = 1e-3, 1e6, 1024
+_LOG_CORTE_MIN = math.log(CORTE_MIN)
+_INV_PASO_CORTE = (CORTE_PUNTOS - 1) / (math.log(CORTE_MAX) - _LOG_CORTE_MIN)
+GRILLA_CORTE = np.exp(_LOG_CORTE_MIN + np.arange(CORTE_PUNTOS) / _INV_PASO_CORTE)
+
+def _interpolar_corte(log_tau, cedencia, gamma, fila=0, derivada=True):
+    # tau_w(G) y dtau_w/dG desde tablas (k, CORTE_PUNTOS) de log tau_w: lineal en
+    # log-log (exacta para newtoniano y ley de potencia, extrapola sobre CORTE_MAX
+    # con la última pendiente) y bajo CORTE_MIN una rampa desde tau_y en G = 0.
+    # fila: tabla de cada elemento (una por fluido); sin derivada dtau es None
+    gamma = np.asarray(gamma, dtype=float)
+    g = np.maximum(gamma, CORTE_MIN)
+    u = (np.log(g) - _LOG_CORTE_MIN) * _INV_PASO_CORTE
+    i = np.minimum(u.astype(np.intp), CORTE_PUNTOS - 2)
+    l0 = log_tau[fila, i]
+    pendiente = log_tau[fila, i + 1] - l0
+    tau = np.exp(l0 + (u - i) * pendiente)
+    dtau = tau * pendiente * _INV_PASO_CORTE / g if derivada else None
+    bajo = gamma < CORTE_MIN
+    if bajo.any():
+        ty = cedencia[fila]
+        rampa = (np.exp(log_tau[fila, 0]) - ty) / CORTE_MIN
+        tau = np.where(bajo, ty + rampa * gamma, tau)
+        if derivada:
+            dtau = np.where(bajo, rampa, dtau)
+    return tau, dtau
+
+_reologias = collections.OrderedDict()
+MAX_REOLOGIAS = 64
+
+class Reologia:
+    # Fluido de Herschel–Bulkley tau = tau_y + K gamma^n: newtoniano (tau_y = 0,
+    # n = 1), Bingham (n = 1), ley de potencia (tau_y = 0) o general. El esfuerzo
+    # en la pared para cada G de GRILLA_CORTE se obtiene una sola vez, al crear
+    # el fluido, invirtiendo la relación de flujo en ranura (anular angosto)
+    #     G = 3 / tau_w^2 * integral de tau_y a tau_w de tau ((tau - tau_y) / K)^(1/n) dtau
+    # por bisección vectorizada; integrar solo interpola en esa tabla.
+    MODELOS = {
+        "newtoniano": ("viscosidad_pa_s",),
+        "bingham": ("cedencia_pa", "viscosidad_plastica_pa_s"),
+        "potencia": ("consistencia_pa_sn", "indice_flujo"),
+        "herschel_bulkley": ("cedencia_pa", "consistencia_pa_sn", "indice_flujo"),
+    }
+
+    def __init__(self, cedencia_pa=0.0, consistencia_pa_sn=1e-3, indice_flujo=1.0, modelo="herschel_bulkley"):
+        if modelo not in self.MODELOS:
+            raise ValueError(f"Modelo de reología desconocido: {modelo} (use {', '.join(self.MODELOS)}).")
+        if cedencia_pa < 0 or consistencia_pa_sn <= 0 or indice_flujo <= 0:
+            raise ValueError("La reología necesita cedencia >= 0, consistencia > 0 e índice de flujo > 0.")
+        self.modelo = modelo
+        self.cedencia = float(cedencia_pa)
+        self.K = float(consistencia_pa_sn)
+        self.n = float(indice_flujo)
+        self.clave = (modelo, self.cedencia, self.K, self.n)
+
+        # G(s) con s = tau_w - tau_y, creciente; cotas de s por las de ranura con ley de potencia
+        m = 1.0 / self.n
+        ty, K = self.cedencia, self.K
+        G = GRILLA_CORTE
+
+        def tasa(s):
+            return 3.0 * K**-m * (s**(m + 2) / (m + 2) + ty * s**(m + 1) / (m + 1)) / (s + ty)**2
+
+        lo = K * ((m + 2) * G / 3.0)**self.n
+        hi = K * ((m + 2) * 4.0 * G / 3.0)**self.n + (4.0 * (m + 1) * ty * G * K**m / 3.0)**(1.0 / (m + 1))
+        for _ in range(100):
+            medio = np.sqrt(lo * hi)
+            arriba = tasa(medio) >= G
+            hi = np.where(arriba, medio, hi)
+            lo = np.where(arriba, lo, medio)
+        self.log_tau = np.log(ty + np.sqrt(lo * hi))[None, :]
+        self._lista = self.log_tau[0].tolist()
+        self._cedencia = np.array([ty])
+
+    @classmethod
+    def desde_config(cls, spec):
+        # {"modelo": ..., parámetros de MODELOS[modelo]}
+        modelo = spec.get("modelo")
+        if modelo not in cls.MODELOS:
+            raise ValueError(f"Modelo de reología desconocido: {modelo} (use {', '.join(cls.MODELOS)}).")
+        faltan = [campo for campo in cls.MODELOS[modelo] if campo not in spec]
+        if faltan:
+            raise ValueError(f"La reología {modelo} necesita {', '.join(faltan)}.")
+        if modelo == "newtoniano":
+            clave = (0.0, spec["viscosidad_pa_s"], 1.0, modelo)
+        elif modelo == "bingham":
+            clave = (spec["cedencia_pa"], spec["viscosidad_plastica_pa_s"], 1.0, modelo)
+        else:
+            clave = (spec.get("cedencia_pa", 0.0), spec["consistencia_pa_sn"], spec["indice_flujo"], modelo)
+        # La tabla cuesta unos ms: los fluidos repetidos (escenarios en flujo) se
+        # comparten desde un LRU, como los NucleoFisico
+        reologia = _reologias.get(clave)
+        if reologia is None:
+            reologia = _reologias[clave] = cls(*clave)
+            if len(_reologias) > MAX_REOLOGIAS:
+                _reologias.popitem(last=False)
+        else:
+            _reologias.move_to_end(clave)
+        return reologia
+
+    def campos(self):
+        return dict(zip(("modelo", "cedencia", "K", "n"), self.clave))
+
+    def descripcion(self):
+        if self.modelo == "newtoniano":
+            return f"Newtoniano {self.K:g} Pa·s"
+        if self.modelo == "bingham":
+            return f"Bingham \u03C4y {self.cedencia:g} Pa, \u03BCp {self.K:g} Pa·s"
+        texto = f"K {self.K:g} Pa·s^n, n {self.n:g}"
+        if self.modelo == "potencia":
+            return f"Ley de potencia {texto}"
+        return f"Herschel–Bulkley \u03C4y {self.cedencia:g} Pa, {texto}"
+
+    def esfuerzo(self, gamma):
+        return _interpolar_corte(self.log_tau, self._cedencia, gamma, derivada=False)[0]
+
+    def pendiente(self, gamma):
+        return _interpolar_corte(self.log_tau, self._cedencia, gamma)[1]
+
+    def esfuerzo_escalar(self, gamma):
+        # esfuerzo() para un solo float, sin arreglos (paso a paso de SimuladorTestigo)
+        if gamma < CORTE_MIN:
+            return self.cedencia + (math.exp(self._lista[0]) - self.cedencia) * gamma / CORTE_MIN
+        u = (math.log(gamma) - _LOG_CORTE_MIN) * _INV_PASO_CORTE
+        i = min(int(u), CORTE_PUNTOS - 2)
+        l0 = self._lista[i]
+        return math.exp(l0 + (u - i) * (self._lista[i + 1] - l0))
+
+    def aparente(self, gamma):
+        # Viscosidad aparente tau_w / G (Pa·s)
+        gamma = np.asarray(gamma, dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(gamma > 0, self.esfuerzo(gamma) / gamma, np.inf)
+
+    def velocidad_terminal(self, vf, escala, Alat, kd, Fg):
+        # Velocidad de descenso estable: Fg + Alat tau_w(escala w) + kd w^2 = 0 con
+        # w = vf - v > vf (solo para casos que descienden: a(0) < 0)
+        fuerza = lambda w: Fg + Alat * self.esfuerzo(escala * w) + kd * w**2
+        lo = np.abs(vf) + 0.0
+        hi = lo + np.sqrt(-Fg / kd)
+        for _ in range(100):
+            medio = 0.5 * (lo + hi)
+            arriba = fuerza(medio) >= 0.0
+            hi = np.where(arriba, medio, hi)
+            lo = np.where(arriba, lo, medio)
+        return vf - 0.5 * (lo + hi)
+
+class NucleoFisico:
+    # Términos que dependen solo de la geometría, las densidades y Cd (una
+    # configuración de diámetro), compartidos por la simulación y las tres
+    # curvas límite. Las evaluaciones por ángulo, caudal y viscosidad (los
+    # términos de aceleracion y cada curva de las grillas límite) quedan en un
+    # LRU acotado: las repetidas entre cuadros, entradas del mismo diámetro y
+    # movimientos del explorador se calculan una vez, y las curvas que faltan
+    # de una grilla se evalúan juntas, vectorizadas.
+    def __init__(self, d_t, d_b, L_testigo, rho_c, rho_f, Cd=0.8, g=9.81, max_cache=4096):
+        self.r1 = d_t / 2
+        self.r2 = d_b / 2
+        self.Af = np.pi * self.r1**2
+        self.Aa = np.pi * (self.r2**2 - self.r1**2)
+        self.Alat = 2 * np.pi * self.r1 * L_testigo
+        self.V = self.Af * L_testigo
+        self.m = rho_c * self.V
+        self.rho_c, self.rho_f, self.Cd, self.g = rho_c, rho_f, Cd, g
+        self.den_corte = self.r1 * (1 - (self.r1 / self.r2)**2)
+        self.factor_corte = 4 * self.Alat / self.den_corte      # tau * Alat = factor * mu * v_f
+        self.escala_corte = 4 / self.den_corte                   # G = escala * |vrel| (ver Reologia)
+        self.kd = 0.5 * rho_f * Cd * self.Af
+        self.peso = (rho_c - rho_f) * self.V * g                 # Peso efectivo a 90°
+        self.max_cache = max_cache
+        self.cache = collections.OrderedDict()
+        self.contadores = {"aciertos": 0, "evaluados": 0}
+
+    def _memo(self, tipo, calcular, filas, columnas=None):
+        # Una entrada por fila: la curva de un valor de ángulo, caudal o
+        # viscosidad sobre el eje columnas (o un solo valor sin columnas).
+        # calcular recibe las filas que faltan y las evalúa juntas.
+        filas = np.asarray(filas, dtype=float)
+        forma = filas.shape
+        filas = filas.ravel()
+        if columnas is not None:
+            columnas = np.asarray(columnas, dtype=float).ravel()
+        if not len(filas) or len(filas) > self.max_cache:
+            # Más filas que el LRU lo vaciarían sin reutilizarse
+            self.contadores["evaluados"] += len(filas)
+            salida = calcular(filas) if columnas is None else calcular(filas[:, None], columnas[None, :])
+            return salida.reshape(forma + salida.shape[1:])
+
+        firma = None if columnas is None else columnas.tobytes()
+        claves = [(tipo, fila, firma) for fila in filas.tolist()]
+        valores = [self.cache.get(clave) for clave in claves]
+        faltan = [i for i, valor in enumerate(valores) if valor is None]
+        for i, clave in enumerate(claves):
+            if valores[i] is not None:
+                self.cache.move_to_end(clave)
+        self.contadores["aciertos"] += len(claves) - len(faltan)
+        if faltan:
+            self.contadores["evaluados"] += len(faltan)
+            nuevas = calcular(filas[faltan]) if columnas is None else calcular(filas[faltan][:, None], columnas[None, :])
+            for i, fila in zip(faltan, nuevas):
+                valores[i] = self.cache[claves[i]] = fila
+            while len(self.cache) > self.max_cache:
+                self.cache.popitem(last=False)
+        salida = np.array(valores)
+        return salida.reshape(forma + salida.shape[1:])
+
+    def terminos(self, angulo_deg, Q, mu):
+        # (v_f, 4 mu, Fb, Fg) de SimuladorTestigo.aceleracion, en el mismo orden de
+        # operaciones que la fórmula completa
+        clave = ("terminos", angulo_deg, Q, mu)
+        valor = self.cache.get(clave)
+        if valor is None:
+            sin_theta = np.sin(float(np.radians(angulo_deg)))
+            valor = self.cache[clave] = (Q / self.Aa, 4.0 * mu,
+                                         float(self.rho_f * self.V * self.g * sin_theta),
+                                         float(-self.rho_c * self.V * self.g * sin_theta))
+            if len(self.cache) > self.max_cache:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(clave)
+        return valor
+
+    def angulo_critico(self, marsh, caudal_lpm):
+        # Ángulo (°) donde arrastre + corte igualan al peso efectivo
+        def calcular(marsh, caudal_lpm):
+            mu = 1.1 * (marsh - 25) / 1000
+            v_f = (caudal_lpm / 60000) / self.Aa
+            Fv = self.factor_corte * mu * v_f
+            Fd = self.kd * v_f**2
+            sin_theta = np.clip((Fv + Fd) / self.peso, -1.0, 1.0)
+            return np.maximum(np.degrees(np.arcsin(sin_theta)), 0.0)
+        return self._memo("angulo_critico", calcular, marsh, caudal_lpm)
+
+    def caudal_critico_90(self, marsh):
+        # Caudal (L/min) en que el ángulo crítico llega a 90°: kd*vf^2 + kv*vf = Fg
+        def calcular(marsh):
+            kv = self.factor_corte * (1.1 * (marsh - 25) / 1000)
+            v_f = 2 * self.peso / (kv + np.sqrt(kv**2 + 4 * self.kd * self.peso))
+            return v_f * self.Aa * 60000
+        return self._memo("caudal_90", calcular, marsh)
+
+    def viscosidad_critica(self, angulo_deg, caudal_lpm):
+        # Viscosidad Marsh crítica
+        def calcular(angulo_deg, caudal_lpm):
+            v_f = (caudal_lpm / 60000) / self.Aa
+            Fd = self.kd * v_f**2
+            Fg = self.peso * np.sin(np.radians(angulo_deg))
+            den = self.factor_corte * v_f
+            with np.errstate(divide="ignore", invalid="ignore"):
+                mu_Pa_s = np.where(den != 0, (Fg - Fd) / den, np.nan)
+            return np.maximum(mu_Pa_s, 0.0) * 1000 / 1.1 + 25
+        return self._memo("viscosidad_critica", calcular, angulo_deg, caudal_lpm)
+
+    # Con Reologia la familia por viscosidad Marsh se reduce a la curva del
+    # fluido: una sola fila, identificada por el fluido en el tipo
+
+    def _corte_fluido(self, reologia, v_f):
+        return self.Alat * reologia.esfuerzo(self.escala_corte * np.abs(v_f))
+
+    def angulo_critico_fluido(self, reologia, caudal_lpm):
+        def calcular(_, caudal_lpm):
+            v_f = (caudal_lpm / 60000) / self.Aa
+            sin_theta = np.clip((self._corte_fluido(reologia, v_f) + self.kd * v_f**2) / self.peso, -1.0, 1.0)
+            return np.maximum(np.degrees(np.arcsin(sin_theta)), 0.0)
+        return self._memo(("angulo_critico",) + reologia.clave, calcular, [0.0], caudal_lpm)[0]
+
+    def caudal_critico_90_fluido(self, reologia):
+        # Alat tau_w(G(vf)) + kd vf^2 = peso por bisección; 0 si la cedencia sola sostiene a 90°
+        def calcular(_):
+            exceso = lambda v_f: self._corte_fluido(reologia, v_f) + self.kd * v_f**2 - self.peso
+            lo, hi = np.zeros(1), np.full(1, np.sqrt(self.peso / self.kd))
+            for _ in range(100):
+                medio = 0.5 * (lo + hi)
+                arriba = exceso(medio) >= 0.0
+                hi = np.where(arriba, medio, hi)
+                lo = np.where(arriba, lo, medio)
+            v_f = np.where(exceso(np.zeros(1)) >= 0.0, 0.0, 0.5 * (lo + hi))
+            return v_f * self.Aa * 60000
+        return self._memo(("caudal_90",) + reologia.clave, calcular, 0.0)
+
+    def viscosidad_aparente(self, reologia, caudal_lpm):
+        # Viscosidad aparente del fluido en la pared como Marsh equivalente: se
+        # compara con la viscosidad crítica (newtoniana) del mismo caudal
+        def calcular(_, caudal_lpm):
+            v_f = (caudal_lpm / 60000) / self.Aa
+            return reologia.aparente(self.escala_corte * v_f) * 1000 / 1.1 + 25
+        return self._memo(("viscosidad_aparente",) + reologia.clave, calcular, [0.0], caudal_lpm)[0]
+
+_nucleos = collections.OrderedDict()
+MAX_NUCLEOS = 64
+
+def nucleo_fisico(d_t, d_b, L_testigo, rho_c, rho_f, Cd=0.8, g=9.81):
+    # Un NucleoFisico por configuración, también en LRU (el explorador crea uno
+    # por cada combinación de densidades)
+    clave = (d_t, d_b, L_testigo, rho_c, rho_f, Cd, g)
+    nucleo = _nucleos.get(clave)
+    if nucleo is None:
+        nucleo = _nucleos[clave] = NucleoFisico(*clave)
+        if len(_nucleos) > MAX_NUCLEOS:
+            _nucleos.popitem(last=False)
+    else:
+        _nucleos.move_to_end(clave)
+    return nucleo
+
+class Trayectoria:
+    # Resultado de una simulación en un solo arreglo (n, 4) de columnas t, x, v, a;
+    # T, X, V y A son vistas de sus columnas y se desempaqueta como T, X, V, A.
+    # Las series derivadas se calculan la primera vez que se piden y quedan
+    # guardadas; los cortes son vistas y guardar escribe el arreglo sin copiarlo.
+    __slots__ = ("datos", "p", "levantamiento", "g", "reologia", "_derivadas")
+
+    def __init__(self, datos, p, levantamiento=None, g=9.81, reologia=None):
+        self.datos = datos
+        self.p = np.atleast_1d(p)[:1]       # registro PARAMETROS_LOTE del caso
+        self.levantamiento = levantamiento
+        self.g = g
+        self.reologia = reologia            # Reologia no newtoniana o None (viscosidad Marsh)
+        self._derivadas = {}
+
+    @classmethod
+    def desde_registros(cls, registros, p, levantamiento=None, g=9.81, dtype=np.float64, reologia=None):
+        # registros: iterable de (t, x, v, a), p. ej. SimuladorTestigo.pasos()
+        datos = np.fromiter(registros, dtype=np.dtype((dtype, 4)))
+        return cls(datos, p, levantamiento, g, reologia)
+
+    @classmethod
+    def cargar(cls, ruta, p, levantamiento=None, g=9.81, mmap_mode="r", reologia=None):
+        # Lee un .npy (n, 4) como el de guardar o guardar_trayectoria, mapeado en memoria
+        return cls(np.load(ruta, mmap_mode=mmap_mode), p, levantamiento, g, reologia)
+
+    def guardar(self, ruta):
+        np.save(ruta, self.datos)
+
+    T = property(lambda self: self.datos[:, 0])
+    X = property(lambda self: self.datos[:, 1])
+    V = property(lambda self: self.datos[:, 2])
+    A = property(lambda self: self.datos[:, 3])
+
+    def __iter__(self):
+        return iter((self.T, self.X, self.V, self.A))
+
+    def __len__(self):
+        return len(self.datos)
+
+    def __getitem__(self, corte):
+        # Con un slice el resultado comparte los datos (las derivadas se recalculan)
+        if not isinstance(corte, slice):
+            raise TypeError("Trayectoria solo admite cortes (slice) de registros.")
+        return Trayectoria(self.datos[corte], self.p, self.levantamiento, self.g, self.reologia)
+
+    # Resumen, con el criterio de graficar_simulacion: el penúltimo registro es el estado real
+    tiempo_final = property(lambda self: float(self.T[-2]))
+    velocidad_final = property(lambda self: float(self.V[-2]))
+    fuerza_impacto = property(lambda self: float(_fuerza_impacto_lote(self.p, self.g, [self.reologia])[0]))
+
+    def _derivada(self, nombre, calcular):
+        if nombre not in self._derivadas:
+            self._derivadas[nombre] = calcular()
+        return self._derivadas[nombre]
+
+    def _registros(self):
+        # Parámetros en cada registro: con levantamiento, los del segmento de x
+        if self.levantamiento is None:
+            return self.p
+        return self._derivada("registros", lambda: self.levantamiento.parametros(self.p)[self.levantamiento.segmentos(self.X)])
+
+    def _coeficientes(self):
+        return self._derivada("coeficientes", lambda: _coeficientes_lote(self._registros(), self.g))
+
+    @property
+    def velocidad_relativa(self):
+        return self._derivada("velocidad_relativa", lambda: self.V - self._coeficientes()[1])
+
+    @property
+    def fuerza_peso(self):
+        # Peso menos flotación a lo largo del pozo (negativa: hacia abajo)
+        return self._derivada("fuerza_peso", lambda: np.broadcast_to(self._coeficientes()[4], self.T.shape))
+
+    def _tasa_corte(self):
+        # Tasa de corte nominal en la pared en cada registro (solo con reologia)
+        return self._derivada("tasa_corte", lambda: _escala_corte_lote(self._registros()) * np.abs(self.velocidad_relativa))
+
+    @property
+    def fuerza_corte(self):
+        def calcular():
+            if self.reologia is None:
+                return -self._coeficientes()[2] * self.velocidad_relativa
+            q = self._registros()
+            Alat = np.pi * q["d_t"] * q["longitud_testigo_m"]
+            return -np.sign(self.velocidad_relativa) * Alat * self.reologia.esfuerzo(self._tasa_corte())
+        return self._derivada("fuerza_corte", calcular)
+
+    @property
+    def fuerza_arrastre(self):
+        vrel = self.velocidad_relativa
+        return self._derivada("fuerza_arrastre", lambda: -self._coeficientes()[3] * vrel * np.abs(vrel))
+
+    @property
+    def fuerza_neta(self):
+        return self._derivada("fuerza_neta", lambda: self._coeficientes()[0] * self.A)
+
+    @property
+    def energia_cinetica(self):
+        return self._derivada("energia_cinetica", lambda: 0.5 * self._coeficientes()[0] * self.V**2)
+
+    @property
+    def reynolds(self):
+        # Re del flujo relativo en el anular, con diámetro hidráulico d_b - d_t
+        def calcular():
+            q = self._registros()
+            if self.reologia is None:
+                mu = 1.1 * (q["viscosidad_marsh_seg"] - 25) / 1000
+            else:
+                mu = self.reologia.aparente(self._tasa_corte())    # viscosidad aparente en la pared
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return q["densidad_fluido_kgm3"] * np.abs(self.velocidad_relativa) * (q["d_b"] - q["d_t"]) / mu
+        return self._derivada("reynolds", calcular)
 
 class SimuladorTestigo:
     def __init__(self, config, diametro):
-        self.diametros = {
-            "NQ": {"d_t": 0.045, "d_b": 0.0476},
-            "HQ": {"d_t": 0.0611, "d_b": 0.0635},
-            "PQ": {"d_t": 0.083, "d_b": 0.085}
-        }
+        self.diametros = DIAMETROS
         self.diametro = diametro
-        self.d_t = self.diametros[diametro]["d_t"]
-        self.d_b = self.diametros[diametro]["d_b"]
+        tipo = config.get("diametro", diametro)   # permite varias entradas del mismo diámetro
+        self.d_t = self.diametros[tipo]["d_t"]
+        self.d_b = self.diametros[tipo]["d_b"]
         self.L_testigo = config["longitud_testigo_m"]
         self.L_pozo = config["longitud_pozo_m"]
         self.Q = config["caudal_lpm"] / 60000
         self.mu = 1.1 * (config["viscosidad_marsh_seg"] - 25) / 1000
+        # Fluido no newtoniano opcional; "newtoniano" solo reemplaza la viscosidad Marsh
+        self.reologia = None
+        if "reologia" in config:
+            self.reologia = Reologia.desde_config(config["reologia"])
+            if self.reologia.modelo == "newtoniano":
+                self.mu = self.reologia.K
+                self.reologia = None
         self.angulo_deg = config["angulo_deg"]
         self.theta_rad = float(np.radians(self.angulo_deg))
         self.rango_viscosidad = config["rango_viscosidad"]
@@ -69,6 +754,8 @@ class SimuladorTestigo:
         self.Q_min = 25                                                                # Caudal mínimo litros/minuto
         self.max_caudal_bombeo = self.Q_max = config.get("caudal_max_bombeo_lpm", 140) # Caudal máximo de bombeo litros/minuto
         self.max_tiempo_simulacion = config.get("tiempo_max_simulacion_seg", 1000)     # Máximo tiempo de simulación en seg
+        self.integrador = config.get("integrador", "rk4")                              # "rk4" (paso fijo), "rk45" (adaptativo) o "exp" (rígido)
+        self.tolerancia = config.get("tolerancia", 1e-6)                               # Tolerancia del integrador adaptativo
 
         self.r1 = self.d_t / 2
         self.r2 = self.d_b / 2
@@ -77,42 +764,134 @@ class SimuladorTestigo:
         self.Alat = 2 * np.pi * self.r1 * self.L_testigo
         self.V = self.Af * self.L_testigo
         self.m = self.rho_c * self.V
-
-        self.figsize = self._calcular_tamano_figura()
+        self.nucleo = nucleo_fisico(self.d_t, self.d_b, self.L_testigo, self.rho_c, self.rho_f, self.Cd, self.g)
+        self._terminos = self.nucleo.terminos(self.angulo_deg, self.Q, self.mu)
+        self._tramo_reologia = (self._terminos[0], self.nucleo.escala_corte, self._terminos[2] + self._terminos[3])
+
+        self._figsize = None
+        self.salida = None                                                             # Directorio de salida (sin pantalla)
+        self.formato = "png"                                                           # Formato de archivo: png, pdf o svg
+        self.cache = None                                                              # CacheResultados opcional
+        self.solo_graficar = False                                                     # Solo redibujar desde la caché
+        self.diezmar = True                                                            # Reducir las series al ancho en píxeles del eje
+        self.ejes_mapa = ("caudal_lpm", "viscosidad_marsh_seg")                        # Ejes de graficar_mapa_limite
+        self.criterio_mapa = "reposo"                                                  # "reposo" o "llegada" (ver CRITERIOS_MAPA)
+        self.tolerancia_mapa = 1e-3                                                    # Lado de la celda más fina / rango del eje
+
+        # Pozo curvo: coeficientes (vf, kv, Fg) precalculados por segmento del levantamiento
+        self.levantamiento = None
+        if "levantamiento" in config:
+            self.levantamiento = Levantamiento.desde_config(config["levantamiento"])
+            if self.levantamiento.d_b is not None and np.any(self.levantamiento.d_b <= self.d_t):
+                raise ValueError(f"El levantamiento de {diametro} tiene secciones más angostas que el testigo.")
+            q = self.levantamiento.parametros(self.parametros())
+            _, vf, kv, kd, Fg = _coeficientes_lote(q, self.g)
+            self._coef_segmentos = list(zip(vf.tolist(), kv.tolist(), Fg.tolist()))
+            self._kd = float(kd[0])
+            if self.reologia is not None:
+                self._coef_reologia = list(zip(vf.tolist(), _escala_corte_lote(q).tolist(), Fg.tolist()))
 
     def v_fluido(self):
         return self.Q / self.Aa
 
-    def aceleracion(self, v):
-        vrel = v - self.v_fluido()
-        tau = 4.0 * self.mu * abs(vrel) / (self.r1 * (1.0 - (self.r1 / self.r2)**2))
-        Fv = -np.sign(vrel) * tau * self.Alat
-        Fd = -0.5 * self.rho_f * self.Cd * self.Af * vrel * abs(vrel)
-        Fb = self.rho_f * self.V * self.g * np.sin(self.theta_rad)
-        Fg = -self.rho_c * self.V * self.g * np.sin(self.theta_rad)
+    def aceleracion(self, v, x=None):
+        # x (profundidad medida) solo importa con levantamiento
+        if self.reologia is not None:
+            return self._aceleracion_reologia(v, x)
+        if self.levantamiento is not None and x is not None:
+            vf, kv, Fg = self._coef_segmentos[self.levantamiento.segmento(x)]
+            vrel = v - vf
+            return (Fg - kv * vrel - self._kd * vrel * abs(vrel)) / self.m
+        vf, mu4, Fb, Fg = self._terminos
+        vrel = v - vf
+        tau = mu4 * abs(vrel) / self.nucleo.den_corte
+        Fv = -math.copysign(tau, vrel) * self.Alat
+        Fd = -self.nucleo.kd * vrel * abs(vrel)
         return (Fb + Fv + Fd + Fg) / self.m
 
-    def simular(self):
+    def _aceleracion_reologia(self, v, x=None):
+        # (vf, escala de G, peso neto) del tramo de x
+        if self.levantamiento is not None and x is not None:
+            vf, escala, Fg = self._coef_reologia[self.levantamiento.segmento(x)]
+        else:
+            vf, escala, Fg = self._tramo_reologia
+        vrel = v - vf
+        if vrel == 0.0:
+            # En reposo relativo la cedencia sostiene hasta tau_y Alat
+            return math.copysign(max(abs(Fg) - self.reologia.cedencia * self.Alat, 0.0), Fg) / self.m
+        Fv = -math.copysign(self.Alat * self.reologia.esfuerzo_escalar(escala * abs(vrel)), vrel)
+        Fd = -self.nucleo.kd * vrel * abs(vrel)
+        return (Fg + Fv + Fd) / self.m
+
+    def jacobiano(self, v, x=None):
+        # da/dv = -(kv + 2 kd |vrel|) / m; con reología kv = Alat escala dtau_w/dG
+        if self.reologia is not None:
+            if self.levantamiento is not None and x is not None:
+                vf, escala, _ = self._coef_reologia[self.levantamiento.segmento(x)]
+            else:
+                vf, escala, _ = self._tramo_reologia
+            vrel = abs(v - vf)
+            return -(self.Alat * escala * float(self.reologia.pendiente(escala * vrel)) + 2.0 * self.nucleo.kd * vrel) / self.m
+        if self.levantamiento is not None and x is not None:
+            vf, kv, _ = self._coef_segmentos[self.levantamiento.segmento(x)]
+            return -(kv + 2.0 * self._kd * abs(v - vf)) / self.m
+        kv = self.nucleo.factor_corte * self.mu
+        return -(kv + 2.0 * self.nucleo.kd * abs(v - self._terminos[0])) / self.m
+
+    def simular(self, dtype=np.float64):
+        # float32 reduce a la mitad la memoria de conjuntos grandes de trayectorias
+        return Trayectoria.desde_registros(self.pasos(), self.parametros(), self.levantamiento, self.g, dtype, self.reologia)
+
+    def rigidez(self):
+        # (mu dt, pasos de rk45 limitados por estabilidad) con mu = max |da/dv|
+        p = self.parametros()
+        if self.levantamiento is not None:
+            p = self.levantamiento.parametros(p)
+        mu, tiempo = _rigidez_lote(p, self.g, self.reologia)
+        return float(mu.max()) * 0.01, float(mu.max() * tiempo.max()) / RK45_ESTABILIDAD
+
+    def integrador_efectivo(self):
+        # rk4 y rk45 pasan al exponencial cuando la rigidez los vuelve inestables
+        # (rk4) o les impone muchos más pasos que la precisión (rk45)
+        if self.integrador not in ("rk4", "rk45"):
+            return self.integrador
+        mu_dt, pasos_estables = self.rigidez()
+        if (self.integrador == "rk4" and mu_dt > RIGIDEZ_RK4) or (self.integrador == "rk45" and pasos_estables > RIGIDEZ_RK45):
+            return "exp"
+        return self.integrador
+
+    def pasos(self):
+        # Iterador de los registros (t, x, v, a) de la trayectoria, uno a uno
+        integrador = self.integrador_efectivo()
+        if integrador == "rk45":
+            registros = self._pasos_rk45()
+        elif integrador == "rk4":
+            registros = self._pasos_rk4()
+        elif integrador == "exp":
+            registros = self._pasos_exp()
+        else:
+            raise ValueError(f"Integrador desconocido: {self.integrador}")
+        if _perfil is not None:
+            registros = _perfil.instrumentar(self, registros)
+        return registros
+
+    def _pasos_rk4(self):
         dt = 0.01
         t = 0.0
         x = self.L_pozo
         v = 0.0
-        T, X, V, A = [], [], [], []
 
         while x > 0.0 and t < self.max_tiempo_simulacion:
-            a = self.aceleracion(v)
-            T.append(t)
-            X.append(x)
-            V.append(v)
-            A.append(a)
+            a = self.aceleracion(v, x)
+            yield t, x, v, a
 
             k1v = a
             k1x = v
-            k2v = self.aceleracion(v + 0.5 * dt * k1v)
+            k2v = self.aceleracion(v + 0.5 * dt * k1v, x + 0.5 * dt * k1x)
             k2x = v + 0.5 * dt * k1v
-            k3v = self.aceleracion(v + 0.5 * dt * k2v)
+            k3v = self.aceleracion(v + 0.5 * dt * k2v, x + 0.5 * dt * k2x)
             k3x = v + 0.5 * dt * k2v
-            k4v = self.aceleracion(v + dt * k3v)
+            k4v = self.aceleracion(v + dt * k3v, x + dt * k3x)
             k4x = v + dt * k3v
 
             dv = (dt / 6.0) * (k1v + 2.0 * k2v + 2.0 * k3v + k4v)
@@ -128,20 +907,343 @@ class SimuladorTestigo:
             elif x <= 0:
                 x = 0
                 v = 0
-                a = self.aceleracion(v)
-                T.append(t)
-                X.append(x)
-                V.append(v)
-                A.append(a)
-
-        return T, X, V, A
+                a = self.aceleracion(v, x)
+                yield t, x, v, a
+
+    def _pasos_rk45(self):
+        # Dormand–Prince 5(4) con control de error y salida densa (Hermite cúbica)
+        # para ubicar exactamente la llegada a x = 0 y el tope x = L_pozo.
+        # El penúltimo registro es el estado real en el evento final y el último
+        # el estado fijado (v = 0), igual que en el RK4 de paso fijo.
+        # Con levantamiento cada paso usa un solo segmento (el que se recorre al
+        # salir de x) y se repite acortado si sale de él, para terminar justo
+        # en el quiebre: el integrando es suave dentro de cada paso.
+        c2, c3, c4, c5 = 1 / 5, 3 / 10, 4 / 5, 8 / 9
+        a21 = 1 / 5
+        a31, a32 = 3 / 40, 9 / 40
+        a41, a42, a43 = 44 / 45, -56 / 15, 32 / 9
+        a51, a52, a53, a54 = 19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729
+        a61, a62, a63, a64, a65 = 9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656
+        b1, b3, b4, b5, b6 = 35 / 384, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84
+        e1, e3, e4, e5, e6, e7 = 71 / 57600, -71 / 16695, 71 / 1920, -17253 / 339200, 22 / 525, -1 / 40
+
+        def paso(x, v, a, h, xm):
+            k1 = a if xm is None else self.aceleracion(v, xm)
+            k2 = self.aceleracion(v + h * a21 * k1, xm)
+            k3 = self.aceleracion(v + h * (a31 * k1 + a32 * k2), xm)
+            k4 = self.aceleracion(v + h * (a41 * k1 + a42 * k2 + a43 * k3), xm)
+            k5 = self.aceleracion(v + h * (a51 * k1 + a52 * k2 + a53 * k3 + a54 * k4), xm)
+            v6 = v + h * (a61 * k1 + a62 * k2 + a63 * k3 + a64 * k4 + a65 * k5)
+            k6 = self.aceleracion(v6, xm)
+            v_n = v + h * (b1 * k1 + b3 * k3 + b4 * k4 + b5 * k5 + b6 * k6)
+            k7 = self.aceleracion(v_n, xm)
+
+            # x' = v: las etapas de x son las velocidades intermedias
+            kx2 = v + h * a21 * k1
+            kx3 = v + h * (a31 * k1 + a32 * k2)
+            kx4 = v + h * (a41 * k1 + a42 * k2 + a43 * k3)
+            kx5 = v + h * (a51 * k1 + a52 * k2 + a53 * k3 + a54 * k4)
+            x_n = x + h * (b1 * v + b3 * kx3 + b4 * kx4 + b5 * kx5 + b6 * v6)
+
+            err_v = h * (e1 * k1 + e3 * k3 + e4 * k4 + e5 * k5 + e6 * k6 + e7 * k7)
+            err_x = h * (e1 * v + e3 * kx3 + e4 * kx4 + e5 * kx5 + e6 * v6 + e7 * v_n)
+            return x_n, v_n, k1, k7, err_x, err_v
+
+        return self._pasos_adaptativos(paso, 5)
+
+    def _pasos_exp(self):
+        # Rosenbrock exponencial 3(2) (exprb32): la parte lineal en v, con el
+        # jacobiano exacto J = -(kv + 2 kd |vrel|) / m, se integra con las
+        # funciones phi y el paso no queda limitado por la estabilidad. A
+        # velocidad terminal el error es nulo y el paso crece sin límite, así el
+        # costo no depende de la viscosidad. Mismo control, eventos y
+        # levantamiento que rk45.
+        def paso(x, v, a, h, xm):
+            # Sistema (x, v) con jacobiano [[0, 1], [0, J]]: la componente x de
+            # phi_k(hJ) aplicada a (v, a) es v / k! + h phi_{k+1}(hJ) a
+            k1 = a if xm is None else self.aceleracion(v, xm)
+            J = self.jacobiano(v, xm)
+            f1, f2, f3, f4 = _funciones_phi(h * J)
+            v2 = v + h * f1 * k1
+            x2 = x + h * v + h * h * f2 * k1
+            # Resto no lineal en la etapa: g(v2) = a(v2) - a(v) - J (v2 - v)
+            D = self.aceleracion(v2, xm) - k1 - J * (v2 - v)
+            err_v = 2 * h * f3 * D
+            err_x = 2 * h * h * f4 * D
+            v_n = v2 + err_v
+            return x2 + err_x, v_n, k1, self.aceleracion(v_n, xm), err_x, err_v
+
+        def denso(s, h, x0, x1, v0, v1, a0, a1, xm):
+            # Paso acortado desde el inicio: la Hermite cúbica no sigue el
+            # transitorio de escala 1/|J|, mucho menor que h
+            return paso(x0, v0, a0, s * h, xm)[:2]
+
+        return self._pasos_adaptativos(paso, 3, denso)
+
+    def _pasos_adaptativos(self, paso, orden, denso=None):
+        tol = self.tolerancia
+        t_max = self.max_tiempo_simulacion
+        L = self.L_pozo
+        lev = self.levantamiento
+        exponente = -1 / orden
+        t = 0.0
+        x = L
+        v = 0.0
+        a = self.aceleracion(v, x)
+        h = 0.01
+        xm = None
+        borde = None
+        yield t, x, v, a
+
+        def hermite(s, h_, y0, y1, d0, d1):
+            s2 = s * s
+            s3 = s2 * s
+            return ((2 * s3 - 3 * s2 + 1) * y0 + (s3 - 2 * s2 + s) * h_ * d0
+                    + (-2 * s3 + 3 * s2) * y1 + (s3 - s2) * h_ * d1)
+
+        if denso is None:
+            def denso(s, h_, x0, x1, v0, v1, a0, a1, xm_):
+                return hermite(s, h_, x0, x1, v0, v1), hermite(s, h_, v0, v1, a0, a1)
+
+        def cruce(nivel, h_, x0, x1, v0, v1, a0, a1, xm_):
+            # Fracción del paso donde x(t) = nivel, por bisección sobre la interpolante
+            lo, hi = 0.0, 1.0
+            for _ in range(60):
+                s = 0.5 * (lo + hi)
+                xs = denso(s, h_, x0, x1, v0, v1, a0, a1, xm_)[0]
+                if (xs - nivel) * (x0 - nivel) > 0:
+                    lo = s
+                else:
+                    hi = s
+            return hi
+
+        while x > 0.0 and t < t_max:
+            # Testigo sostenido en el tope: equilibrio hasta el tiempo máximo
+            if x >= L and v == 0.0 and a >= 0.0:
+                t = t_max
+                yield t, x, v, a
+                break
+
+            h = min(h, t_max - t)
+            if lev is not None:
+                baja = v < 0.0 or (v == 0.0 and a < 0.0)
+                xm = np.nextafter(x, -np.inf) if baja else x
+            x_n, v_n, k1, k7, err_x, err_v = paso(x, v, a, h, xm)
+
+            esc_v = tol + tol * max(abs(v), abs(v_n))
+            esc_x = tol + tol * max(abs(x), abs(x_n))
+            err = np.sqrt(0.5 * ((err_v / esc_v)**2 + (err_x / esc_x)**2))
+
+            if err > 1.0:
+                h *= max(0.2, 0.9 * err**exponente)
+                borde = None
+                continue
+
+            if borde is not None:
+                x_n = borde
+            elif lev is not None:
+                i = lev.segmento(xm)
+                desde, hasta = lev.limites[i], lev.limites[i + 1]
+                nivel = desde if x_n < desde else hasta if x_n >= hasta else None
+                if nivel is not None and 0.0 < nivel < L:
+                    if nivel == x:
+                        # Sale del quiebre y vuelve en el mismo paso: se acorta
+                        h *= 0.5
+                        continue
+                    borde = float(nivel)
+                    h *= cruce(borde, h, x, x_n, v, v_n, k1, k7, xm)
+                    continue
+
+            if x_n <= 0.0 or x_n > L:
+                nivel = 0.0 if x_n <= 0.0 else L
+                s = cruce(nivel, h, x, x_n, v, v_n, k1, k7, xm)
+                t_e = t + s * h
+                v_e = denso(s, h, x, x_n, v, v_n, k1, k7, xm)[1]
+                yield t_e, nivel, v_e, self.aceleracion(v_e, nivel)
+                t = t_e
+                x = nivel
+                v = 0.0
+                a = self.aceleracion(v, x)
+                if nivel == 0.0:
+                    break
+                continue
+
+            t += h
+            x = x_n
+            v = v_n
+            a = k7
+            yield t, x, v, a
+
+            if borde is not None:
+                borde = None
+                # Atrapado en un quiebre (empuje hacia el quiebre desde ambos lados):
+                # los rebotes se acortan sin fin, se sostiene hasta el tiempo máximo
+                abajo = self.aceleracion(0.0, np.nextafter(x, -np.inf))
+                arriba = self.aceleracion(0.0, x)
+                if abajo > 0.0 and arriba < 0.0 and abs(v) <= np.sqrt(tol):
+                    t = t_max
+                    v = 0.0
+                    a = 0.0
+                    yield t, x, v, a
+                    break
+
+            h *= min(5.0, 0.9 * err**exponente) if err > 0 else 5.0
+
+        yield t, x, v, a
+
+    def simular_bloques(self, tamano_bloque=65536, cada=1):
+        # Trayectoria en bloques (n, 4) de columnas t, x, v, a con memoria constante.
+        # Con cada > 1 se conserva uno de cada k registros y siempre el último.
+        bloque = np.empty((tamano_bloque, 4))
+        n = 0
+        ultimo = None
+        guardado = False
+        for i, registro in enumerate(self.pasos()):
+            ultimo = registro
+            guardado = i % cada == 0
+            if guardado:
+                bloque[n] = registro
+                n += 1
+                if n == tamano_bloque:
+                    yield bloque
+                    bloque = np.empty((tamano_bloque, 4))
+                    n = 0
+        if ultimo is not None and not guardado:
+            bloque[n] = ultimo
+            n += 1
+        if n:
+            yield bloque[:n]
+
+    def guardar_trayectoria(self, ruta, tamano_bloque=65536, cada=1):
+        # Escribe la trayectoria en un .npy a medida que se integra; la cabecera
+        # se reserva al inicio y se completa con el número final de filas.
+        filas = 0
+        with open(ruta, "wb") as f:
+            f.write(_cabecera_npy(0, 4))
+            for bloque in self.simular_bloques(tamano_bloque, cada):
+                f.write(np.ascontiguousarray(bloque, dtype="<f8").tobytes())
+                filas += len(bloque)
+            f.seek(0)
+            f.write(_cabecera_npy(filas, 4))
+        return filas
+
+    def parametros(self):
+        # Caso actual como registro PARAMETROS_LOTE (para las rutas vectorizadas)
+        p = np.zeros(1, dtype=PARAMETROS_LOTE)
+        p["d_t"] = self.d_t
+        p["d_b"] = self.d_b
+        p["longitud_testigo_m"] = self.L_testigo
+        p["longitud_pozo_m"] = self.L_pozo
+        p["caudal_lpm"] = self.Q * 60000
+        p["viscosidad_marsh_seg"] = self.mu * 1000 / 1.1 + 25
+        p["angulo_deg"] = self.angulo_deg
+        p["densidad_roca_kgm3"] = self.rho_c
+        p["densidad_fluido_kgm3"] = self.rho_f
+        p["tiempo_max_simulacion_seg"] = self.max_tiempo_simulacion
+        p["coef_arrastre"] = self.Cd
+        return p
+
+    def modo_analitico(self):
+        if self.levantamiento is not None:
+            raise ValueError("El modo analítico supone un ángulo constante; use el integrador con levantamiento.")
+        r = simular_analitico(self.parametros())
+        return float(r["tiempo"][0]), float(r["velocidad"][0]), float(r["fuerza"][0])
+
+    def sensibilidades(self):
+        # d(tiempo de llegada)/dp y d(velocidad final)/dp de CAMPOS_SENSIBILIDAD
+        if self.levantamiento is not None:
+            raise ValueError("Las sensibilidades suponen un ángulo constante.")
+        r = sensibilidades_lote(self.parametros())
+        return {campo: (float(r["dtiempo"][campo][0]), float(r["dvelocidad"][campo][0])) for campo in CAMPOS_SENSIBILIDAD}
+
+    # --- Caché de resultados ---
+
+    def _campos_fisicos(self):
+        campos = {"d_t": self.d_t, "d_b": self.d_b, "L_testigo": self.L_testigo,
+                  "rho_c": self.rho_c, "rho_f": self.rho_f, "Cd": self.Cd, "g": self.g}
+        if self.reologia is not None:    # sin reología las claves de caché no cambian
+            campos["reologia"] = self.reologia.campos()
+        return campos
+
+    def _cacheado(self, tipo, campos, calcular):
+        with _fase(tipo, self.diametro):
+            if self.cache is None:
+                return calcular()
+            campos = dict(self._campos_fisicos(), **campos)
+            clave = self.cache.clave(tipo, campos)
+            datos = self.cache.cargar(clave)
+            if datos is None:
+                if self.solo_graficar:
+                    raise LookupError(f"No hay resultados en caché para {self.diametro} ({tipo}); ejecute sin --solo_graficar.")
+                datos = calcular()
+                self.cache.guardar(clave, datos)
+            return datos
+
+    def trayectoria(self):
+        campos = {"L_pozo": self.L_pozo, "Q": self.Q, "mu": self.mu, "angulo_deg": self.angulo_deg,
+                  "t_max": self.max_tiempo_simulacion, "integrador": self.integrador,
+                  "tolerancia": self.tolerancia, "dt": 0.01,
+                  "levantamiento": self.levantamiento.campos() if self.levantamiento is not None else None,
+                  "formato": "trayectoria"}
+
+        d = self._cacheado("simulacion", campos, lambda: {"datos": self.simular().datos})
+        return Trayectoria(d["datos"], self.parametros(), self.levantamiento, self.g, self.reologia)
+
+    # --- Curvas límite (sin gráficos) ---
+
+    def curvas_angulo_critico(self, viscosidades_marsh, caudales_lpm):
+        # Ángulo (°) donde arrastre + corte igualan al peso efectivo, grilla (viscosidad x caudal)
+        return self.nucleo.angulo_critico(viscosidades_marsh, caudales_lpm)
+
+    def caudal_critico_90(self, viscosidades_marsh):
+        # Caudal (L/min) en que el ángulo crítico llega a 90°: kd*vf^2 + kv*vf = Fg
+        return self.nucleo.caudal_critico_90(viscosidades_marsh)
+
+    def curvas_viscosidad_critica(self, angulos_deg, caudales_lpm):
+        # Viscosidad Marsh crítica, grilla (ángulo x caudal)
+        return self.nucleo.viscosidad_critica(angulos_deg, caudales_lpm)
+
+    def curva_angulo_critico(self, marsh, Q_desde, Q_hasta, paso=0.5, n_inter=15):
+        # Curva de graficar_viscosidad_limite: grilla de caudales, cruce exacto con
+        # 90° y n_inter puntos de refinamiento antes del cruce; marsh None usa self.reologia
+        if marsh is None:
+            curva = lambda Q: self.nucleo.angulo_critico_fluido(self.reologia, Q)
+            Q90 = float(self.nucleo.caudal_critico_90_fluido(self.reologia))
+        else:
+            curva = lambda Q: self.curvas_angulo_critico([marsh], Q)[0]
+            Q90 = float(self.caudal_critico_90(marsh))
+        Qs = Q_desde + paso * np.arange(int(np.floor((Q_hasta - Q_desde) / paso + 1e-9)) + 1)
+        thetas = curva(Qs)
+        antes = Qs < Q90
+        if antes.all():
+            return Qs, thetas, None
+        if not antes.any():
+            return Qs, np.full(len(Qs), 90.0), 0
+
+        i90 = int(np.argmin(antes))
+        Q_int = Qs[i90 - 1] + (Q90 - Qs[i90 - 1]) * np.arange(1, n_inter + 1) / (n_inter + 1)
+        theta_int = curva(Q_int)
+        Qs = np.concatenate([Qs[:i90], Q_int, [Q90], Qs[i90:]])
+        thetas = np.concatenate([thetas[:i90], theta_int, [90.0], np.full(len(Qs) - i90 - n_inter - 1, 90.0)])
+        return Qs, thetas, i90 + n_inter
+
+    @property
+    def figsize(self):
+        if self._figsize is None:
+            self._figsize = self._calcular_tamano_figura()
+        return self._figsize
 
     def _calcular_tamano_figura(self):
-        root = tk.Tk()
-        root.withdraw()
-        width = root.winfo_screenwidth()
-        height = root.winfo_screenheight()
-        root.destroy()
+        if _backend == "Agg":
+            return (16, 10)
+
+        with _fase("tk_pantalla", self.diametro):
+            import tkinter as tk
+            root = tk.Tk()
+            root.withdraw()
+            width = root.winfo_screenwidth()
+            height = root.winfo_screenheight()
+            root.destroy()
 
         dpi = 100
         max_width_inch = width / dpi
@@ -153,43 +1255,63 @@ class SimuladorTestigo:
 
         return (ancho, alto)
     
+    def _mostrar(self, fig, nombre):
+        plt = _pyplot()
+        if self.salida:
+            os.makedirs(self.salida, exist_ok=True)
+            with _fase("guardar_figura", self.diametro):
+                fig.savefig(os.path.join(self.salida, f"{nombre}.{self.formato}"), format=self.formato)
+            plt.close(fig)
+        else:
+            plt.show()
+
     def configurar_minor_ticks(self, ax, eje='both'):
-        def _set_minor(eje_local):
-            if eje_local == 'x':
-                majors = ax.get_xticks()
-                axis = ax.xaxis
-            elif eje_local == 'y':
-                majors = ax.get_yticks()
-                axis = ax.yaxis
+        plt = _pyplot()
+        with _fase("minor_ticks", self.diametro):
+            def _set_minor(eje_local):
+                if eje_local == 'x':
+                    majors = ax.get_xticks()
+                    axis = ax.xaxis
+                elif eje_local == 'y':
+                    majors = ax.get_yticks()
+                    axis = ax.yaxis
+                else:
+                    raise ValueError("Eje debe ser 'x' o 'y'.")
+
+                if len(majors) >= 2:
+                    delta = majors[1] - majors[0]
+                    if delta > 0:
+                        minor_locator = plt.MultipleLocator(delta / 2)
+                        axis.set_minor_locator(minor_locator)
+                        ax.grid(True, which='minor', axis=eje_local, linestyle=':', linewidth=0.3)
+
+            if eje == 'both':
+                _set_minor('x')
+                _set_minor('y')
+            elif eje in ['x', 'y']:
+                _set_minor(eje)
             else:
-                raise ValueError("Eje debe ser 'x' o 'y'.")
-
-            if len(majors) >= 2:
-                delta = majors[1] - majors[0]
-                if delta > 0:
-                    minor_locator = plt.MultipleLocator(delta / 2)
-                    axis.set_minor_locator(minor_locator)
-                    ax.grid(True, which='minor', axis=eje_local, linestyle=':', linewidth=0.3)
-
-        if eje == 'both':
-            _set_minor('x')
-            _set_minor('y')
-        elif eje in ['x', 'y']:
-            _set_minor(eje)
-        else:
-            raise ValueError("Eje debe ser 'x', 'y' o 'both'.")
+                raise ValueError("Eje debe ser 'x', 'y' o 'both'.")
 
     def graficar_simulacion(self, axs=None):
-        
+        plt = _pyplot()
+
         crear_figura = False
         if axs is None:
             fig, axs = plt.subplots(3, 1, figsize=(10, 8), sharex=True)
             crear_figura = True
 
-        T, X, V, A = self.simular()
-        
+        tray = self.trayectoria()
+        T, X, V, A = tray
+
+        def serie(ax, Y):
+            # Mín/máx por columna de píxeles: misma forma con pocos puntos
+            if not self.diezmar:
+                return T, Y
+            return diezmar_minmax(T, Y, max(int(ax.bbox.width), 100))
+
         # Gráfico 1: Posición
-        axs[0].plot(T, X, color="blue")
+        axs[0].plot(*serie(axs[0], X), color="blue")
         axs[0].set_ylabel("Posición (m)", color="blue")
         axs[0].tick_params(axis='y', labelcolor="blue")
         axs[0].tick_params(axis='x', labelbottom=True)
@@ -198,7 +1320,7 @@ class SimuladorTestigo:
         self.configurar_minor_ticks(axs[0], eje='both')
 
         # Gráfico 2: Velocidad
-        axs[1].plot(T, V, color="green")
+        axs[1].plot(*serie(axs[1], V), color="green")
         axs[1].set_ylabel("Velocidad (m/s)", color="green")
         axs[1].tick_params(axis='y', labelcolor="green")
         axs[1].tick_params(axis='x', labelbottom=True)
@@ -207,7 +1329,7 @@ class SimuladorTestigo:
         self.configurar_minor_ticks(axs[1], eje='both')
 
         # Gráfico 3: Aceleración
-        axs[2].plot(T, A, color="red")
+        axs[2].plot(*serie(axs[2], A), color="red")
         axs[2].set_ylabel("Aceleración (m/s²)", color="red")
         axs[2].set_xlabel("Tiempo (s)")
         axs[2].tick_params(axis='y', labelcolor="red")
@@ -216,69 +1338,60 @@ class SimuladorTestigo:
         axs[2].grid(True, axis='both', linestyle='--')
         self.configurar_minor_ticks(axs[2], eje='both')
 
-        # Título principal y sub-título
         titulo_principal = f"Simulación de caída – {self.diametro}"
+        self._subtitulos(tray)
+
+        if crear_figura:
+            fig.suptitle(f"{titulo_principal}", fontsize=13)
+            fig.text(0.5, 0.94, self.subtitulo_datos, ha='center', fontsize=10)
+            fig.text(0.5, 0.91, self.subtitulo_resultados, ha='center', fontsize=10)
+
+            with _fase("tight_layout", self.diametro):
+                fig.tight_layout(rect=[0, 0, 1, 0.88])
+            self._mostrar(fig, f"{self.diametro}_simulacion")
+
+    def _subtitulos(self, tray):
+        # Sub-títulos de datos y resultados de la simulación
         self.subtitulo_datos = (
             f"Longitud del pozo {self.L_pozo} m, "
             f"Ángulo {self.angulo_deg}\u00B0, "
             f"Longitud del testigo {self.L_testigo} m, "
             f"Caudal {round(self.Q * 60000)} L/min, "
-            f"Viscosidad {round(self.mu * 1000 / 1.1 + 25)} seg (Marsh)"
+            + (f"Viscosidad {round(self.mu * 1000 / 1.1 + 25)} seg (Marsh)"
+               if self.reologia is None else f"Fluido {self.reologia.descripcion()}")
         )
 
-        # Cálculo de resultados
-        velocidad_final = V[-2]
-        tiempo_final = T[-2]
-        fuerza_neta = self.m * A[-2]
-
-        # Peso efectivo (gravedad - flotación)
-        fuerza_peso = (self.rho_c - self.rho_f) * self.V * self.g
-
-        # Velocidad del fluido en el anular
-        v_fluido = self.Q / self.Aa
-
-        # Fuerza de arrastre por flujo
-        fuerza_arrastre = 0.5 * self.rho_f * self.Cd * self.Af * v_fluido * abs(v_fluido)
-
-        # Fuerza de corte viscoso
-        if (1 - (self.r1 / self.r2)**2) != 0:
-            tau_corte = 4 * self.mu * v_fluido / (self.r1 * (1 - (self.r1 / self.r2)**2))
-        else:
-            tau_corte = 0.0
-        fuerza_corte = tau_corte * self.Alat
-
-        # Fuerza total final
-        fuerza_total = (-fuerza_peso + fuerza_arrastre + fuerza_corte) / self.g
-
         # Subtítulo de resultados
-        self.subtitulo_resultados = (f"Velocidad final {velocidad_final:.1f} m/s, "
-                                     f"Tiempo total {tiempo_final:.1f} s, "
-                                     f"Fuerza total de inpacto del testigo {fuerza_total:.1f} kg")
-
-        if crear_figura:
-            fig.suptitle(f"{titulo_principal}", fontsize=13)
-            fig.text(0.5, 0.94, self.subtitulo_datos, ha='center', fontsize=10)
-            fig.text(0.5, 0.91, self.subtitulo_resultados, ha='center', fontsize=10)
-
-            plt.tight_layout(rect=[0, 0, 1, 0.88])
-            plt.show()
+        self.subtitulo_resultados = (f"Velocidad final {tray.velocidad_final:.1f} m/s, "
+                                     f"Tiempo total {tray.tiempo_final:.1f} s, "
+                                     f"Fuerza total de inpacto del testigo {tray.fuerza_impacto:.1f} kg")
+
+    def _curvas_viscosidad_limite(self, viscosidades):
+        # La menor viscosidad define Q_max: primer caudal de la grilla que alcanza 90°
+        d = {}
+        i90s = []
+        Q_max = self.max_caudal_bombeo
+        for k, marsh in enumerate(viscosidades):
+            Qs, thetas, i90 = self.curva_angulo_critico(marsh, self.Q_min, Q_max if k else self.max_caudal_bombeo)
+            if k == 0 and i90 is not None:
+                Q_critico = Qs[i90 + 1] if i90 + 1 < len(Qs) else Qs[i90]
+                Q_max = min(Q_critico + 20, self.max_caudal_bombeo)
+            d[f"Qs_{k}"] = Qs
+            d[f"thetas_{k}"] = thetas
+            i90s.append(-1 if i90 is None else i90)
+        d["i90"] = np.array(i90s)
+        d["Q_max"] = np.array(Q_max)
+        return d
+
+    def _anotar_viscosidad(self, ax, marsh, x_pos, y_pos):
+        return ax.annotate(f"{marsh}",
+                           (x_pos, y_pos),
+                           textcoords="offset points", xytext=(0, 5),
+                           ha='center', fontsize=8, fontfamily='monospace', zorder=3,
+                           bbox=dict(facecolor='white', edgecolor='none', boxstyle='round,pad=0.2'))
 
     def graficar_viscosidad_limite(self, ax=None):
-
-        def calcular_theta(mu_local, Q_lpm):
-            Q_m3s = Q_lpm / 60000
-            v_f = Q_m3s / self.Aa
-            v_rel = -v_f
-
-            tau = 4 * mu_local * abs(v_rel) / (self.r1 * (1 - (self.r1/self.r2)**2))
-            Fv = -np.sign(v_rel) * tau * self.Alat
-            Fd = -0.5 * self.rho_f * self.Cd * self.Af * v_rel * abs(v_rel)
-            Fg = (self.rho_c - self.rho_f) * self.V * self.g
-
-            sin_theta = (Fv + Fd) / Fg
-            sin_theta = np.clip(sin_theta, -1.0, 1.0)
-            theta_deg = np.degrees(np.arcsin(sin_theta))
-            return max(theta_deg, 0.0)
+        plt = _pyplot()
 
         created_local_fig = False
         delta_y = -15
@@ -287,110 +1400,37 @@ class SimuladorTestigo:
             created_local_fig = True
             delta_y = 0
 
-        # Determinar viscosidades
-        if self.rango_viscosidad:
+        # Determinar viscosidades (con reología no newtoniana, solo la curva del fluido)
+        if self.reologia is not None:
+            viscosidades = [None]
+        elif self.rango_viscosidad:
             viscosidades = list(range(self.rango_viscosidad[0], self.rango_viscosidad[1] + 1, self.rango_viscosidad[2]))
         else:
             viscosidades = [round(self.mu * 1000 / 1.1 + 25, 1)]
 
-        viscosidades = sorted(viscosidades)  # ordenarlas siempre por si acaso
+        if self.reologia is None:
+            viscosidades = sorted(viscosidades)  # ordenarlas siempre por si acaso
 
-        todas_las_thetas = []
+        d = self._cacheado("viscosidad_limite",
+                           {"viscosidades": viscosidades, "Q_min": self.Q_min, "Q_bombeo": self.max_caudal_bombeo},
+                           lambda: self._curvas_viscosidad_limite(viscosidades))
+        self.Q_max = float(d["Q_max"])
         Qs_dict = {}
-
-        menor_viscosidad = viscosidades[0]
-        mu_menor = 1.1 * (menor_viscosidad - 25) / 1000
-
-        Qs_menor = []
-        thetas_menor = []
-        Q_prev = None
-        alcanzado_90 = False
-        Q_critico = None
-        n_inter = 15
-
-        caudal = self.Q_min
-        while caudal <= self.max_caudal_bombeo:
-            theta_actual = calcular_theta(mu_menor, caudal)
-
-            if not alcanzado_90:
-                if theta_actual >= 90.0 and Q_prev is not None:
-                    # Interpolar puntos antes del 90°
-                    for i in range(1, n_inter + 1):
-                        Q_interp = Q_prev + (caudal - Q_prev) * i / (n_inter + 1)
-                        theta_interp = calcular_theta(mu_menor, Q_interp)
-                        Qs_menor.append(round(Q_interp, 2))
-                        thetas_menor.append(theta_interp)
-                    Qs_menor.append(caudal)
-                    thetas_menor.append(90.0)
-                    alcanzado_90 = True
-                    Q_critico = caudal
-                else:
-                    Qs_menor.append(caudal)
-                    thetas_menor.append(theta_actual)
-            else:
-                Qs_menor.append(caudal)
-                thetas_menor.append(90.0)
-
-            Q_prev = caudal
-            caudal += 0.5
-
-        # Definir Q_max
-        if Q_critico is not None:
-            self.Q_max = Q_critico + 20
-            self.Q_max = min(self.Q_max, self.max_caudal_bombeo)
-        else:
-            self.Q_max = self.max_caudal_bombeo
-
-        Qs_dict[menor_viscosidad] = (Qs_menor, thetas_menor)
-        todas_las_thetas.append(thetas_menor)
-
-        for marsh in viscosidades[1:]:
-            mu_local = 1.1 * (marsh - 25) / 1000
-            Qs = []
-            thetas = []
-            Q_prev = None
-            alcanzado_90 = False
-
-            caudal = self.Q_min
-            while caudal <= self.Q_max:
-                theta_actual = calcular_theta(mu_local, caudal)
-
-                if not alcanzado_90:
-                    if theta_actual >= 90.0 and Q_prev is not None:
-                        for i in range(1, n_inter + 1):
-                            Q_interp = Q_prev + (caudal - Q_prev) * i / (n_inter + 1)
-                            theta_interp = calcular_theta(mu_local, Q_interp)
-                            Qs.append(round(Q_interp, 2))
-                            thetas.append(theta_interp)
-                        Qs.append(caudal)
-                        thetas.append(90.0)
-                        alcanzado_90 = True
-                    else:
-                        Qs.append(caudal)
-                        thetas.append(theta_actual)
-                else:
-                    Qs.append(caudal)
-                    thetas.append(90.0)
-
-                Q_prev = caudal
-                caudal += 0.5
-
-            Qs_dict[marsh] = (Qs, thetas)
-            todas_las_thetas.append(thetas)
+        todas_las_thetas = []
+        for k, marsh in enumerate(viscosidades):
+            i90 = int(d["i90"][k])
+            Qs_dict[marsh] = (d[f"Qs_{k}"], d[f"thetas_{k}"], i90 if i90 >= 0 else None)
+            todas_las_thetas.append(d[f"thetas_{k}"])
 
         for marsh in viscosidades:
-            Qs, thetas = Qs_dict[marsh]
+            Qs, thetas, i90 = Qs_dict[marsh]
+            if marsh is None:
+                ax.plot(Qs, thetas, label=self.reologia.descripcion(), zorder=2)
+                continue
             ax.plot(Qs, thetas, label=f"{marsh} s Marsh", zorder=2)
 
-            if 90.0 in thetas:
-                idx_90 = thetas.index(90.0)
-                x_pos = Qs[idx_90]
-                y_pos = thetas[idx_90] + delta_y
-                ax.annotate(f"{marsh}",
-                            (x_pos, y_pos),
-                            textcoords="offset points", xytext=(0, 5),
-                            ha='center', fontsize=8, fontfamily='monospace', zorder=3,
-                            bbox=dict(facecolor='white', edgecolor='none', boxstyle='round,pad=0.2'))
+            if i90 is not None:
+                self._anotar_viscosidad(ax, marsh, Qs[i90], thetas[i90] + delta_y)
 
         for y in range(10, 100, 10):
             ax.axhline(y, color='gray', linestyle='--', linewidth=0.5, zorder=0)
@@ -414,7 +1454,7 @@ class SimuladorTestigo:
             ncol=2,
             fontsize=8,
             frameon=True,
-            title="Viscosidad:",
+            title="Viscosidad:" if self.reologia is None else "Fluido:",
             title_fontsize=8
         )
         ax.xaxis.set_minor_locator(plt.MultipleLocator(5))
@@ -423,30 +1463,12 @@ class SimuladorTestigo:
         ax.grid(which='minor', axis='both', linestyle=':')
 
         if created_local_fig:
-            fig.tight_layout()
-            plt.show()
+            with _fase("tight_layout", self.diametro):
+                fig.tight_layout()
+            self._mostrar(fig, f"{self.diametro}_viscosidad_limite")
 
     def graficar_angulo_limite(self, ax=None):
-
-        def calcular_viscosidad(mu_ang_deg, caudal_lpm):
-            Q_m3s = caudal_lpm / 60000
-            v_f = Q_m3s / self.Aa
-            v_rel = -v_f
-
-            Fd = -0.5 * self.rho_f * self.Cd * self.Af * v_rel * abs(v_rel)
-            Fg = (self.rho_c - self.rho_f) * self.V * self.g * np.sin(np.radians(mu_ang_deg))
-
-            num = Fg - Fd
-            den = (4 * abs(v_rel) / (self.r1 * (1 - (self.r1/self.r2)**2))) * self.Alat
-
-            if den != 0:
-                mu_Pa_s = num / den
-            else:
-                mu_Pa_s = np.nan
-
-            mu_Pa_s = max(mu_Pa_s, 0.0)
-            mu_marsh = mu_Pa_s * 1000 / 1.1 + 25
-            return mu_marsh  # NO hay truncado a 150
+        plt = _pyplot()
 
         caudales = np.arange(self.Q_min, self.max_caudal_bombeo+1, 1)
 
@@ -461,14 +1483,20 @@ class SimuladorTestigo:
         else:
             angulos = [self.angulo_deg]
 
-        for ang in angulos:
-            viscosidades_marsh = []
-            for Q_lpm in caudales:
-                mu_marsh = calcular_viscosidad(ang, Q_lpm)
-                viscosidades_marsh.append(mu_marsh)
-
+        curvas = self._cacheado("angulo_limite",
+                                {"angulos": angulos, "caudales": caudales},
+                                lambda: {"curvas": self.curvas_viscosidad_critica(angulos, caudales)})["curvas"]
+        for ang, viscosidades_marsh in zip(angulos, curvas):
             ax.plot(caudales, viscosidades_marsh, label=f"{ang}°", zorder=2)
 
+        if self.reologia is not None:
+            # Viscosidad aparente del fluido como Marsh equivalente: el testigo queda
+            # retenido donde supera a la crítica del ángulo
+            limites = ax.get_ylim()
+            ax.plot(caudales, self.nucleo.viscosidad_aparente(self.reologia, caudales), color='black',
+                    linestyle='--', label=self.reologia.descripcion(), zorder=3)
+            ax.set_ylim(limites)
+
         ax.grid(True, axis='both', linestyle='--' )
         
         for x in range(self.Q_min, self.max_caudal_bombeo+1, 10):
@@ -500,35 +1528,18 @@ class SimuladorTestigo:
         ax.grid(which='minor', axis='both', linestyle=':')
 
         if created_local_fig:
-            fig.tight_layout()
-            plt.show()
+            with _fase("tight_layout", self.diametro):
+                fig.tight_layout()
+            self._mostrar(fig, f"{self.diametro}_angulo_limite")
     
     def graficar_caudal_limite(self, ax=None):
+        plt = _pyplot()
 
         created_local_fig = False
         if ax is None:
             fig, ax = plt.subplots(figsize=(12, 6))
             created_local_fig = True
 
-        def calcular_viscosidad_caudal_fijo(Q_m3s, theta_deg):
-            v_f = Q_m3s / self.Aa
-            v_rel = -v_f
-
-            Fd = -0.5 * self.rho_f * self.Cd * self.Af * v_rel * abs(v_rel)
-            Fg = (self.rho_c - self.rho_f) * self.V * self.g * np.sin(np.radians(theta_deg))
-
-            num = Fg - Fd
-            den = (4 * abs(v_rel) / (self.r1 * (1 - (self.r1/self.r2)**2))) * self.Alat
-
-            if den != 0:
-                mu_Pa_s = num / den
-            else:
-                mu_Pa_s = np.nan
-
-            mu_Pa_s = max(mu_Pa_s, 0.0)
-            mu_marsh = mu_Pa_s * 1000 / 1.1 + 25
-            return mu_marsh
-
         angulos = np.arange(0, 91, 1)
 
         if self.rango_caudal:
@@ -536,17 +1547,17 @@ class SimuladorTestigo:
         else:
             caudales_lpm = [self.Q * 60000]
 
-        todas_las_curvas = []
+        todas_las_curvas = self._cacheado("caudal_limite",
+                                          {"angulos": angulos, "caudales": caudales_lpm},
+                                          lambda: {"curvas": self.curvas_viscosidad_critica(angulos, caudales_lpm)})["curvas"].T
 
-        for Q_lpm in caudales_lpm:
-            Q_m3s = Q_lpm / 60000
-            viscosidades_marsh = []
-            for theta in angulos:
-                mu_marsh = calcular_viscosidad_caudal_fijo(Q_m3s, theta)
-                viscosidades_marsh.append(mu_marsh)
-
-            todas_las_curvas.append(viscosidades_marsh)
-            ax.plot(angulos, viscosidades_marsh, label=f"{round(Q_lpm,1)} L/min", zorder=2)
+        for Q_lpm, viscosidades_marsh in zip(caudales_lpm, todas_las_curvas):
+            linea, = ax.plot(angulos, viscosidades_marsh, label=f"{round(Q_lpm,1)} L/min", zorder=2)
+            if self.reologia is not None:
+                # Marsh equivalente del fluido a ese caudal: el cruce es el ángulo crítico
+                aparente = float(self.nucleo.viscosidad_aparente(self.reologia, [Q_lpm])[0])
+                if np.isfinite(aparente):
+                    ax.axhline(aparente, color=linea.get_color(), linestyle=':', linewidth=1.0, zorder=2)
 
         # Ajustar el límite Y de acuerdo al máximo valor real
         mu_max_real = max(max(curva) for curva in todas_las_curvas)
@@ -583,86 +1594,2164 @@ class SimuladorTestigo:
         ax.grid(which='minor', axis='both', linestyle=':')
 
         if created_local_fig:
-            fig.tight_layout()
-            plt.show()
+            with _fase("tight_layout", self.diametro):
+                fig.tight_layout()
+            self._mostrar(fig, f"{self.diametro}_caudal_limite")
+
+    def graficar_mapa_limite(self, ax=None):
+        plt = _pyplot()
+        from matplotlib.colors import TwoSlopeNorm
+
+        created_local_fig = False
+        if ax is None:
+            fig, ax = plt.subplots(figsize=(10, 7))
+            created_local_fig = True
+
+        eje_x, eje_y = self.ejes_mapa
+        ejes = {campo: tuple(EJES_TABLA[campo][:2]) for campo in self.ejes_mapa}
+        with _fase("mapa_limite", self.diametro):
+            r = mapa_limite(self.parametros(), ejes, self.criterio_mapa, self.tolerancia_mapa)
+
+        mapa = r["mapa"]
+        # Cada lado del cero con su propia escala: el margen negativo suele ser mucho menor
+        norma = TwoSlopeNorm(0.0, min(float(np.nanmin(mapa)), -1e-12), max(float(np.nanmax(mapa)), 1e-12))
+        imagen = ax.imshow(mapa.T, origin="lower", aspect="auto", cmap="RdBu_r", norm=norma,
+                           extent=(*ejes[eje_x], *ejes[eje_y]), zorder=0)
+        for k, linea in enumerate(r["contornos"]):
+            ax.plot(linea[:, 0], linea[:, 1], color="black", linewidth=1.2, zorder=2,
+                    label="No baja / baja" if k == 0 else None)
+        punto = self.parametros()
+        ax.plot(punto[eje_x][0], punto[eje_y][0], marker="o", color="gold", markeredgecolor="black",
+                linestyle="none", zorder=3, label="Entrada")
+
+        etiquetas = {campo: etiqueta for campo, etiqueta, *_ in DESLIZADORES_EXPLORADOR}
+        ax.set_xlabel(etiquetas[eje_x], fontsize=10)
+        ax.set_ylabel(etiquetas[eje_y], fontsize=10)
+        ax.set_title(f"Límite de descenso – {self.diametro}\n"
+                     f"{r['evaluaciones']} evaluaciones (grilla uniforme equivalente: {r['uniforme']})", fontsize=11)
+        barra = ax.figure.colorbar(imagen, ax=ax)
+        barra.set_label("Aceleración en reposo (g), > 0 no baja" if self.criterio_mapa == "reposo"
+                        else "(t − t_max) / (t + t_max), > 0 no llega", fontsize=9)
+        ax.legend(loc="upper right", fontsize=8)
+
+        if created_local_fig:
+            with _fase("tight_layout", self.diametro):
+                fig.tight_layout()
+            self._mostrar(fig, f"{self.diametro}_mapa_limite")
+
+    def graficar_reporte(self):
+        plt = _pyplot()
+        from matplotlib.offsetbox import AnchoredText
+
+        # --- Gráfica integrada de 6 cuadros ---
+        fig, axs = plt.subplots(3, 2, figsize=self.figsize, sharex=False)
+
+        # 1. Simular posición, velocidad, aceleración
+        self.graficar_simulacion(axs=axs[:, 0])
+
+        # 2. Dibujar columna derecha
+        self.graficar_viscosidad_limite(ax=axs[0, 1])
+        self.graficar_angulo_limite(ax=axs[1, 1])
+        self.graficar_caudal_limite(ax=axs[2, 1])
+
+        # 3. Ajuste general de escalas y etiquetas
+        for i in range(3):
+            axs[i, 0].tick_params(axis='both', labelsize=8)
+            axs[i, 0].grid(True)
+            axs[i, 0].set_xlabel("Tiempo (s)", fontsize=9)
+
+            axs[i, 1].tick_params(axis='both', labelsize=8, labelbottom=True)
+            axs[i, 1].grid(True)
+            if i in [0, 1]:  # viscosidad vs caudal, ángulo vs caudal
+                axs[i, 1].set_xlabel("Caudal (L/min)", fontsize=9)
+                axs[i, 1].set_xlim(self.Q_min, self.Q_max)
+            elif i == 2:  # caudal vs ángulo
+                axs[i, 1].set_xlabel("Ángulo (°)", fontsize=9)
+                axs[i, 1].set_xlim(0, 90)
+
+        # 4. Subtítulos de la primera columna
+        texto_unificado = self.subtitulo_datos + "\n" + self.subtitulo_resultados
+        wrapped_text = textwrap.fill(texto_unificado, width=85)
+
+        at = AnchoredText(
+            wrapped_text,
+            prop=dict(size=9),
+            frameon=False,
+            loc='upper left',
+            bbox_to_anchor=(0.05, 0.93),
+            bbox_transform=fig.transFigure,
+            borderpad=0.0
+        )
+        fig.add_artist(at)
+
+        # 5. Título general
+        fig.suptitle(f"Simulación Numérica Explícita – {self.diametro}", fontsize=16)
+
+        # 6. Compactar
+        with _fase("tight_layout", self.diametro):
+            fig.tight_layout(rect=[0.02, 0, 0.97, 0.96])
+        fig.subplots_adjust(wspace=0.15, hspace=0.4)
+        self._mostrar(fig, self.diametro)
+
+# Deslizadores del explorador: campo, etiqueta, mínimo, máximo
+DESLIZADORES_EXPLORADOR = (
+    ("angulo_deg", "Ángulo (°)", 0.0, 90.0),
+    ("caudal_lpm", "Caudal (L/min)", 0.0, 200.0),
+    ("viscosidad_marsh_seg", "Viscosidad (s Marsh)", 25.0, 150.0),
+    ("densidad_roca_kgm3", "Densidad roca (kg/m³)", 1500.0, 3500.0),
+    ("densidad_fluido_kgm3", "Densidad fluido (kg/m³)", 1000.0, 1500.0),
+)
+
+class Explorador:
+    # Reporte de 6 cuadros con deslizadores. Al mover uno solo se recalculan
+    # los cuadros que dependen de ese parámetro, las líneas se actualizan en
+    # su lugar y se redibuja con blitting sobre un fondo guardado; el dibujo
+    # completo se repite solo si cambian los límites de algún eje.
+    def __init__(self, config, diametro):
+        self.config = dict(config)
+        self.diametro = diametro
+        self.sim = self._simulador()
+        self.dependencias = self._dependencias()
+
+        plt = _pyplot()
+        from matplotlib.widgets import Slider
+        self.fig, self.axs = plt.subplots(3, 2, figsize=self.sim.figsize)
+        self.sim.graficar_simulacion(axs=self.axs[:, 0])
+        self.sim.graficar_viscosidad_limite(ax=self.axs[0, 1])
+        self.sim.graficar_angulo_limite(ax=self.axs[1, 1])
+        self.sim.graficar_caudal_limite(ax=self.axs[2, 1])
+        self.fig.suptitle(f"Explorador – {self.diametro}", fontsize=14)
+        self.texto = self.fig.text(0.5, 0.935, "", ha="center", fontsize=10)
+        self.fig.subplots_adjust(left=0.07, right=0.97, top=0.9, bottom=0.28, wspace=0.2, hspace=0.45)
+
+        self.lineas_simulacion = [ax.lines[0] for ax in self.axs[:, 0]]
+        self.curvas = {cuadro: [l for l in self.axs[i, 1].lines if not l.get_label().startswith("_")]
+                       for i, cuadro in enumerate(("viscosidad_limite", "angulo_limite", "caudal_limite"))}
+        self.anotaciones = list(self.axs[0, 1].texts)
+
+        self.deslizadores = {}
+        for k, (campo, etiqueta, minimo, maximo) in enumerate(DESLIZADORES_EXPLORADOR):
+            ax = self.fig.add_axes([0.2, 0.19 - 0.04 * k, 0.6, 0.025])
+            valor = float(self.sim.parametros()[campo][0])
+            deslizador = Slider(ax, etiqueta, min(minimo, valor), max(maximo, valor), valinit=valor)
+            deslizador.drawon = False   # el redibujo lo hace actualizar con blitting
+            deslizador.on_changed(lambda val, campo=campo: self.actualizar({campo: val}))
+            self.deslizadores[campo] = deslizador
+
+        # Regiones que se restauran y redibujan por separado: (bbox, artistas animados)
+        from matplotlib.transforms import Bbox, TransformedBbox
+        def banda(y0, y1):
+            return TransformedBbox(Bbox.from_extents(0, y0, 1, y1), self.fig.transFigure)
+        self.regiones = {f"simulacion_{i}": (ax.bbox, lambda linea=linea: [linea])
+                         for i, (ax, linea) in enumerate(zip(self.axs[:, 0], self.lineas_simulacion))}
+        self.regiones["texto"] = (banda(0.905, 0.965), lambda: [self.texto])
+        for i, cuadro in enumerate(self.curvas):
+            ax = self.axs[i, 1]
+            # La leyenda solo cambia si el cuadro dibuja una única curva con el valor actual
+            leyenda = [ax.get_legend()] if self.dependencias[cuadro] - self.densidades else []
+            extra = (lambda: self.anotaciones) if cuadro == "viscosidad_limite" else list
+            self.regiones[cuadro] = (ax.bbox, lambda cuadro=cuadro, leyenda=leyenda, extra=extra:
+                                     self.curvas[cuadro] + extra() + leyenda)
+        for campo, d in self.deslizadores.items():
+            y0 = d.ax.get_position().y0
+            self.regiones[f"deslizador_{campo}"] = (banda(y0 - 0.008, y0 + 0.033),
+                                                    lambda d=d: [d.poly, d.valtext] + list(d.ax.lines))
+        for _, artistas in self.regiones.values():
+            for artista in artistas():
+                artista.set_animated(True)
+        self._texto_resultados()
+
+        self.fondos = {}
+        self.fig.canvas.mpl_connect("draw_event", self._al_dibujar)
+
+    def _simulador(self):
+        sim = SimuladorTestigo(self.config, self.diametro)
+        sim.integrador = self.config.get("integrador", "rk45")   # pocos pasos por cuadro
+        return sim
+
+    densidades = {"densidad_roca_kgm3", "densidad_fluido_kgm3"}
+
+    def _dependencias(self):
+        # Parámetros de los que depende cada cuadro; sin rango, la curva única
+        # usa además el valor actual del parámetro correspondiente
+        return {
+            "simulacion": {campo for campo, *_ in DESLIZADORES_EXPLORADOR},
+            "viscosidad_limite": self.densidades | (set() if self.sim.rango_viscosidad else {"viscosidad_marsh_seg"}),
+            "angulo_limite": self.densidades | (set() if self.sim.rango_angulo else {"angulo_deg"}),
+            "caudal_limite": self.densidades | (set() if self.sim.rango_caudal else {"caudal_lpm"}),
+        }
+
+    def _al_dibujar(self, evento):
+        # Tras cada dibujo completo (inicio, cambio de tamaño o de límites)
+        canvas = self.fig.canvas
+        self.fondos = {nombre: canvas.copy_from_bbox(bbox) for nombre, (bbox, _) in self.regiones.items()}
+        for nombre in self.regiones:
+            self._dibujar_region(nombre, restaurar=False)
+
+    def _dibujar_region(self, nombre, restaurar=True):
+        bbox, artistas = self.regiones[nombre]
+        if restaurar:
+            self.fig.canvas.restore_region(self.fondos[nombre])
+        for artista in artistas():
+            self.fig.draw_artist(artista)
+
+    def _texto_resultados(self):
+        # Los datos ya se leen en los deslizadores; solo los resultados
+        self.texto.set_text(self.sim.subtitulo_resultados)
+
+    @staticmethod
+    def _ajustar(ax, x, y):
+        # Cambia los límites solo si los datos (y el cero) salen de ellos o usan
+        # menos de un cuarto; al cambiar deja holgura para no redibujar en cada paso
+        cambio = False
+        for obtener, fijar, datos in ((ax.get_xlim, ax.set_xlim, x), (ax.get_ylim, ax.set_ylim, y)):
+            if datos is None:
+                continue
+            datos = np.asarray(datos, dtype=float)
+            datos = datos[np.isfinite(datos)]
+            if not datos.size:
+                continue
+            lo, hi = obtener()
+            d_lo, d_hi = min(float(datos.min()), 0.0), max(float(datos.max()), 0.0)
+            rango = max(d_hi - d_lo, 1e-6)
+            if d_lo < lo or d_hi > hi or rango < 0.25 * (hi - lo):
+                fijar(d_lo - 0.25 * rango if d_lo < 0 else 0.0, d_hi + 0.25 * rango)
+                cambio = True
+        return cambio
+
+    # --- Actualización por cuadro: devuelven True si cambió algún límite ---
+
+    def _actualizar_simulacion(self):
+        tray = self.sim.trayectoria()
+        T, X, V, A = tray
+        cambio = False
+        for ax, linea, Y in zip(self.axs[:, 0], self.lineas_simulacion, (X, V, A)):
+            linea.set_data(*diezmar_minmax(T, Y, max(int(ax.bbox.width), 100)))
+            if self._ajustar(ax, T, Y):
+                self.sim.configurar_minor_ticks(ax, eje='both')
+                cambio = True
+        self.sim._subtitulos(tray)
+        self._texto_resultados()
+        return cambio
+
+    def _actualizar_viscosidad_limite(self):
+        sim = self.sim
+        if sim.rango_viscosidad:
+            viscosidades = sorted(range(sim.rango_viscosidad[0], sim.rango_viscosidad[1] + 1, sim.rango_viscosidad[2]))
+        else:
+            viscosidades = [round(sim.mu * 1000 / 1.1 + 25, 1)]
+        d = sim._curvas_viscosidad_limite(viscosidades)
+        ax = self.axs[0, 1]
+        for anotacion in self.anotaciones:
+            anotacion.remove()
+        self.anotaciones = []
+        for k, (marsh, linea) in enumerate(zip(viscosidades, self.curvas["viscosidad_limite"])):
+            Qs, thetas = d[f"Qs_{k}"], d[f"thetas_{k}"]
+            linea.set_data(Qs, thetas)
+            linea.set_label(f"{marsh} s Marsh")
+            i90 = int(d["i90"][k])
+            if i90 >= 0:
+                anotacion = sim._anotar_viscosidad(ax, marsh, Qs[i90], thetas[i90] - 15)
+                anotacion.set_animated(True)
+                self.anotaciones.append(anotacion)
+        cambio = tuple(ax.get_xlim()) != (sim.Q_min, float(d["Q_max"]))
+        if cambio:
+            ax.set_xlim(sim.Q_min, float(d["Q_max"]))
+        thetas = np.concatenate([d[f"thetas_{k}"] for k in range(len(viscosidades))])
+        self._leyenda(ax, self.curvas["viscosidad_limite"])
+        return self._ajustar(ax, None, thetas) or cambio
+
+    def _actualizar_angulo_limite(self):
+        sim = self.sim
+        caudales = np.arange(sim.Q_min, sim.max_caudal_bombeo + 1, 1)
+        angulos = np.arange(sim.rango_angulo[0], sim.rango_angulo[1] + 1, sim.rango_angulo[2]) if sim.rango_angulo else [sim.angulo_deg]
+        curvas = sim.curvas_viscosidad_critica(angulos, caudales)
+        for ang, linea, curva in zip(angulos, self.curvas["angulo_limite"], curvas):
+            linea.set_data(caudales, curva)
+            linea.set_label(f"{ang}°")
+        self._leyenda(self.axs[1, 1], self.curvas["angulo_limite"])
+        return self._ajustar(self.axs[1, 1], None, curvas)
+
+    def _actualizar_caudal_limite(self):
+        sim = self.sim
+        angulos = np.arange(0, 91, 1)
+        caudales = np.arange(sim.rango_caudal[0], sim.rango_caudal[1] + 1, sim.rango_caudal[2]) if sim.rango_caudal else [sim.Q * 60000]
+        curvas = sim.curvas_viscosidad_critica(angulos, caudales).T
+        for Q_lpm, linea, curva in zip(caudales, self.curvas["caudal_limite"], curvas):
+            linea.set_data(angulos, curva)
+            linea.set_label(f"{round(Q_lpm, 1)} L/min")
+        self._leyenda(self.axs[2, 1], self.curvas["caudal_limite"])
+        return self._ajustar(self.axs[2, 1], None, curvas)
+
+    @staticmethod
+    def _leyenda(ax, lineas):
+        for texto, linea in zip(ax.get_legend().get_texts(), lineas):
+            texto.set_text(linea.get_label())
+
+    def actualizar(self, cambios):
+        # cambios: {campo: valor}. Devuelve los cuadros recalculados.
+        cambiados = {campo for campo, valor in cambios.items() if self.config.get(campo) != valor}
+        if not cambiados:
+            return []
+        self.config.update(cambios)
+        for campo in cambiados:
+            # Llamadas desde código: el deslizador refleja el valor (su aviso ya no cambia nada)
+            if self.deslizadores[campo].val != cambios[campo]:
+                self.deslizadores[campo].set_val(cambios[campo])
+        self.sim = self._simulador()
+        sucios = [cuadro for cuadro, campos in self.dependencias.items() if campos & cambiados]
+        redibujar = False
+        for cuadro in sucios:
+            with _fase(f"explorador_{cuadro}", self.diametro):
+                redibujar |= getattr(self, f"_actualizar_{cuadro}")()
+
+        canvas = self.fig.canvas
+        if redibujar or not self.fondos:
+            canvas.draw()   # _al_dibujar guarda los fondos y dibuja lo animado
+            canvas.blit(self.fig.bbox)
+            return sucios
+        # Solo se restauran y copian a pantalla las regiones que cambiaron
+        regiones = [f"deslizador_{campo}" for campo in cambiados]
+        for cuadro in sucios:
+            regiones += ["simulacion_0", "simulacion_1", "simulacion_2", "texto"] if cuadro == "simulacion" else [cuadro]
+        for nombre in regiones:
+            self._dibujar_region(nombre)
+            canvas.blit(self.regiones[nombre][0])
+        return sucios
+
+    def mostrar(self):
+        _pyplot().show()
+
+def _cabecera_npy(filas, columnas, largo=128):
+    # Cabecera .npy v1.0 de largo fijo, para poder reescribirla al terminar
+    texto = "{'descr': '<f8', 'fortran_order': False, 'shape': (%d, %d), }" % (filas, columnas)
+    texto = texto.ljust(largo - 11) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(texto)) + texto.encode("latin1")
+
+def leer_trayectoria(ruta, tamano_bloque=65536):
+    # Recorre un .npy de trayectoria por bloques sin cargarlo completo (memmap)
+    datos = np.load(ruta, mmap_mode="r")
+    for i in range(0, len(datos), tamano_bloque):
+        yield np.asarray(datos[i:i + tamano_bloque])
+
+def diezmar_minmax(T, Y, n_cubetas):
+    # Conserva el primer registro, los dos últimos (llegada) y el mínimo y el
+    # máximo de cada cubeta del interior, en orden temporal
+    T = np.asarray(T)
+    Y = np.asarray(Y)
+    n = len(T)
+    if n <= 2 * n_cubetas + 3:
+        return T, Y
+    interior = n - 3
+    k = -(-interior // n_cubetas)
+    idx = np.arange(1, 1 + n_cubetas * k).clip(max=n - 3).reshape(n_cubetas, k)
+    valores = Y[idx]
+    filas = np.arange(n_cubetas)
+    sel = np.concatenate(([0], idx[filas, valores.argmin(axis=1)], idx[filas, valores.argmax(axis=1)], [n - 2, n - 1]))
+    sel = np.unique(sel)
+    return T[sel], Y[sel]
+
+def parametros_lote(casos):
+    # casos: iterable de (diametro, config) con las mismas claves del JSON
+    casos = list(casos)
+    p = np.zeros(len(casos), dtype=PARAMETROS_LOTE)
+    for i, (diam, config) in enumerate(casos):
+        tipo = config.get("diametro", diam)
+        p[i]["d_t"] = DIAMETROS[tipo]["d_t"]
+        p[i]["d_b"] = DIAMETROS[tipo]["d_b"]
+        p[i]["longitud_testigo_m"] = config["longitud_testigo_m"]
+        p[i]["longitud_pozo_m"] = config["longitud_pozo_m"]
+        p[i]["caudal_lpm"] = config["caudal_lpm"]
+        p[i]["viscosidad_marsh_seg"] = config["viscosidad_marsh_seg"]
+        if config.get("reologia", {}).get("modelo") == "newtoniano":
+            p[i]["viscosidad_marsh_seg"] = config["reologia"]["viscosidad_pa_s"] * 1000 / 1.1 + 25
+        p[i]["angulo_deg"] = config["angulo_deg"]
+        p[i]["densidad_roca_kgm3"] = config.get("densidad_roca_kgm3", 2200)
+        p[i]["densidad_fluido_kgm3"] = config.get("densidad_fluido_kgm3", 1030)
+        p[i]["tiempo_max_simulacion_seg"] = config.get("tiempo_max_simulacion_seg", 1000)
+        p[i]["coef_arrastre"] = config.get("coef_arrastre", 0.8)
+    return p
+
+def _coeficientes_lote(p, g=9.81):
+    # a(v) = (Fg - kv * vrel - kd * vrel * |vrel|) / m, con vrel = v - vf
+    r1 = p["d_t"] / 2
+    r2 = p["d_b"] / 2
+    Af = np.pi * r1**2
+    Aa = np.pi * (r2**2 - r1**2)
+    Alat = 2 * np.pi * r1 * p["longitud_testigo_m"]
+    V = Af * p["longitud_testigo_m"]
+    m = p["densidad_roca_kgm3"] * V
+    mu = 1.1 * (p["viscosidad_marsh_seg"] - 25) / 1000
+
+    vf = (p["caudal_lpm"] / 60000) / Aa
+    kv = 4.0 * mu * Alat / (r1 * (1.0 - (r1 / r2)**2))
+    kd = 0.5 * p["densidad_fluido_kgm3"] * p["coef_arrastre"] * Af
+    Fg = (p["densidad_fluido_kgm3"] - p["densidad_roca_kgm3"]) * V * g * np.sin(np.radians(p["angulo_deg"]))
+    return m, vf, kv, kd, Fg
+
+def _escala_corte_lote(p):
+    # G = escala * |vrel|: tasa de corte nominal en la pared (ver Reologia)
+    r1 = p["d_t"] / 2
+    r2 = p["d_b"] / 2
+    return 4.0 / (r1 * (1.0 - (r1 / r2)**2))
+
+def _fuerza_impacto_lote(p, g=9.81, reologias=None):
+    # Misma estimación que graficar_simulacion: (-peso efectivo + arrastre + corte) / g en kg
+    # reologias: lista opcional (una Reologia o None por caso)
+    m, vf, kv, kd, _ = _coeficientes_lote(p, g)
+    V = m / p["densidad_roca_kgm3"]
+    fuerza_peso = (p["densidad_roca_kgm3"] - p["densidad_fluido_kgm3"]) * V * g
+    corte = kv * vf
+    if reologias is not None:
+        escala = _escala_corte_lote(p)
+        Alat = np.pi * p["d_t"] * p["longitud_testigo_m"]
+        for i, reologia in enumerate(reologias):
+            if reologia is not None:
+                corte[i] = np.sign(vf[i]) * Alat[i] * reologia.esfuerzo(escala[i] * np.abs(vf[i]))
+    return (-fuerza_peso + kd * vf * np.abs(vf) + corte) / g
+
+def simular_lote(parametros, dt=0.01, trayectorias=False, levantamientos=None, reologias=None):
+    # Integra N casos a la vez con el mismo RK4 de SimuladorTestigo.simular.
+    # Cada carril se desactiva al llegar a x <= 0 o al agotar su tiempo máximo.
+    # levantamientos: lista opcional (un Levantamiento o None por caso).
+    # reologias: lista opcional (una Reologia o None por caso); las tablas de los
+    # fluidos distintos se apilan y cada carril interpola en su fila.
+    p = np.atleast_1d(np.asarray(parametros, dtype=PARAMETROS_LOTE))
+    n = p.shape[0]
+    m, vf, kv, kd, Fg = _coeficientes_lote(p)
+    L = p["longitud_pozo_m"].astype(float)
+    t_max = p["tiempo_max_simulacion_seg"].astype(float)
+    escala = _escala_corte_lote(p)
+
+    tabla = None
+    filas = np.zeros(n, dtype=np.intp)
+    fluido = np.zeros(n, dtype=bool)
+    alat = cedencia = np.zeros(n)
+    if reologias is not None and any(r is not None for r in reologias):
+        fluidos = {}
+        for r in reologias:
+            if r is not None:
+                fluidos.setdefault(r.clave, (len(fluidos), r))
+        tabla = np.vstack([r.log_tau for _, r in fluidos.values()])
+        cedencias = np.array([r.cedencia for _, r in fluidos.values()])
+        filas = np.array([0 if r is None else fluidos[r.clave][0] for r in reologias], dtype=np.intp)
+        fluido = np.array([r is not None for r in reologias])
+        alat = np.pi * p["d_t"] * p["longitud_testigo_m"]
+        cedencia = np.where(fluido, cedencias[filas], 0.0)
+
+    # Segmentos de todos los carriles en un solo arreglo ordenado: la clave de
+    # búsqueda suma a la profundidad un desfase por carril, así una sola
+    # búsqueda binaria ubica el segmento de cada carril. vf, kv y Fg pasan a ser
+    # los del segmento actual de cada carril (con sus límites desde/hasta) y
+    # solo se busca de nuevo en los carriles que salieron de él.
+    claves = None
+    rigidez = _rigidez_lote(p)[0] * dt
+    desde = hasta = np.zeros(n)
+    desfase = np.zeros(n)
+    if levantamientos is not None and any(lev is not None for lev in levantamientos):
+        extension = max([float(L.max())] + [float(lev.profundidad[-1]) for lev in levantamientos if lev is not None]) + 1.0
+        desfase = 4.0 * extension * np.arange(n)
+        partes, inicios = [], []
+        for i, lev in enumerate(levantamientos):
+            if lev is None:
+                partes.append(p[i:i + 1])
+                inicios.append([desfase[i] - 2.0 * extension])
+            else:
+                partes.append(lev.parametros(p[i]))
+                inicios.append(np.concatenate(([-2.0 * extension], lev.profundidad)) + desfase[i])
+        claves = np.concatenate(inicios + [[np.inf]])
+        _, vf_s, kv_s, _, Fg_s = _coeficientes_lote(np.concatenate(partes))
+        escala_s = _escala_corte_lote(np.concatenate(partes))
+        # Rigidez de cada carril: la del segmento más rígido
+        mu_s = _rigidez_lote(np.concatenate(partes))[0]
+        rigidez = np.maximum.reduceat(mu_s, np.cumsum([0] + [len(q) for q in partes[:-1]])) * dt
+        j = np.searchsorted(claves, desfase + L, side="right") - 1
+        vf, kv, Fg, escala, desde, hasta = vf_s[j], kv_s[j], Fg_s[j], escala_s[j], claves[j], claves[j + 1]
+    if tabla is not None:
+        for i in np.flatnonzero(fluido):
+            lev = None if levantamientos is None else levantamientos[i]
+            q = p[i:i + 1] if lev is None else lev.parametros(p[i])
+            rigidez[i] = _rigidez_lote(q, reologia=reologias[i])[0].max() * dt
+
+    tiempo = np.full(n, np.nan)
+    velocidad = np.full(n, np.nan)
+    llego = np.zeros(n, dtype=bool)
+    pasos = np.zeros(n, dtype=np.int64)
+
+    # Estado compacto: solo los carriles activos
+    idx = np.flatnonzero((L > 0.0) & (t_max > 0.0))
+    x = L[idx].copy()
+    v = np.zeros(idx.size)
+    v_ant = np.full(idx.size, np.nan)   # velocidad registrada en el paso anterior
+    m_a, vf_a, kv_a, kd_a, Fg_a, L_a, tmax_a, desfase_a, desde_a, hasta_a = (
+        c[idx] for c in (m, vf, kv, kd, Fg, L, t_max, desfase, desde, hasta))
+    escala_a, filas_a, fluido_a, alat_a, cedencia_a = (c[idx] for c in (escala, filas, fluido, alat, cedencia))
+    # Carriles rígidos: paso Rosenbrock exponencial en vez de RK4 (ver SimuladorTestigo._pasos_exp)
+    rigido_a = (rigidez > RIGIDEZ_RK4)[idx]
+
+    def acel(v_, x_):
+        if claves is not None:
+            clave = desfase_a + x_
+            fuera = (clave < desde_a) | (clave >= hasta_a)
+            if fuera.any():
+                j = np.searchsorted(claves, clave[fuera], side="right") - 1
+                vf_a[fuera], kv_a[fuera], Fg_a[fuera], escala_a[fuera] = vf_s[j], kv_s[j], Fg_s[j], escala_s[j]
+                desde_a[fuera], hasta_a[fuera] = claves[j], claves[j + 1]
+        vrel = v_ - vf_a
+        if tabla is None:
+            return (Fg_a - kv_a * vrel - kd_a * vrel * np.abs(vrel)) / m_a
+        # Carriles con reología: corte Alat tau_w(G) y, en reposo relativo, la cedencia.
+        # Se interpola en todos los carriles (los newtonianos en la fila 0) y se elige
+        # con where: más barato que separarlos en cada evaluación
+        abs_vrel = np.abs(vrel)
+        tau = _interpolar_corte(tabla, cedencias, escala_a * abs_vrel, filas_a, derivada=False)[0]
+        corte = np.where(fluido_a, np.sign(vrel) * alat_a * tau, kv_a * vrel)
+        a_ = (Fg_a - corte - kd_a * vrel * abs_vrel) / m_a
+        reposo = fluido_a & (vrel == 0.0)
+        if reposo.any():
+            a_[reposo] = np.copysign(np.maximum(np.abs(Fg_a[reposo]) - cedencia_a[reposo] * alat_a[reposo], 0.0),
+                                     Fg_a[reposo]) / m_a[reposo]
+        return a_
+
+    T, X, V, A = [], [], [], []
+    pendientes = None   # registros de llegada que se escriben en la fila siguiente
+    t = 0.0
+    t_ant = np.nan
+    k = 0
+
+    while idx.size:
+        a = acel(v, x)
+        if trayectorias:
+            fila_x = np.full(n, np.nan)
+            fila_v = np.full(n, np.nan)
+            fila_a = np.full(n, np.nan)
+            fila_x[idx], fila_v[idx], fila_a[idx] = x, v, a
+            if pendientes is not None:
+                fila_x[pendientes[0]], fila_v[pendientes[0]], fila_a[pendientes[0]] = 0.0, 0.0, pendientes[1]
+                pendientes = None
+            T.append(t)
+            X.append(fila_x)
+            V.append(fila_v)
+            A.append(fila_a)
+
+        rigidos = rigido_a.any()
+        if rigidos:
+            kv_j = kv_a
+            if tabla is not None:
+                dtau = _interpolar_corte(tabla, cedencias, escala_a * np.abs(v - vf_a), filas_a)[1]
+                kv_j = np.where(fluido_a, alat_a * escala_a * dtau, kv_a)
+            J = -(kv_j + 2.0 * kd_a * np.abs(v - vf_a)) / m_a
+            f1, f2, f3, f4 = _funciones_phi(dt * J)
+            v2 = v + dt * f1 * a
+            D = acel(v2, x) - a - J * (v2 - v)
+            v_exp = v2 + 2.0 * dt * f3 * D
+            x_exp = x + dt * v + dt * dt * (f2 * a + 2.0 * f4 * D)
+
+        k1v = a
+        k1x = v
+        k2v = acel(v + 0.5 * dt * k1v, x + 0.5 * dt * k1x)
+        k2x = v + 0.5 * dt * k1v
+        k3v = acel(v + 0.5 * dt * k2v, x + 0.5 * dt * k2x)
+        k3x = v + 0.5 * dt * k2v
+        k4v = acel(v + dt * k3v, x + dt * k3x)
+        k4x = v + dt * k3v
+
+        v_paso = v
+        v = v + (dt / 6.0) * (k1v + 2.0 * k2v + 2.0 * k3v + k4v)
+        x = x + (dt / 6.0) * (k1x + 2.0 * k2x + 2.0 * k3x + k4x)
+        if rigidos:
+            v = np.where(rigido_a, v_exp, v)
+            x = np.where(rigido_a, x_exp, x)
+        t_paso = t
+        t += dt
+        k += 1
+
+        arriba = x > L_a
+        x[arriba] = L_a[arriba]
+        v[arriba] = 0.0
+
+        llegada = x <= 0.0
+        agotado = ~llegada & (t >= tmax_a)
+        fin = llegada | agotado
+        if fin.any():
+            # Igual que graficar_simulacion: se reporta el penúltimo registro
+            i_lleg = idx[llegada]
+            tiempo[i_lleg] = t_paso
+            velocidad[i_lleg] = v_paso[llegada]
+            llego[i_lleg] = True
+            tiempo[idx[agotado]] = t_ant if k > 1 else np.nan
+            velocidad[idx[agotado]] = v_ant[agotado]
+            pasos[idx[fin]] = k
+
+            if trayectorias and llegada.any():
+                cero = np.zeros(idx.size)
+                pendientes = (i_lleg, acel(cero, cero)[llegada])
+
+            sigue = ~fin
+            idx = idx[sigue]
+            x, v, v_paso = x[sigue], v[sigue], v_paso[sigue]
+            m_a, vf_a, kv_a, kd_a, Fg_a, L_a, tmax_a, desfase_a, desde_a, hasta_a, rigido_a = (
+                c[sigue] for c in (m_a, vf_a, kv_a, kd_a, Fg_a, L_a, tmax_a, desfase_a, desde_a, hasta_a, rigido_a))
+            escala_a, filas_a, fluido_a, alat_a, cedencia_a = (
+                c[sigue] for c in (escala_a, filas_a, fluido_a, alat_a, cedencia_a))
+
+        v_ant = v_paso
+        t_ant = t_paso
+
+    if trayectorias and pendientes is not None:
+        fila_x = np.full(n, np.nan)
+        fila_v = np.full(n, np.nan)
+        fila_a = np.full(n, np.nan)
+        fila_x[pendientes[0]], fila_v[pendientes[0]], fila_a[pendientes[0]] = 0.0, 0.0, pendientes[1]
+        T.append(t)
+        X.append(fila_x)
+        V.append(fila_v)
+        A.append(fila_a)
+
+    if _perfil is not None:
+        _perfil.contar("pasos_lote", int(pasos.sum()))
+        _perfil.contar("aceleracion_lote", 4 * int(pasos.sum()))
+
+    resultado = {
+        "tiempo": tiempo,
+        "velocidad": velocidad,
+        "fuerza": _fuerza_impacto_lote(p, reologias=reologias),
+        "llego": llego,
+        "pasos": pasos,
+    }
+    if trayectorias:
+        # Filas = pasos de tiempo, columnas = casos; NaN fuera de la vida del carril
+        resultado["T"] = np.asarray(T)
+        resultado["X"] = np.vstack(X) if X else np.empty((0, n))
+        resultado["V"] = np.vstack(V) if V else np.empty((0, n))
+        resultado["A"] = np.vstack(A) if A else np.empty((0, n))
+    return resultado
+
+def _media_bloques(valor, peso, unido):
+    # Promedio de valor ponderado por peso en cada bloque (unido[i]: i sigue en el
+    # bloque de i - 1), repetido por elemento; los que quedan solos conservan su
+    # valor exacto, sin el redondeo de la división
+    if not unido.any():
+        return valor
+    inicio = np.flatnonzero(~unido)
+    media = np.add.reduceat(peso * valor, inicio) / np.add.reduceat(peso, inicio)
+    solo = ~unido
+    solo[:-1] &= ~unido[1:]
+    return np.where(solo, valor, media[np.cumsum(~unido) - 1])
+
+def _proyeccion_contacto(valor, peso, candidato, unido=None):
+    # Proyección de mínimos cuadrados (ponderada por peso) de valor sobre
+    # valor[i] >= valor[i - 1] donde candidato[i]: regresión isotónica por bloques
+    # vecinos que se violan ("pool adjacent violators"), todos a la vez en cada vuelta.
+    # unido: bloques de partida (los de la evaluación anterior, que casi nunca
+    # cambian); si al final alguna unión queda en tracción se repite desde cero.
+    # Devuelve la proyección y los bloques formados
+    if not candidato.any():
+        return valor, np.zeros(valor.shape, dtype=bool)
+    previo = unido is not None and unido.any()
+    unido = candidato & unido if previo else np.zeros(valor.shape, dtype=bool)
+    while True:
+        proyeccion = _media_bloques(valor, peso, unido)
+        viola = candidato & ~unido
+        viola[1:] &= proyeccion[1:] < proyeccion[:-1]
+        if viola.any():
+            unido = unido | viola
+            continue
+        if previo:
+            # Cada unión debe empujar: la parte del bloque que va adelante, sola,
+            # no puede quedar más abajo que el bloque (multiplicador >= 0)
+            d = peso * (valor - proyeccion)
+            antes = np.cumsum(d) - d
+            multiplicador = antes - antes[np.flatnonzero(~unido)][np.cumsum(~unido) - 1]
+            if (unido & (multiplicador < -1e-10 * np.abs(d).max())).any():
+                previo = False
+                unido = np.zeros(valor.shape, dtype=bool)
+                continue
+        return proyeccion, unido
+
+def _longitudes_tren(longitudes):
+    # Lista de largos por tren (pueden tener distinto número de piezas) a (N, K) con 0 al final
+    if isinstance(longitudes, np.ndarray):
+        return np.atleast_2d(longitudes).astype(float)
+    longitudes = [list(largos) for largos in longitudes]
+    largos = np.zeros((len(longitudes), max(len(l) for l in longitudes)))
+    for i, l in enumerate(longitudes):
+        largos[i, :len(l)] = l
+    return largos
+
+def simular_tren(parametros, longitudes, dt=0.01, trayectorias=False):
+    # Testigo quebrado: N trenes (un registro PARAMETROS_LOTE cada uno) de hasta K
+    # piezas con los largos de longitudes (N, K), la pieza 0 adelante y 0 para las
+    # que faltan en trenes más cortos. Cada pieza tiene su masa, corte y arrastre y
+    # todas las piezas de todos los trenes son carriles de un solo arreglo de
+    # estado, con el RK4 (y el paso exponencial de los carriles rígidos) de simular_lote.
+    # Se integra y = x - (largo de las piezas de adelante): todas parten en L, llegan
+    # en y = 0 (apiladas en el fondo) y no se solapan mientras y[i] >= y[i - 1].
+    # El contacto empuja pero no tira: las piezas que se tocan chocan sin rebote
+    # (velocidades) y se mueven juntas mientras la de atrás empuje (aceleraciones),
+    # ambas con _proyeccion_contacto; un solapamiento dentro del paso se corrige al
+    # final con la misma proyección de las posiciones, que conserva el centro de masa.
+    p = np.atleast_1d(np.asarray(parametros, dtype=PARAMETROS_LOTE))
+    largos = _longitudes_tren(longitudes)
+    N, K = largos.shape
+    pieza = largos.ravel() > 0.0
+    q = np.repeat(p, K)
+    q["longitud_testigo_m"] = np.where(pieza, largos.ravel(), 1.0)   # relleno sin uso en las que faltan
+    m, vf, kv, kd, Fg = _coeficientes_lote(q)
+    L = q["longitud_pozo_m"].astype(float)
+    t_max = q["tiempo_max_simulacion_seg"].astype(float)
+    delante = (np.cumsum(largos, axis=1) - largos).ravel()
+    tren = np.repeat(np.arange(N), K)
+    # Rigidez de cada pieza sola: la de un grupo en contacto no la supera
+    rigido = _rigidez_lote(q)[0] * dt > RIGIDEZ_RK4
+
+    tiempo = np.full(N * K, np.nan)
+    velocidad = np.full(N * K, np.nan)
+    llego = np.zeros(N * K, dtype=bool)
+    pasos = np.zeros(N * K, dtype=np.int64)
+
+    idx = np.flatnonzero(pieza & (L > 0.0) & (t_max > 0.0))
+    y = L[idx].copy()
+    v = np.zeros(idx.size)
+    v_ant = np.full(idx.size, np.nan)
+    m_a, vf_a, kv_a, kd_a, Fg_a, L_a, tmax_a, tren_a, delante_a, rigido_a = (
+        c[idx] for c in (m, vf, kv, kd, Fg, L, t_max, tren, delante, rigido))
+
+    def vecinos(tren_a):
+        # candidato[i]: la pieza i tiene delante una pieza activa del mismo tren
+        return np.concatenate(([False], tren_a[1:] == tren_a[:-1]))
+
+    candidato = vecinos(tren_a)
+
+    def acel(v_, contacto, bloques=None):
+        vrel = v_ - vf_a
+        return _proyeccion_contacto((Fg_a - kv_a * vrel - kd_a * vrel * np.abs(vrel)) / m_a, m_a, contacto, bloques)
+
+    T, X, V, A = [], [], [], []
+    pendientes = None
+    unido = None   # grupos en contacto de la última evaluación
+    t = 0.0
+    t_ant = np.nan
+    k = 0
+
+    while idx.size:
+        contacto = candidato.copy()
+        contacto[1:] &= y[1:] <= y[:-1]
+        v = _proyeccion_contacto(v, m_a, contacto)[0]   # choque inelástico de las que se alcanzan
+        a, unido = acel(v, contacto, unido)
+        if trayectorias:
+            fila_x = np.full(N * K, np.nan)
+            fila_v = np.full(N * K, np.nan)
+            fila_a = np.full(N * K, np.nan)
+            fila_x[idx], fila_v[idx], fila_a[idx] = y + delante_a, v, a
+            if pendientes is not None:
+                fila_x[pendientes[0]], fila_v[pendientes[0]], fila_a[pendientes[0]] = delante[pendientes[0]], 0.0, pendientes[1]
+                pendientes = None
+            T.append(t)
+            X.append(fila_x)
+            V.append(fila_v)
+            A.append(fila_a)
+
+        rigidos = rigido_a.any()
+        if rigidos:
+            # Jacobiano del grupo en contacto: (suma kv + 2 kd |vrel|) / (suma m)
+            J = _media_bloques(-(kv_a + 2.0 * kd_a * np.abs(v - vf_a)) / m_a, m_a, unido)
+            f1, f2, f3, f4 = _funciones_phi(dt * J)
+            v2 = v + dt * f1 * a
+            D = acel(v2, contacto, unido)[0] - a - J * (v2 - v)
+            v_exp = v2 + 2.0 * dt * f3 * D
+            y_exp = y + dt * v + dt * dt * (f2 * a + 2.0 * f4 * D)
+
+        k1v = a
+        k1x = v
+        k2v = acel(v + 0.5 * dt * k1v, contacto, unido)[0]
+        k2x = v + 0.5 * dt * k1v
+        k3v = acel(v + 0.5 * dt * k2v, contacto, unido)[0]
+        k3x = v + 0.5 * dt * k2v
+        k4v = acel(v + dt * k3v, contacto, unido)[0]
+        k4x = v + dt * k3v
+
+        v_paso = v
+        v = v + (dt / 6.0) * (k1v + 2.0 * k2v + 2.0 * k3v + k4v)
+        y = y + (dt / 6.0) * (k1x + 2.0 * k2x + 2.0 * k3x + k4x)
+        if rigidos:
+            v = np.where(rigido_a, v_exp, v)
+            y = np.where(rigido_a, y_exp, y)
+        t_paso = t
+        t += dt
+        k += 1
+
+        y = _proyeccion_contacto(y, m_a, candidato)[0]
+        arriba = y > L_a
+        y[arriba] = L_a[arriba]
+        v[arriba] = 0.0
+
+        llegada = y <= 0.0
+        agotado = ~llegada & (t >= tmax_a)
+        fin = llegada | agotado
+        if fin.any():
+            i_lleg = idx[llegada]
+            tiempo[i_lleg] = t_paso
+            velocidad[i_lleg] = v_paso[llegada]
+            llego[i_lleg] = True
+            tiempo[idx[agotado]] = t_ant if k > 1 else np.nan
+            velocidad[idx[agotado]] = v_ant[agotado]
+            pasos[idx[fin]] = k
+
+            if trayectorias and llegada.any():
+                # Aceleración de la pieza sola en reposo en el fondo
+                pendientes = (i_lleg, acel(np.zeros(idx.size), np.zeros(idx.size, dtype=bool))[0][llegada])
+
+            sigue = ~fin
+            idx = idx[sigue]
+            y, v, v_paso, unido = y[sigue], v[sigue], v_paso[sigue], unido[sigue]
+            m_a, vf_a, kv_a, kd_a, Fg_a, L_a, tmax_a, tren_a, delante_a, rigido_a = (
+                c[sigue] for c in (m_a, vf_a, kv_a, kd_a, Fg_a, L_a, tmax_a, tren_a, delante_a, rigido_a))
+            candidato = vecinos(tren_a)
+
+        v_ant = v_paso
+        t_ant = t_paso
+
+    if trayectorias and pendientes is not None:
+        fila_x = np.full(N * K, np.nan)
+        fila_v = np.full(N * K, np.nan)
+        fila_a = np.full(N * K, np.nan)
+        fila_x[pendientes[0]], fila_v[pendientes[0]], fila_a[pendientes[0]] = delante[pendientes[0]], 0.0, pendientes[1]
+        T.append(t)
+        X.append(fila_x)
+        V.append(fila_v)
+        A.append(fila_a)
+
+    if _perfil is not None:
+        _perfil.contar("pasos_tren", int(pasos.max(initial=0)))
+
+    forma = (N, K)
+    resultado = {
+        "tiempo": tiempo.reshape(forma),
+        "velocidad": velocidad.reshape(forma),
+        "fuerza": np.where(pieza, _fuerza_impacto_lote(q), np.nan).reshape(forma),
+        "llego": llego.reshape(forma),
+        "pasos": pasos.reshape(forma),
+    }
+    if trayectorias:
+        # (pasos, N, K): x de la punta de cada pieza, NaN fuera de su vida
+        resultado["T"] = np.asarray(T)
+        for nombre, filas in (("X", X), ("V", V), ("A", A)):
+            resultado[nombre] = np.vstack(filas).reshape((-1,) + forma) if filas else np.empty((0,) + forma)
+    return resultado
+
+def _velocidad_terminal_lote(vf, kv, kd, Fg):
+    # Balance de fuerzas con vrel < 0: kd*v^2 - b*v + c0 = 0, raíz negativa.
+    # Forma estable 2*c0 / (b + sqrt(...)) para evitar cancelación cerca del límite.
+    b = 2.0 * kd * vf + kv
+    c0 = kd * vf**2 + kv * vf + Fg
+    return 2.0 * c0 / (b + np.sqrt(b**2 - 4.0 * kd * c0))
+
+# Cambio automático al integrador exponencial (SimuladorTestigo.integrador_efectivo)
+RIGIDEZ_RK4 = 1.0        # mu dt: por encima RK4 de paso fijo pierde precisión (inestable cerca de 2.79)
+RK45_ESTABILIDAD = 3.3   # |h J| máximo estable de Dormand–Prince sobre el eje real negativo
+RIGIDEZ_RK45 = 1000      # pasos de rk45 impuestos solo por la estabilidad
+
+def _rigidez_lote(p, g=9.81, reologia=None):
+    # mu = max |da/dv| = (kv + 2 kd max|vrel|) / m sobre el descenso, y el tiempo
+    # L / |v_t| que dura el tramo a velocidad terminal (0 si no desciende).
+    # Con reología kv = Alat escala dtau_w/dG, la mayor entre la partida (si
+    # hay caudal) y la velocidad terminal
+    m, vf, kv, kd, Fg = _coeficientes_lote(p, g)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if reologia is None:
+            baja = Fg + kv * vf + kd * vf**2 < 0.0
+            v_t = np.where(baja, _velocidad_terminal_lote(vf, kv, kd, Fg), 0.0)
+        else:
+            Alat = np.pi * p["d_t"] * p["longitud_testigo_m"]
+            escala = _escala_corte_lote(p)
+            baja = Fg + Alat * reologia.esfuerzo(escala * np.abs(vf)) + kd * vf**2 < 0.0
+            v_t = np.where(baja, reologia.velocidad_terminal(vf, escala, Alat, kd, Fg), 0.0)
+            inicio = np.where(vf > 0.0, reologia.pendiente(escala * np.abs(vf)), 0.0)
+            final = np.where(baja, reologia.pendiente(escala * np.abs(v_t - vf)), 0.0)
+            kv = Alat * escala * np.maximum(inicio, final)
+        tiempo = np.where(baja, p["longitud_pozo_m"] / np.abs(v_t), 0.0)
+    mu = (kv + 2.0 * kd * np.maximum(np.abs(vf), np.abs(v_t - vf))) / m
+    return mu, tiempo
+
+# Coeficientes de Taylor de phi_k(z) = sum_j z^j / (j + k)!, k = 1..4
+_TAYLOR_PHI = [np.array([1.0 / math.factorial(j + k) for j in range(18)])[::-1] for k in range(1, 5)]
+
+def _funciones_phi(z):
+    # phi_1..phi_4 de z = h J <= 0 (escalar o arreglo); serie cerca de 0, donde
+    # la recurrencia phi_{k+1} = (phi_k - 1/k!) / z pierde dígitos
+    z = np.asarray(z, dtype=float)
+    cerca = np.abs(z) < 1.0
+    zr = np.where(cerca, 1.0, z)
+    f = [np.expm1(zr) / zr]
+    for k in range(1, 4):
+        f.append((f[-1] - 1.0 / math.factorial(k)) / zr)
+    if cerca.any():
+        for k, coef in enumerate(_TAYLOR_PHI):
+            f[k] = np.where(cerca, np.polyval(coef, z), f[k])
+    return tuple(f)
+
+def _gauss_legendre(n):
+    nodos, pesos = np.polynomial.legendre.leggauss(n)
+    return 0.5 * (nodos + 1.0), 0.5 * pesos   # en [0, 1]
+
+def _integrales_descenso(W, v_t, m, vf, kv, kd, Fg, s, pesos):
+    # Tiempo T(W) y desplazamiento D(W) (negativo) integrando w en [0, W]
+    w = W * s
+    e = np.exp(-w)
+    v = v_t * (1.0 - e)
+    vrel = v - vf
+    a = (Fg - kv * vrel - kd * vrel * np.abs(vrel)) / m
+    # Con v_t ~ 0 (justo en el límite) a puede redondear a 0: tiempo infinito
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dt_dw = v_t * e / a
+    return W[:, 0] * (dt_dw @ pesos), W[:, 0] * ((v * dt_dw) @ pesos)
+
+def simular_analitico(parametros, n_nodos=48, delta=1e-12, iteraciones=60):
+    # Sin paso de tiempo: como a depende solo de v, t y x son integrales en v.
+    # Con w = -ln(1 - v/v_t), dt = v_t e^-w / a(v) dw y dx = v dt, integrandos
+    # suaves hasta v_t; se integra el transitorio hasta w = ln(1/delta) y el
+    # resto del pozo se recorre a velocidad terminal.
+    p = np.atleast_1d(np.asarray(parametros, dtype=PARAMETROS_LOTE))
+    m, vf, kv, kd, Fg = _coeficientes_lote(p)
+    L = p["longitud_pozo_m"].astype(float)
+    t_max = p["tiempo_max_simulacion_seg"].astype(float)
+    n = p.shape[0]
+
+    tiempo = np.full(n, np.inf)
+    velocidad = np.zeros(n)
+    terminal = np.full(n, np.nan)
+
+    # Solo desciende si en reposo (v = 0, tope del pozo) la aceleración es negativa
+    a0 = (Fg + kv * vf + kd * vf**2) / m
+    idx = np.flatnonzero((a0 < 0.0) & (L > 0.0))
+
+    if idx.size:
+        coef = tuple(c[idx, None] for c in (m, vf, kv, kd, Fg))
+        v_t = _velocidad_terminal_lote(*coef[1:])
+        L_ = L[idx]
+        s, pesos = _gauss_legendre(n_nodos)
+
+        W_max = np.full((idx.size, 1), np.log(1.0 / delta))
+        T_tr, D_tr = _integrales_descenso(W_max, v_t, *coef, s, pesos)
+
+        # Transitorio completo: el resto del pozo se recorre a velocidad terminal
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t_arr = T_tr + (L_ + D_tr) / np.abs(v_t[:, 0])
+        v_arr = v_t[:, 0].copy()
+
+        # Llegada durante el transitorio: bisección en w sobre D(w) = -L
+        j = np.flatnonzero(-D_tr >= L_)
+        if j.size:
+            coef_j = tuple(c[j] for c in coef)
+            lo = np.zeros((j.size, 1))
+            hi = W_max[j].copy()
+            for _ in range(iteraciones):
+                mid = 0.5 * (lo + hi)
+                _, D = _integrales_descenso(mid, v_t[j], *coef_j, s, pesos)
+                corto = (-D < L_[j])[:, None]
+                lo = np.where(corto, mid, lo)
+                hi = np.where(corto, hi, mid)
+            t_arr[j], _ = _integrales_descenso(hi, v_t[j], *coef_j, s, pesos)
+            v_arr[j] = v_t[j, 0] * (1.0 - np.exp(-hi[:, 0]))
+
+        tiempo[idx] = np.where(np.isnan(t_arr), np.inf, t_arr)
+        velocidad[idx] = v_arr
+        terminal[idx] = v_t[:, 0]
+
+    return {
+        "tiempo": tiempo,
+        "velocidad": velocidad,
+        "terminal": terminal,
+        "fuerza": _fuerza_impacto_lote(p),
+        "llego": tiempo <= t_max,
+    }
+
+# Rangos de búsqueda por defecto del solver inverso
+RANGOS_OPERACION = {"caudal_lpm": (0.0, 200.0), "viscosidad_marsh_seg": (25.0, 150.0)}
+
+def _metrica_operacion(p, objetivo):
+    r = simular_analitico(p)
+    if objetivo == "tiempo":
+        return r["tiempo"]
+    if objetivo == "fuerza":
+        return -r["fuerza"]   # fuerza de impacto positiva al descender
+    raise ValueError(f"Objetivo desconocido: {objetivo}")
+
+def resolver_operacion(parametros, variable, objetivo, limite, rango=None, candidatos=64, iteraciones=5):
+    # Punto de operación límite de `variable` (caudal_lpm o viscosidad_marsh_seg)
+    # para que `objetivo` no supere `limite`:
+    #   "tiempo": tiempo de llegada <= limite; crece con caudal y viscosidad,
+    #             se busca el mayor valor admisible.
+    #   "fuerza": fuerza de impacto <= limite (kg); decrece con caudal y viscosidad,
+    #             se busca el menor valor admisible.
+    # Búsqueda por secciones: en cada iteración se evalúan `candidatos` valores
+    # por caso en una sola llamada vectorizada y se conserva el tramo del cambio.
+    p = np.atleast_1d(np.asarray(parametros, dtype=PARAMETROS_LOTE))
+    n = p.shape[0]
+    limite = np.broadcast_to(np.asarray(limite, dtype=float), (n,))
+    rango = RANGOS_OPERACION[variable] if rango is None else rango
+    maximo = objetivo == "tiempo"
+
+    lo = np.full(n, float(rango[0]))
+    hi = np.full(n, float(rango[1]))
+    ninguno = np.zeros(n, dtype=bool)
+    en_borde = np.zeros(n, dtype=bool)
+    s = np.linspace(0.0, 1.0, candidatos)
+    filas = np.arange(n)
+
+    for k in range(iteraciones):
+        x = lo[:, None] + (hi - lo)[:, None] * s
+        q = np.repeat(p, candidatos)
+        q[variable] = x.ravel()
+        ok = (_metrica_operacion(q, objetivo) <= np.repeat(limite, candidatos)).reshape(n, candidatos)
+        # Monótono: admisibles al principio (máximo) o al final (mínimo) de la grilla
+        j = ok.sum(axis=1) if maximo else candidatos - ok.sum(axis=1)
+        if k == 0:
+            ninguno = ok.sum(axis=1) == 0
+            en_borde = ok.all(axis=1)
+        j = np.clip(j, 1, candidatos - 1)
+        lo, hi = x[filas, j - 1], x[filas, j]
+
+    valor = np.where(maximo, lo, hi)
+    valor = np.where(en_borde, rango[1] if maximo else rango[0], valor)
+    valor = np.where(ninguno, np.nan, valor)
+
+    # Sensibilidad d(métrica)/d(variable) del lado admisible
+    h = 1e-4 * (rango[1] - rango[0])
+    q = np.repeat(p, 2)
+    q[variable] = np.column_stack([valor, valor - h if maximo else valor + h]).ravel()
+    m = _metrica_operacion(q, objetivo).reshape(n, 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sensibilidad = (m[:, 0] - m[:, 1]) / (h if maximo else -h)
+        dvalor_dlimite = 1.0 / sensibilidad
+
+    return {
+        "valor": valor,
+        "metrica": m[:, 0],
+        "sensibilidad": sensibilidad,
+        "dvalor_dlimite": dvalor_dlimite,
+        "sin_solucion": ninguno,
+        "en_borde": en_borde & ~ninguno,
+        "maximo": maximo,
+    }
+
+# Ejes por defecto de las tablas de operación: [desde, hasta, paso], inclusive
+EJES_TABLA = {"angulo_deg": [0, 90, 1], "caudal_lpm": [0, 200, 2], "viscosidad_marsh_seg": [25, 150, 1]}
+# Campos tabulados y ejes de los que dependen (fuerza y ángulo crítico no dependen del ángulo).
+# El tiempo se guarda como 1/tiempo: tiende a 0 de forma suave en el límite donde
+# el testigo deja de descender y se interpola mucho mejor que el tiempo mismo.
+CAMPOS_TABLA = {
+    "tiempo": ("angulo_deg", "caudal_lpm", "viscosidad_marsh_seg"),
+    "velocidad": ("angulo_deg", "caudal_lpm", "viscosidad_marsh_seg"),
+    "terminal": ("angulo_deg", "caudal_lpm", "viscosidad_marsh_seg"),
+    "fuerza": ("caudal_lpm", "viscosidad_marsh_seg"),
+    "angulo_critico": ("caudal_lpm", "viscosidad_marsh_seg"),
+}
+
+def construir_tabla(ruta, diametro, config, ejes=None):
+    # Evalúa el modelo analítico en la grilla (ángulo x caudal x viscosidad) con
+    # el resto de los parámetros de la entrada y guarda un .npy por campo en
+    # `ruta`. Se escribe por cortes de ángulo directamente al archivo.
+    ejes = dict(EJES_TABLA, **(ejes or config.get("tabla", {})))
+    valores = {}
+    for nombre in EJES_TABLA:
+        desde, hasta, paso = ejes[nombre]
+        n = int(round((hasta - desde) / paso)) + 1
+        if n < 2:
+            raise ValueError(f"El eje {nombre} de la tabla necesita al menos dos puntos: {ejes[nombre]}")
+        valores[nombre] = desde + paso * np.arange(n)
+
+    os.makedirs(ruta, exist_ok=True)
+    A, Q, M = (valores[nombre] for nombre in EJES_TABLA)
+    forma = {campo: tuple(len(valores[e]) for e in ejes_campo) for campo, ejes_campo in CAMPOS_TABLA.items()}
+    salida = {campo: np.lib.format.open_memmap(os.path.join(ruta, f"{campo}.npy"), mode="w+", dtype=np.float64, shape=f)
+              for campo, f in forma.items()}
+
+    base = parametros_lote([(diametro, config)])
+    corte = np.repeat(base, len(Q) * len(M))
+    corte["caudal_lpm"] = np.repeat(Q, len(M))
+    corte["viscosidad_marsh_seg"] = np.tile(M, len(Q))
+    for i, angulo in enumerate(A):
+        corte["angulo_deg"] = angulo
+        r = simular_analitico(corte)
+        salida["tiempo"][i] = (1.0 / r["tiempo"]).reshape(len(Q), len(M))
+        for campo in ("velocidad", "terminal"):
+            salida[campo][i] = r[campo].reshape(len(Q), len(M))
+    salida["fuerza"][:] = r["fuerza"].reshape(len(Q), len(M))
+    sim = SimuladorTestigo(config, diametro)
+    salida["angulo_critico"][:] = sim.curvas_angulo_critico(M, Q).T
+    for datos in salida.values():
+        datos.flush()
+    del salida
+
+    meta = {
+        "diametro": diametro,
+        "version": VERSION_MODELO,
+        "ejes": {nombre: [float(v[0]), float(v[1] - v[0]), len(v)] for nombre, v in valores.items()},
+        "campos": {campo: list(ejes_campo) for campo, ejes_campo in CAMPOS_TABLA.items()},
+        "parametros": {k: float(base[k][0]) for k in PARAMETROS_LOTE.names if k not in EJES_TABLA},
+    }
+    with open(os.path.join(ruta, "tabla.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    return TablaOperacion(ruta)
+
+class TablaOperacion:
+    # Tabla precalculada por construir_tabla. Los .npy se abren como memmap
+    # recién al consultar cada campo: solo se leen las celdas usadas.
+    def __init__(self, ruta):
+        self.ruta = ruta
+        with open(os.path.join(ruta, "tabla.json")) as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != VERSION_MODELO:
+            raise ValueError(f"La tabla {ruta} es de otra versión del modelo; vuelva a construirla.")
+        self.ejes = {nombre: tuple(e) for nombre, e in self.meta["ejes"].items()}
+        self._datos = {}
+
+    def rango(self, eje):
+        desde, paso, n = self.ejes[eje]
+        return desde, desde + paso * (n - 1)
+
+    def datos(self, campo):
+        if campo not in self._datos:
+            self._datos[campo] = np.load(os.path.join(self.ruta, f"{campo}.npy"), mmap_mode="r")
+        return self._datos[campo]
+
+    def _celda(self, eje, x):
+        desde, paso, n = self.ejes[eje]
+        u = (x - desde) / paso
+        if not -1e-9 <= u <= n - 1 + 1e-9:
+            raise ValueError(f"{eje} = {x} fuera de la tabla {self.rango(eje)}; no se extrapola.")
+        i = min(max(int(u), 0), n - 2)
+        return i, min(max(u - i, 0.0), 1.0)
+
+    def interpolar(self, campo, angulo_deg, caudal_lpm, viscosidad_marsh_seg):
+        # Interpolación multilineal de un punto. Una esquina con peso nulo no
+        # participa, así un tiempo infinito (no desciende) solo se propaga si
+        # el punto está en una celda que lo toca.
+        punto = {"angulo_deg": angulo_deg, "caudal_lpm": caudal_lpm, "viscosidad_marsh_seg": viscosidad_marsh_seg}
+        datos = self.datos(campo)
+        celdas = [self._celda(eje, float(punto[eje])) for eje in self.meta["campos"][campo]]
+        total = 0.0
+        for esquina in range(1 << len(celdas)):
+            w = 1.0
+            idx = []
+            for k, (i, f) in enumerate(celdas):
+                if esquina >> k & 1:
+                    w *= f
+                    idx.append(i + 1)
+                else:
+                    w *= 1.0 - f
+                    idx.append(i)
+            if w > 0.0:
+                total += w * datos.item(*idx)
+        if campo == "tiempo":
+            return 1.0 / total if total > 0.0 else float("inf")
+        return total
+
+    def interpolar_lote(self, campo, angulo_deg, caudal_lpm, viscosidad_marsh_seg):
+        # Igual que interpolar, para arreglos de puntos
+        punto = {"angulo_deg": angulo_deg, "caudal_lpm": caudal_lpm, "viscosidad_marsh_seg": viscosidad_marsh_seg}
+        datos = self.datos(campo)
+        ejes_campo = self.meta["campos"][campo]
+        xs = np.broadcast_arrays(*(np.asarray(punto[eje], dtype=float) for eje in ejes_campo))
+        celdas = []
+        for eje, x in zip(ejes_campo, xs):
+            desde, paso, n = self.ejes[eje]
+            u = (x - desde) / paso
+            if np.any(~((u >= -1e-9) & (u <= n - 1 + 1e-9))):
+                raise ValueError(f"{eje} fuera de la tabla {self.rango(eje)}; no se extrapola.")
+            i = np.clip(np.floor(u).astype(np.intp), 0, n - 2)
+            celdas.append((i, np.clip(u - i, 0.0, 1.0)))
+        total = np.zeros(xs[0].shape)
+        for esquina in range(1 << len(celdas)):
+            w = np.ones(xs[0].shape)
+            idx = []
+            for k, (i, f) in enumerate(celdas):
+                arriba = esquina >> k & 1
+                w = w * (f if arriba else 1.0 - f)
+                idx.append(i + arriba)
+            v = datos[tuple(idx)]
+            with np.errstate(invalid="ignore"):
+                total += np.where(w > 0.0, w * v, 0.0)
+        if campo == "tiempo":
+            with np.errstate(divide="ignore"):
+                return 1.0 / total
+        return total
+
+    def consultar(self, angulo_deg, caudal_lpm, viscosidad_marsh_seg):
+        return {campo: self.interpolar(campo, angulo_deg, caudal_lpm, viscosidad_marsh_seg)
+                for campo in self.meta["campos"]}
+
+# Márgenes de descenso para mapa_limite: > 0 el testigo no baja, < 0 baja
+def _margen_reposo_lote(p, g=9.81):
+    # Aceleración en reposo en el tope, en g (el criterio de simular_analitico)
+    m, vf, kv, kd, Fg = _coeficientes_lote(p, g)
+    return (Fg + kv * vf + kd * vf**2) / (m * g)
+
+def _margen_llegada_lote(p, g=9.81):
+    # Llegada dentro del tiempo máximo: (t - t_max) / (t + t_max), 1 si no baja
+    tiempo = simular_analitico(p)["tiempo"]
+    t_max = p["tiempo_max_simulacion_seg"]
+    with np.errstate(invalid="ignore"):
+        return np.where(np.isinf(tiempo), 1.0, (tiempo - t_max) / (tiempo + t_max))
+
+CRITERIOS_MAPA = {"reposo": _margen_reposo_lote, "llegada": _margen_llegada_lote}
+
+def _subir_resolucion(grilla):
+    # Duplica la resolución de una grilla de vértices por interpolación lineal en cada eje
+    for eje in range(grilla.ndim):
+        g = np.moveaxis(grilla, eje, 0)
+        nueva = np.empty((2 * g.shape[0] - 1,) + g.shape[1:])
+        nueva[::2] = g
+        nueva[1::2] = 0.5 * (g[:-1] + g[1:])
+        grilla = np.moveaxis(nueva, 0, eje)
+    return grilla
+
+def _contornos(celdas, valores, lado):
+    # Marching squares sobre las celdas (k, 2) de lado `lado` con valores de
+    # esquina (k, 4) en orden (0,0), (1,0), (1,1), (0,1). Los tramos se unen por
+    # la arista de la red que comparten: una polilínea por componente.
+    esquinas = np.array([[0, 0], [1, 0], [1, 1], [0, 1]])
+    aristas = []   # por celda: lista de (clave de arista, punto)
+    for c, v in zip(celdas.tolist(), valores.tolist()):
+        cortes = []
+        for k in range(4):
+            a, b = v[k], v[(k + 1) % 4]
+            if (a > 0.0) == (b > 0.0):
+                continue
+            pa = (c[0] + lado * esquinas[k][0], c[1] + lado * esquinas[k][1])
+            pb = (c[0] + lado * esquinas[(k + 1) % 4][0], c[1] + lado * esquinas[(k + 1) % 4][1])
+            s = a / (a - b)
+            punto = (pa[0] + s * (pb[0] - pa[0]), pa[1] + s * (pb[1] - pa[1]))
+            cortes.append((min(pa, pb) + max(pa, pb), punto))
+        if len(cortes) == 4 and (sum(v) / 4 > 0.0) != (v[0] > 0.0):
+            # Punto de silla: el centro decide qué pares de aristas se unen
+            cortes = cortes[1:] + cortes[:1]
+        for i in range(0, len(cortes) - 1, 2):
+            aristas.append((cortes[i], cortes[i + 1]))
+
+    vecinos = collections.defaultdict(list)
+    for i, (a, b) in enumerate(aristas):
+        vecinos[a[0]].append(i)
+        vecinos[b[0]].append(i)
+    usados = [False] * len(aristas)
+    polilineas = []
+
+    def extender(clave, linea):
+        while True:
+            siguientes = [j for j in vecinos[clave] if not usados[j]]
+            if not siguientes:
+                return
+            j = siguientes[0]
+            usados[j] = True
+            a, b = aristas[j]
+            otro = b if a[0] == clave else a
+            linea.append(otro[1])
+            clave = otro[0]
+
+    # Primero desde los extremos (tramos que tocan el borde), después los cerrados
+    orden = sorted(range(len(aristas)), key=lambda i: min(len(vecinos[aristas[i][0][0]]), len(vecinos[aristas[i][1][0]])))
+    for i in orden:
+        if usados[i]:
+            continue
+        usados[i] = True
+        a, b = aristas[i]
+        if len(vecinos[b[0]]) == 1:
+            a, b = b, a
+        linea = [a[1], b[1]]
+        extender(b[0], linea)
+        atras = []
+        extender(a[0], atras)
+        polilineas.append(np.array(atras[::-1] + linea))
+    return polilineas
+
+def mapa_limite(p, ejes, criterio="reposo", tolerancia=1e-3, base=8, resolucion=None):
+    # Borde "el testigo no baja" en 2 o 3 ejes ({campo: (desde, hasta)}) con
+    # refinamiento adaptativo: se parte de una grilla de base^d celdas y en cada
+    # nivel solo se dividen las celdas con cambio de signo del margen en sus
+    # esquinas (y sus vecinas por cara, para no perder tramos que entran y salen
+    # por una misma arista), hasta que la celda mide tolerancia * rango de cada eje.
+    # Las esquinas ya evaluadas se reutilizan; cada nivel se evalúa en un solo lote.
+    # Devuelve el mapa de calor del margen (vértices, resolución <= resolucion),
+    # las polilíneas del borde (solo en 2 ejes) y el número de evaluaciones.
+    p = np.atleast_1d(np.asarray(p, dtype=PARAMETROS_LOTE))[:1]
+    campos = list(ejes)
+    d = len(campos)
+    if d not in (2, 3):
+        raise ValueError("mapa_limite admite 2 o 3 ejes.")
+    margen = CRITERIOS_MAPA[criterio]
+    resolucion = resolucion or (512 if d == 2 else 128)
+    niveles = max(int(np.ceil(np.log2(1.0 / (base * tolerancia)))), 0)
+    N = base * 2**niveles                       # celdas por eje en el nivel más fino
+    desde = np.array([ejes[c][0] for c in campos], dtype=float)
+    paso = (np.array([ejes[c][1] for c in campos], dtype=float) - desde) / N
+
+    pesos = (N + 1) ** np.arange(d)             # índice lineal de un vértice de la red fina
+    evaluados = np.empty(0, dtype=np.int64)
+    valores = np.empty(0)
+
+    def evaluar(vertices):
+        nonlocal evaluados, valores
+        lineales = vertices @ pesos
+        nuevos = np.unique(lineales[~np.isin(lineales, evaluados)])
+        if nuevos.size:
+            q = np.repeat(p, nuevos.size)
+            coordenadas = (nuevos[:, None] // pesos) % (N + 1)
+            for k, campo in enumerate(campos):
+                q[campo] = desde[k] + paso[k] * coordenadas[:, k]
+            evaluados = np.concatenate([evaluados, nuevos])
+            valores = np.concatenate([valores, margen(q)])
+            orden = np.argsort(evaluados, kind="stable")
+            evaluados, valores = evaluados[orden], valores[orden]
+        return valores[np.searchsorted(evaluados, lineales)]
+
+    esquinas = np.array(list(itertools.product((0, 1), repeat=d)))
+    if d == 2:
+        esquinas = esquinas[[0, 2, 3, 1]]       # (0,0), (1,0), (1,1), (0,1): orden de marching squares
+    vecindad = np.vstack([np.zeros(d, dtype=int), np.eye(d, dtype=int), -np.eye(d, dtype=int)])   # vecinas por cara
+
+    lado = 2**niveles
+    celdas = np.array(list(itertools.product(range(base), repeat=d))) * lado
+    mixtas = celdas[:0]
+    for nivel in range(niveles + 1):
+        v = evaluar((celdas[:, None, :] + esquinas * lado).reshape(-1, d)).reshape(len(celdas), -1)
+        mixta = np.any(v > 0.0, axis=1) & np.any(v <= 0.0, axis=1)
+        mixtas, v_mixtas = celdas[mixta], v[mixta]
+        if nivel == niveles:
+            break
+        dividir = (mixtas[:, None, :] + vecindad * lado).reshape(-1, d)
+        dividir = np.unique(dividir[np.all((dividir >= 0) & (dividir <= N - lado), axis=1)], axis=0)
+        lado //= 2
+        celdas = (dividir[:, None, :] + esquinas * lado).reshape(-1, d)
+
+    # Mapa de calor: la grilla gruesa completa se sube de resolución nivel a nivel
+    # y se reemplaza por los vértices evaluados que caen en ella
+    coordenadas = (evaluados[:, None] // pesos) % (N + 1)
+    paso_grilla = 2**niveles
+    grilla = None
+    while True:
+        n = N // paso_grilla + 1
+        grilla = np.zeros((n,) * d) if grilla is None else _subir_resolucion(grilla)
+        en_grilla = np.all(coordenadas % paso_grilla == 0, axis=1)
+        grilla[tuple((coordenadas[en_grilla] // paso_grilla).T)] = valores[en_grilla]
+        if paso_grilla == 1 or 2 * n - 1 > resolucion + 1:
+            break
+        paso_grilla //= 2
+
+    resultado = {
+        "ejes": campos,
+        "coordenadas": [desde[k] + paso[k] * paso_grilla * np.arange(grilla.shape[k]) for k in range(d)],
+        "mapa": grilla,                           # grilla[i, j(, k)] en (eje 0, eje 1(, eje 2))
+        "evaluaciones": int(evaluados.size),
+        "uniforme": (N + 1)**d,
+        "celdas_borde": desde + paso * (mixtas + 0.5 * lado),
+    }
+    if d == 2:
+        resultado["contornos"] = [desde + paso * linea for linea in _contornos(mixtas, v_mixtas, lado)]
+    return resultado
+
+# Parámetros con sensibilidad en sensibilidades_lote
+CAMPOS_SENSIBILIDAD = ("caudal_lpm", "viscosidad_marsh_seg", "densidad_roca_kgm3", "densidad_fluido_kgm3",
+                       "coef_arrastre", "longitud_testigo_m", "angulo_deg")
+
+def _derivadas_coeficientes_lote(p, campos, g=9.81):
+    # d(m, vf, kv, kd, Fg)/d(campo) de _coeficientes_lote, forma (5, campos, n)
+    r1 = p["d_t"] / 2
+    r2 = p["d_b"] / 2
+    Af = np.pi * r1**2
+    Aa = np.pi * (r2**2 - r1**2)
+    Lc = p["longitud_testigo_m"]
+    V = Af * Lc
+    rho_c = p["densidad_roca_kgm3"]
+    rho_f = p["densidad_fluido_kgm3"]
+    theta = np.radians(p["angulo_deg"])
+    mu = 1.1 * (p["viscosidad_marsh_seg"] - 25) / 1000
+    corte = 8.0 * np.pi / (1.0 - (r1 / r2)**2)   # kv = corte * mu * Lc
+    cero = np.zeros(len(p))
+    derivadas = {
+        "caudal_lpm": (cero, 1.0 / (60000 * Aa), cero, cero, cero),
+        "viscosidad_marsh_seg": (cero, cero, corte * Lc * 1.1 / 1000, cero, cero),
+        "densidad_roca_kgm3": (V, cero, cero, cero, -V * g * np.sin(theta)),
+        "densidad_fluido_kgm3": (cero, cero, cero, 0.5 * p["coef_arrastre"] * Af, V * g * np.sin(theta)),
+        "coef_arrastre": (cero, cero, cero, 0.5 * rho_f * Af, cero),
+        "longitud_testigo_m": (rho_c * Af, cero, corte * mu, cero, (rho_f - rho_c) * Af * g * np.sin(theta)),
+        "angulo_deg": (cero, cero, cero, cero, (rho_f - rho_c) * V * g * np.cos(theta) * np.pi / 180),
+    }
+    return np.array([derivadas[c] for c in campos]).transpose(1, 0, 2)
+
+def sensibilidades_lote(parametros, dt=0.01, campos=CAMPOS_SENSIBILIDAD):
+    # RK4 de simular_lote sobre el sistema aumentado con las ecuaciones
+    # tangentes respecto de los cinco coeficientes c = (m, vf, kv, kd, Fg)
+    # de _coeficientes_lote (X = dx/dc, W = dv/dc):
+    #   X' = W,  W' = da/dv * W + da/dc
+    # La llegada se ubica interpolando dentro del último paso,
+    #   dT/dc = -X(T) / v(T),  dv_final/dc = W(T) + a(T) * dT/dc
+    # y la regla de la cadena con dc/dp da todos los parámetros: el costo no
+    # depende de cuántos se pidan.
+    p = np.atleast_1d(np.asarray(parametros, dtype=PARAMETROS_LOTE))
+    n = p.shape[0]
+    coef = _coeficientes_lote(p)
+    L = p["longitud_pozo_m"].astype(float)
+    t_max = p["tiempo_max_simulacion_seg"].astype(float)
+
+    def acel(v_, W_, sel=slice(None)):
+        m, vf, kv, kd, Fg = (c[sel] for c in coef_a)
+        vrel = v_ - vf
+        arrastre = vrel * np.abs(vrel)
+        a_ = (Fg - kv * vrel - kd * arrastre) / m
+        rigidez = kv + 2.0 * kd * np.abs(vrel)
+        da = -rigidez * W_
+        da[0] -= a_
+        da[1] += rigidez
+        da[2] -= vrel
+        da[3] -= arrastre
+        da[4] += 1.0
+        return a_, da / m
+
+    tiempo = np.full(n, np.nan)
+    velocidad = np.full(n, np.nan)
+    llego = np.zeros(n, dtype=bool)
+    dT = np.full((5, n), np.nan)
+    dV = np.full((5, n), np.nan)
+
+    idx = np.flatnonzero((L > 0.0) & (t_max > 0.0))
+    x = L[idx].copy()
+    v = np.zeros(idx.size)
+    X = np.zeros((5, idx.size))
+    W = np.zeros((5, idx.size))
+    coef_a = tuple(c[idx] for c in coef)
+    L_a, tmax_a = L[idx], t_max[idx]
+    t = 0.0
+
+    while idx.size:
+        k1v, K1W = acel(v, W)
+        k2v, K2W = acel(v + 0.5 * dt * k1v, W + 0.5 * dt * K1W)
+        k3v, K3W = acel(v + 0.5 * dt * k2v, W + 0.5 * dt * K2W)
+        k4v, K4W = acel(v + dt * k3v, W + dt * K3W)
+        # Etapas de x: k1x = v, k2x = v + dt/2 k1v, ... (ídem X con W)
+        x_n = x + (dt / 6.0) * (6.0 * v + dt * (k1v + k2v + k3v))
+        X_n = X + (dt / 6.0) * (6.0 * W + dt * (K1W + K2W + K3W))
+        v_n = v + (dt / 6.0) * (k1v + 2.0 * k2v + 2.0 * k3v + k4v)
+        W_n = W + (dt / 6.0) * (K1W + 2.0 * K2W + 2.0 * K3W + K4W)
+
+        # Tope del pozo: estado y tangentes fijos
+        arriba = x_n > L_a
+        x_n[arriba] = L_a[arriba]
+        v_n[arriba] = 0.0
+        X_n[:, arriba] = 0.0
+        W_n[:, arriba] = 0.0
+
+        llegada = x_n <= 0.0
+        if llegada.any():
+            i = idx[llegada]
+            s = x[llegada] / (x[llegada] - x_n[llegada])
+            v_T = v[llegada] + s * (v_n[llegada] - v[llegada])
+            X_T = X[:, llegada] + s * (X_n[:, llegada] - X[:, llegada])
+            W_T = W[:, llegada] + s * (W_n[:, llegada] - W[:, llegada])
+            a_T, _ = acel(v_T, W_T, llegada)
+            tiempo[i] = t + s * dt
+            velocidad[i] = v_T
+            llego[i] = True
+            dT[:, i] = -X_T / v_T
+            dV[:, i] = W_T + a_T * dT[:, i]
+
+        t += dt
+        sigue = ~llegada & (t < tmax_a)
+        if not sigue.all():
+            idx = idx[sigue]
+            coef_a = tuple(c[sigue] for c in coef_a)
+            L_a, tmax_a = L_a[sigue], tmax_a[sigue]
+        x, v, X, W = x_n[sigue], v_n[sigue], X_n[:, sigue], W_n[:, sigue]
+
+    dcoef = _derivadas_coeficientes_lote(p, campos)
+    return {
+        "tiempo": tiempo,
+        "velocidad": velocidad,
+        "llego": llego,
+        "dtiempo": dict(zip(campos, np.einsum("jn,jkn->kn", dT, dcoef))),
+        "dvelocidad": dict(zip(campos, np.einsum("jn,jkn->kn", dV, dcoef))),
+    }
+
+# Campos del JSON que admiten incertidumbre en "monte_carlo"
+CAMPOS_MONTE_CARLO = ("densidad_roca_kgm3", "densidad_fluido_kgm3", "viscosidad_marsh_seg", "caudal_lpm")
+
+def _muestrear(rng, spec, n):
+    if isinstance(spec, (int, float)):
+        return np.full(n, float(spec))
+    tipo = spec["distribucion"]
+    if tipo == "normal":
+        x = rng.normal(spec["media"], spec["desviacion"], n)
+    elif tipo == "uniforme":
+        x = rng.uniform(spec["min"], spec["max"], n)
+    elif tipo == "triangular":
+        x = rng.triangular(spec["min"], spec["moda"], spec["max"], n)
+    elif tipo == "lognormal":
+        # media y desviación de la variable, no de su logaritmo
+        s2 = np.log(1 + (spec["desviacion"] / spec["media"])**2)
+        x = rng.lognormal(np.log(spec["media"]) - 0.5 * s2, np.sqrt(s2), n)
+    else:
+        raise ValueError(f"Distribución desconocida: {tipo}")
+    return np.clip(x, spec.get("min", -np.inf), spec.get("max", np.inf))
+
+def simular_monte_carlo(diametro, config):
+    # Propagación de incertidumbre con el solver analítico, por bloques de
+    # tamaño fijo; cada bloque usa su propio generador derivado de la semilla.
+    mc = config["monte_carlo"]
+    n = int(mc.get("muestras", 100000))
+    bloque = int(mc.get("bloque", 50000))
+    percentiles = mc.get("percentiles", [5, 50, 95])
+    base = parametros_lote([(diametro, config)])
+
+    n_bloques = -(-n // bloque)
+    semillas = np.random.SeedSequence(mc.get("semilla")).spawn(n_bloques)
+    tiempo = np.empty(n)
+    terminal = np.empty(n)
+    fuerza = np.empty(n)
+    for k, semilla in enumerate(semillas):
+        i0 = k * bloque
+        i1 = min(n, i0 + bloque)
+        rng = np.random.default_rng(semilla)
+        p = np.repeat(base, i1 - i0)
+        for campo in CAMPOS_MONTE_CARLO:
+            if campo in mc:
+                p[campo] = _muestrear(rng, mc[campo], i1 - i0)
+        r = simular_analitico(p)
+        tiempo[i0:i1] = r["tiempo"]
+        terminal[i0:i1] = r["terminal"]
+        fuerza[i0:i1] = r["fuerza"]
+
+    baja = np.isfinite(tiempo)
+    resumen = {
+        "muestras": n,
+        "prob_no_desciende": float(1.0 - baja.mean()),
+        "prob_no_llega": float(np.mean(tiempo > base["tiempo_max_simulacion_seg"][0])),
+        "percentiles": list(percentiles),
+    }
+    for nombre, valores in (("tiempo", tiempo[baja]), ("velocidad_terminal", terminal[baja]), ("fuerza", fuerza)):
+        if valores.size:
+            resumen[nombre] = [float(x) for x in np.percentile(valores, percentiles)]
+        else:
+            resumen[nombre] = [float("nan")] * len(percentiles)
+    return resumen
+
+def _angulo_critico_lote(p, g=9.81, reologias=None):
+    # Igual que SimuladorTestigo.curvas_angulo_critico, un valor por caso
+    # (con reologias, como NucleoFisico.angulo_critico_fluido)
+    q = p.copy()
+    q["angulo_deg"] = 90.0
+    _, vf, kv, kd, Fg = _coeficientes_lote(q, g)
+    corte = kv * vf
+    if reologias is not None:
+        escala = _escala_corte_lote(p)
+        Alat = np.pi * p["d_t"] * p["longitud_testigo_m"]
+        for i, reologia in enumerate(reologias):
+            if reologia is not None:
+                corte[i] = np.sign(vf[i]) * Alat[i] * reologia.esfuerzo(escala[i] * np.abs(vf[i]))
+    sin_theta = np.clip((corte + kd * vf**2) / -Fg, -1.0, 1.0)
+    return np.maximum(np.degrees(np.arcsin(sin_theta)), 0.0)
+
+def _viscosidad_critica_lote(p, g=9.81):
+    # Igual que SimuladorTestigo.curvas_viscosidad_critica, un valor por caso
+    q = p.copy()
+    q["viscosidad_marsh_seg"] = 25 + 1000 / 1.1   # mu = 1 Pa·s: kv por unidad de mu
+    _, vf, kv, kd, Fg = _coeficientes_lote(q, g)
+    den = kv * vf
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mu_Pa_s = np.where(den != 0, (-Fg - kd * vf**2) / den, np.nan)
+    return np.maximum(mu_Pa_s, 0.0) * 1000 / 1.1 + 25
+
+CAMPOS_FLUJO = ("id", "tiempo_s", "velocidad_final_ms", "fuerza_kg", "llego",
+                "angulo_critico_deg", "viscosidad_critica_marsh", "error")
+
+def leer_escenarios(f):
+    # Un escenario por línea (JSON Lines); las líneas vacías se saltan.
+    # Cada registro tiene las claves de una entrada del JSON más "diametro"
+    # y un "id" opcional (por defecto el número de línea).
+    for numero, linea in enumerate(f, 1):
+        if not linea.strip():
+            continue
+        try:
+            registro = json.loads(linea)
+            if not isinstance(registro, dict):
+                raise ValueError("se esperaba un objeto JSON")
+        except ValueError as e:
+            yield str(numero), None, f"línea {numero}: {e}"
+            continue
+        yield str(registro.get("id", numero)), registro, None
+
+def _numero(x):
+    x = float(x)
+    return x if np.isfinite(x) else None
+
+def evaluar_escenarios(escenarios):
+    # escenarios: lista de (id, registro, error) como los de leer_escenarios.
+    # Ángulo constante con el solver analítico; con levantamiento, RK4 en lote.
+    resultados = [None] * len(escenarios)
+    validos = []
+    for k, (ident, registro, error) in enumerate(escenarios):
+        if error is None:
+            try:
+                p = parametros_lote([(ident, registro)])
+                lev = Levantamiento.desde_config(registro["levantamiento"]) if "levantamiento" in registro else None
+                reo = Reologia.desde_config(registro["reologia"]) if "reologia" in registro else None
+                if reo is not None and reo.modelo == "newtoniano":
+                    reo = None    # ya está en la viscosidad Marsh de parametros_lote
+            except KeyError as e:
+                error = f"falta la clave {e}"
+            except (TypeError, ValueError, OSError) as e:
+                error = str(e)
+        if error is not None:
+            resultados[k] = {"id": ident, "error": error}
+            continue
+        validos.append((k, ident, p, lev, reo))
+
+    if validos:
+        p = np.concatenate([v[2] for v in validos])
+        tiempo = np.empty(len(p))
+        velocidad = np.empty(len(p))
+        llego = np.empty(len(p), dtype=bool)
+        reologias = [v[4] for v in validos]
+        # El solver analítico es newtoniano: los fluidos no newtonianos van al lote RK4
+        curvos = np.array([v[3] is not None or v[4] is not None for v in validos])
+        if (~curvos).any():
+            r = simular_analitico(p[~curvos])
+            tiempo[~curvos], velocidad[~curvos], llego[~curvos] = r["tiempo"], r["velocidad"], r["llego"]
+        if curvos.any():
+            r = simular_lote(p[curvos], levantamientos=[v[3] for v in validos if v[3] is not None or v[4] is not None],
+                             reologias=[v[4] for v in validos if v[3] is not None or v[4] is not None])
+            tiempo[curvos], velocidad[curvos], llego[curvos] = r["tiempo"], r["velocidad"], r["llego"]
+        fuerza = _fuerza_impacto_lote(p, reologias=reologias)
+        angulo = _angulo_critico_lote(p, reologias=reologias)
+        viscosidad = _viscosidad_critica_lote(p)
+        for i, (k, ident, _, _, _) in enumerate(validos):
+            resultados[k] = {
+                "id": ident,
+                "tiempo_s": _numero(tiempo[i]),
+                "velocidad_final_ms": _numero(velocidad[i]),
+                "fuerza_kg": _numero(fuerza[i]),
+                "llego": bool(llego[i]),
+                "angulo_critico_deg": _numero(angulo[i]),
+                "viscosidad_critica_marsh": _numero(viscosidad[i]),
+            }
+    return resultados
+
+def procesar_flujo(entrada, salida, formato="jsonl", lote=4096):
+    # Lee escenarios de a uno, los evalúa por lotes y escribe cada lote apenas
+    # termina: memoria acotada por el lote y resultados parciales útiles.
+    escritor = None
+    if formato == "csv":
+        import csv
+        escritor = csv.DictWriter(salida, fieldnames=CAMPOS_FLUJO)
+        escritor.writeheader()
+    total = 0
+    pendientes = []
+
+    def vaciar():
+        nonlocal total
+        with _fase("flujo_lote"):
+            filas = evaluar_escenarios(pendientes)
+        for fila in filas:
+            if escritor is not None:
+                escritor.writerow(fila)
+            else:
+                salida.write(json.dumps(fila, ensure_ascii=False) + "\n")
+        salida.flush()
+        total += len(filas)
+        pendientes.clear()
+
+    for escenario in leer_escenarios(entrada):
+        pendientes.append(escenario)
+        if len(pendientes) >= lote:
+            vaciar()
+    if pendientes:
+        vaciar()
+    return total
+
+class ServidorSimulacion:
+    # Servidor local (HTTP/1.1 sobre TCP o socket Unix, cuerpos JSON) que
+    # mantiene en memoria los resultados y las curvas límite ya calculados.
+    # Las solicitudes concurrentes se agrupan en una sola evaluación
+    # vectorizada que corre en un pool de hilos, fuera del bucle de eventos.
+    #   POST /simular       escenario (o lista) como en --flujo; "entrada" toma
+    #                       como base una entrada del JSON cargado
+    #   POST /curvas        ángulo crítico (viscosidades x caudales) o
+    #                       viscosidad crítica (angulos x caudales)
+    #   GET  /estadisticas  latencias, rendimiento, aciertos de caché y cola
+    def __init__(self, config=None, max_cola=1024, max_lote=4096, trabajadores=2, max_cache=100000):
+        self.config = config or {}
+        self.max_cola = max_cola
+        self.max_lote = max_lote
+        self.trabajadores = trabajadores
+        self.max_cache = max_cache
+        self.cache = collections.OrderedDict()
+        self.cola = None
+        self.pool = None
+        self.inicio = time.perf_counter()
+        self.latencias = collections.deque(maxlen=10000)
+        self.contadores = {"solicitudes": 0, "escenarios": 0, "aciertos_cache": 0, "evaluados": 0,
+                           "lotes": 0, "rechazadas": 0, "errores": 0}
+
+    # --- Caché LRU en memoria ---
+
+    def _en_cache(self, clave):
+        if clave in self.cache:
+            self.cache.move_to_end(clave)
+            self.contadores["aciertos_cache"] += 1
+            return self.cache[clave]
+        return None
+
+    def _guardar(self, clave, valor):
+        self.cache[clave] = valor
+        if len(self.cache) > self.max_cache:
+            self.cache.popitem(last=False)
+
+    # --- Evaluación agrupada ---
+
+    def _registro(self, cuerpo):
+        if not isinstance(cuerpo, dict):
+            raise ValueError("cada escenario debe ser un objeto JSON")
+        if "entrada" not in cuerpo:
+            return cuerpo
+        base = self.config.get(cuerpo["entrada"])
+        if base is None:
+            raise ValueError(f"entrada desconocida: {cuerpo['entrada']}")
+        registro = dict(base, diametro=base.get("diametro", cuerpo["entrada"]))
+        registro.update((k, v) for k, v in cuerpo.items() if k != "entrada")
+        return registro
+
+    async def _evaluar(self, registro):
+        clave = json.dumps({k: v for k, v in registro.items() if k != "id"}, sort_keys=True)
+        fila = self._en_cache(clave)
+        if fila is None:
+            if self.cola.full():
+                self.contadores["rechazadas"] += 1
+                raise OverflowError("cola llena")
+            futuro = asyncio.get_running_loop().create_future()
+            self.cola.put_nowait((clave, registro, futuro))
+            fila = await futuro
+        fila = {k: v for k, v in fila.items() if k != "id"}
+        return dict(id=str(registro["id"]), **fila) if "id" in registro else fila
+
+    async def _agrupar(self):
+        # Toma lo que haya en la cola (al menos uno) y lo evalúa junto: bajo
+        # carga los lotes crecen solos mientras el anterior se calcula
+        loop = asyncio.get_running_loop()
+        while True:
+            lote = [await self.cola.get()]
+            while len(lote) < self.max_lote and not self.cola.empty():
+                lote.append(self.cola.get_nowait())
+            escenarios = [(str(k), registro, None) for k, (_, registro, _) in enumerate(lote)]
+            try:
+                filas = await loop.run_in_executor(self.pool, evaluar_escenarios, escenarios)
+            except Exception as e:   # un lote roto no debe detener el servidor
+                filas = [{"id": str(k), "error": str(e)} for k in range(len(lote))]
+            self.contadores["lotes"] += 1
+            self.contadores["evaluados"] += len(lote)
+            for (clave, _, futuro), fila in zip(lote, filas):
+                if "error" not in fila:
+                    self._guardar(clave, fila)
+                if not futuro.done():
+                    futuro.set_result(fila)
+
+    # --- Curvas límite ---
+
+    def _calcular_curvas(self, cuerpo):
+        registro = self._registro(cuerpo)
+        sim = SimuladorTestigo(dict({"rango_viscosidad": None}, **registro), registro.get("diametro"))
+        caudales = cuerpo["caudales"]
+        if "viscosidades" in cuerpo:
+            return {"angulo_critico": sim.curvas_angulo_critico(cuerpo["viscosidades"], caudales).tolist()}
+        return {"viscosidad_critica": sim.curvas_viscosidad_critica(cuerpo["angulos"], caudales).tolist()}
+
+    async def _curvas(self, cuerpo):
+        clave = "curvas:" + json.dumps(cuerpo, sort_keys=True)
+        resultado = self._en_cache(clave)
+        if resultado is None:
+            resultado = await asyncio.get_running_loop().run_in_executor(self.pool, self._calcular_curvas, cuerpo)
+            self._guardar(clave, resultado)
+        return resultado
+
+    def estadisticas(self):
+        transcurrido = time.perf_counter() - self.inicio
+        latencias = np.array(self.latencias) * 1000
+        resumen = dict(self.contadores)
+        resumen.update({
+            "en_cola": self.cola.qsize() if self.cola is not None else 0,
+            "entradas_cache": len(self.cache),
+            "lote_medio": self.contadores["evaluados"] / max(self.contadores["lotes"], 1),
+            "solicitudes_por_s": self.contadores["solicitudes"] / transcurrido,
+            "segundos_activo": transcurrido,
+        })
+        if latencias.size:
+            resumen["latencia_ms"] = dict(zip(("p50", "p95", "p99", "max"),
+                                              [float(x) for x in np.percentile(latencias, [50, 95, 99, 100])]))
+        return resumen
+
+    # --- HTTP ---
+
+    async def _despachar(self, metodo, ruta, cuerpo):
+        if metodo == "GET" and ruta == "/estadisticas":
+            return 200, self.estadisticas()
+        if metodo != "POST" or ruta not in ("/simular", "/curvas"):
+            return 404, {"error": f"{metodo} {ruta} no existe"}
+        try:
+            datos = json.loads(cuerpo or b"null")
+            if ruta == "/curvas":
+                return 200, await self._curvas(datos)
+            if isinstance(datos, list):
+                registros = [self._registro(d) for d in datos]
+                self.contadores["escenarios"] += len(registros)
+                return 200, list(await asyncio.gather(*(self._evaluar(r) for r in registros)))
+            self.contadores["escenarios"] += 1
+            return 200, await self._evaluar(self._registro(datos))
+        except OverflowError as e:
+            return 503, {"error": str(e)}
+        except (ValueError, KeyError, TypeError) as e:
+            self.contadores["errores"] += 1
+            return 400, {"error": f"falta la clave {e}" if isinstance(e, KeyError) else str(e)}
+
+    async def _atender(self, lector, escritor):
+        try:
+            while True:
+                linea = await lector.readline()
+                if not linea.strip():
+                    break
+                metodo, ruta = linea.decode("latin1").split()[:2]
+                cabeceras = {}
+                while True:
+                    linea = await lector.readline()
+                    if linea in (b"\r\n", b"\n", b""):
+                        break
+                    nombre, _, valor = linea.decode("latin1").partition(":")
+                    cabeceras[nombre.strip().lower()] = valor.strip()
+                cuerpo = await lector.readexactly(int(cabeceras.get("content-length", 0)))
+
+                t0 = time.perf_counter()
+                self.contadores["solicitudes"] += 1
+                estado, respuesta = await self._despachar(metodo, ruta, cuerpo)
+                self.latencias.append(time.perf_counter() - t0)
+
+                datos = json.dumps(respuesta, ensure_ascii=False).encode()
+                motivo = {200: "OK", 400: "Bad Request", 404: "Not Found", 503: "Service Unavailable"}[estado]
+                escritor.write(f"HTTP/1.1 {estado} {motivo}\r\nContent-Type: application/json\r\n"
+                               f"Content-Length: {len(datos)}\r\n\r\n".encode() + datos)
+                await escritor.drain()
+                if cabeceras.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            escritor.close()
+
+    async def servir(self, puerto=8765, socket_unix=None, listo=None):
+        from concurrent.futures import ThreadPoolExecutor
+        self.cola = asyncio.Queue(maxsize=self.max_cola)
+        self.pool = ThreadPoolExecutor(max_workers=self.trabajadores)
+        agrupadores = [asyncio.create_task(self._agrupar()) for _ in range(self.trabajadores)]
+        # Caché tibia: las entradas del JSON cargado quedan evaluadas desde el inicio
+        if self.config:
+            await asyncio.gather(*(self._evaluar(self._registro({"entrada": diam})) for diam in self.config))
+        if socket_unix:
+            servidor = await asyncio.start_unix_server(self._atender, path=socket_unix)
+        else:
+            servidor = await asyncio.start_server(self._atender, "127.0.0.1", puerto)
+        if listo is not None:
+            listo(servidor)
+        try:
+            async with servidor:
+                await servidor.serve_forever()
+        finally:
+            for tarea in agrupadores:
+                tarea.cancel()
+            self.pool.shutdown(wait=False)
 
 def main():
     parser = argparse.ArgumentParser(description="Simulador de testigo en perforación inclinada con todos los modos de análisis.")
-    parser.add_argument("archivo_json", help="Archivo JSON con configuraciones por diámetro.")
+    parser.add_argument("archivo_json", help="Archivo JSON con configuraciones por diámetro (con --flujo, JSON Lines; - para stdin).")
     parser.add_argument("--graficar", action="store_true", help="Simulación dinámica con Runge-Kutta.")
     parser.add_argument("--graficar_viscosidad", action="store_true", help="Curvas de ángulo crítico vs caudal para varias viscosidades.")
     parser.add_argument("--graficar_angulo", action="store_true", help="Curvas de viscosidad vs caudal para varios ángulos.")
     parser.add_argument("--graficar_caudal", action="store_true", help="Curvas de viscosidad crítica vs ángulo para varios caudales.")
+    parser.add_argument("--mapa_limite", nargs=2, choices=list(EJES_TABLA), metavar="EJE", help=f"Mapa del límite de descenso en dos ejes ({', '.join(EJES_TABLA)}) con refinamiento adaptativo.")
+    parser.add_argument("--criterio", choices=list(CRITERIOS_MAPA), default="reposo", help="Con --mapa_limite: reposo (aceleración en el tope) o llegada (dentro del tiempo máximo).")
+    parser.add_argument("--tolerancia_mapa", type=float, default=1e-3, help="Con --mapa_limite, lado de la celda más fina como fracción del rango de cada eje.")
+    parser.add_argument("--modo_analitico", action="store_true", help="Resumen sin paso de tiempo (cuadratura): tiempo de llegada, velocidad final y fuerza.")
+    parser.add_argument("--monte_carlo", action="store_true", help="Propagación de incertidumbre según la sección \"monte_carlo\" de cada entrada.")
+    parser.add_argument("--tren", action="store_true", help="Testigo quebrado: las piezas de \"piezas_m\" de cada entrada bajan en tren, con contacto entre vecinas; tiempo, velocidad y fuerza de llegada por pieza.")
+    parser.add_argument("--sensibilidades", action="store_true", help="Derivadas del tiempo de llegada y la velocidad final respecto de cada parámetro (ecuaciones tangentes en el mismo RK4).")
+    parser.add_argument("--resolver", choices=["caudal", "viscosidad"], help="Solver inverso: caudal o viscosidad límite para --tiempo_objetivo o --fuerza_max.")
+    parser.add_argument("--tiempo_objetivo", type=float, help="Con --resolver: tiempo máximo de llegada (s).")
+    parser.add_argument("--fuerza_max", type=float, help="Con --resolver: fuerza de impacto máxima (kg).")
+    parser.add_argument("--construir_tablas", metavar="DIR", help="Precalcular tablas de operación (ángulo x caudal x viscosidad) de cada entrada en DIR/<diámetro>.")
+    parser.add_argument("--consultar_tablas", metavar="DIR", help="Interpolar en las tablas de DIR el punto de operación de cada entrada, sin simular.")
+    parser.add_argument("--integrador", choices=["rk4", "rk45", "exp"], help="Integrador: rk4 de paso fijo, rk45 adaptativo con detección de llegada o exp (Rosenbrock exponencial para regímenes rígidos; rk4 y rk45 pasan a exp solos cuando detectan rigidez).")
+    parser.add_argument("--tolerancia", type=float, help="Tolerancia de los integradores rk45 y exp (default 1e-6).")
+    parser.add_argument("--salida", help="Directorio donde guardar las figuras sin abrir ventanas (sin pantalla, backend Agg).")
+    parser.add_argument("--formato", choices=["png", "pdf", "svg"], default="png", help="Formato de las figuras guardadas con --salida.")
+    parser.add_argument("--guardar_trayectoria", metavar="DIR", help="Escribir la trayectoria de cada entrada en DIR/<diámetro>_trayectoria.npy por bloques, sin graficar.")
+    parser.add_argument("--cada", type=int, default=1, help="Con --guardar_trayectoria, conservar uno de cada k registros.")
+    parser.add_argument("--cache", nargs="?", const=".cache_simulacion", help="Directorio de caché de simulaciones y curvas (default .cache_simulacion).")
+    parser.add_argument("--cache_max_mb", type=float, default=500, help="Tamaño máximo de la caché en MB; se desalojan los resultados menos usados.")
+    parser.add_argument("--solo_graficar", action="store_true", help="Redibujar solo desde la caché, sin recalcular.")
+    parser.add_argument("--perfil", nargs="?", const="perfil.json", help="Guardar tiempos por fase, contadores y memoria pico en un JSON de traza (también con SIMULACION_PERFIL=ruta).")
+    parser.add_argument("--flujo", action="store_true", help="Leer escenarios JSON Lines de a uno y escribir un resumen por escenario a medida que se evalúan.")
+    parser.add_argument("--resultados", default="-", help="Con --flujo, archivo de resultados .jsonl o .csv (default stdout en JSON Lines).")
+    parser.add_argument("--lote", type=int, default=4096, help="Con --flujo, escenarios por lote de evaluación.")
+    parser.add_argument("--servidor", action="store_true", help="Servidor local HTTP con JSON (POST /simular, POST /curvas, GET /estadisticas) que mantiene resultados en memoria.")
+    parser.add_argument("--puerto", type=int, default=8765, help="Con --servidor, puerto TCP en 127.0.0.1.")
+    parser.add_argument("--socket", help="Con --servidor, escuchar en este socket Unix en vez de TCP.")
+    parser.add_argument("--max_cola", type=int, default=1024, help="Con --servidor, escenarios en espera antes de responder 503.")
+    parser.add_argument("--explorar", nargs="?", const="", metavar="DIAM", help="Explorador interactivo con deslizadores de ángulo, caudal, viscosidad y densidades (default la primera entrada).")
+    parser.add_argument("--jobs", type=int, default=1, help="Procesos en paralelo para diámetros y modos (requiere --salida).")
     args = parser.parse_args()
 
-    with open(args.archivo_json) as f:
-        config = json.load(f)
-
-    modo_default = not (args.graficar or args.graficar_viscosidad or args.graficar_angulo or args.graficar_caudal)
-
-    for diam in config:
-        sim = SimuladorTestigo(config[diam], diam)
-
-        if modo_default:
-            # --- Gráfica integrada de 6 cuadros ---
-            fig, axs = plt.subplots(3, 2, figsize=sim.figsize, sharex=False)
-
-            # 1. Simular posición, velocidad, aceleración
-            sim.graficar_simulacion(axs=axs[:, 0])
-
-            # 2. Dibujar columna derecha
-            sim.graficar_viscosidad_limite(ax=axs[0, 1])
-            sim.graficar_angulo_limite(ax=axs[1, 1])
-            sim.graficar_caudal_limite(ax=axs[2, 1])
-
-            # 3. Ajuste general de escalas y etiquetas
-            for i in range(3):
-                axs[i, 0].tick_params(axis='both', labelsize=8)
-                axs[i, 0].grid(True)
-                axs[i, 0].set_xlabel("Tiempo (s)", fontsize=9)
-                
-                axs[i, 1].tick_params(axis='both', labelsize=8, labelbottom=True)
-                axs[i, 1].grid(True)
-                if i in [0, 1]:  # viscosidad vs caudal, ángulo vs caudal
-                    axs[i, 1].set_xlabel("Caudal (L/min)", fontsize=9)
-                    axs[i, 1].set_xlim(sim.Q_min, sim.Q_max)
-                elif i == 2:  # caudal vs ángulo
-                    axs[i, 1].set_xlabel("Ángulo (°)", fontsize=9)
-                    axs[i, 1].set_xlim(0, 90)
-
-            # 4. Subtítulos de la primera columna
-            texto_unificado = sim.subtitulo_datos + "\n" + sim.subtitulo_resultados
-            wrapped_text = textwrap.fill(texto_unificado, width=85)
-
-            at = AnchoredText(
-                wrapped_text,
-                prop=dict(size=9),
-                frameon=False,
-                loc='upper left',
-                bbox_to_anchor=(0.05, 0.93),
-                bbox_transform=fig.transFigure,
-                borderpad=0.0
-            )
-            fig.add_artist(at)
-
-            # 5. Título general
-            fig.suptitle(f"Simulación Numérica Explícita – {diam}", fontsize=16)
-
-            # 6. Compactar
-            plt.tight_layout(rect=[0.02, 0, 0.97, 0.96])
-            plt.subplots_adjust(wspace=0.15, hspace=0.4)
-            plt.show()
-
+    if args.jobs > 1 and not (args.salida or args.servidor):
+        parser.error("--jobs requiere --salida: los procesos guardan las figuras sin pantalla.")
+    if args.salida:
+        modo_sin_pantalla()
+    if args.solo_graficar and not args.cache:
+        args.cache = ".cache_simulacion"
+
+    ruta_perfil = args.perfil or os.environ.get("SIMULACION_PERFIL")
+    perfil = activar_perfil() if ruta_perfil else None
+    try:
+        if args.flujo:
+            _ejecutar_flujo(args)
+            return
+        with open(args.archivo_json) as f:
+            config = json.load(f)
+        if args.servidor:
+            servidor = ServidorSimulacion(config, max_cola=args.max_cola, trabajadores=max(args.jobs, 2))
+            destino = args.socket or f"http://127.0.0.1:{args.puerto}"
+            try:
+                asyncio.run(servidor.servir(args.puerto, args.socket, listo=lambda _: print(f"Escuchando en {destino}", flush=True)))
+            except KeyboardInterrupt:
+                pass
+            return
+        if args.explorar is not None:
+            diam = args.explorar or next(iter(config))
+            if diam not in config:
+                parser.error(f"--explorar: no hay una entrada \"{diam}\" en {args.archivo_json}.")
+            Explorador(config[diam], diam).mostrar()
+            return
+        _ejecutar_modos(parser, args, config)
+    finally:
+        if perfil is not None:
+            perfil.guardar(ruta_perfil)
+
+def _ejecutar_flujo(args):
+    import sys
+    formato = "csv" if args.resultados.endswith(".csv") else "jsonl"
+    with contextlib.ExitStack() as pila:
+        entrada = sys.stdin if args.archivo_json == "-" else pila.enter_context(open(args.archivo_json, encoding="utf-8"))
+        salida = sys.stdout if args.resultados == "-" else pila.enter_context(open(args.resultados, "w", encoding="utf-8", newline=""))
+        total = procesar_flujo(entrada, salida, formato, args.lote)
+    if args.resultados != "-":
+        print(f"{total} escenarios en {args.resultados}")
+
+def _ejecutar_modos(parser, args, config):
+    # Las rutas analíticas (y lo que se construye sobre ellas), las sensibilidades y el tren suponen ángulo constante
+    analiticos = [opcion for opcion, activa in (("--modo_analitico", args.modo_analitico), ("--resolver", args.resolver),
+                                                 ("--sensibilidades", args.sensibilidades), ("--mapa_limite", args.mapa_limite),
+                                                 ("--monte_carlo", args.monte_carlo), ("--construir_tablas", args.construir_tablas),
+                                                 ("--consultar_tablas", args.consultar_tablas), ("--tren", args.tren)) if activa]
+    if args.mapa_limite and args.mapa_limite[0] == args.mapa_limite[1]:
+        parser.error("--mapa_limite requiere dos ejes distintos.")
+    con_levantamiento = [diam for diam, cfg in config.items() if "levantamiento" in cfg]
+    if analiticos and con_levantamiento:
+        parser.error(f"{analiticos[0]} supone un ángulo constante y no admite \"levantamiento\" ({', '.join(con_levantamiento)}).")
+    no_newtonianos = [diam for diam, cfg in config.items() if "reologia" in cfg and cfg["reologia"].get("modelo") != "newtoniano"]
+    if analiticos and no_newtonianos:
+        parser.error(f"{analiticos[0]} supone un fluido newtoniano y no admite \"reologia\" ({', '.join(no_newtonianos)}).")
+
+    if args.modo_analitico:
+        casos = list(config.items())
+        with _fase("modo_analitico"):
+            r = simular_analitico(parametros_lote((diam, cfg) for diam, cfg in casos))
+        for i, (diam, _) in enumerate(casos):
+            estado = "" if r["llego"][i] else " (no llega en el tiempo máximo)"
+            print(f"{diam}: Velocidad final {r['velocidad'][i]:.1f} m/s, "
+                  f"Tiempo total {r['tiempo'][i]:.1f} s, "
+                  f"Fuerza total de inpacto del testigo {r['fuerza'][i]:.1f} kg{estado}")
+        return
+
+    if args.tren:
+        casos = list(config.items())
+        largos = [cfg.get("piezas_m", [cfg["longitud_testigo_m"]]) for _, cfg in casos]
+        malos = [diam for (diam, _), l in zip(casos, largos) if not l or min(l) <= 0]
+        if malos:
+            parser.error(f"--tren requiere largos de pieza positivos en \"piezas_m\" ({', '.join(malos)}).")
+        with _fase("tren"):
+            r = simular_tren(parametros_lote(casos), largos)
+        for i, (diam, _) in enumerate(casos):
+            print(f"{diam}: {len(largos[i])} pieza{'' if len(largos[i]) == 1 else 's'}")
+            for j, largo in enumerate(largos[i]):
+                estado = "" if r["llego"][i, j] else " (no llega en el tiempo máximo)"
+                print(f"  pieza {j + 1} ({largo} m): Velocidad final {r['velocidad'][i, j]:.1f} m/s, "
+                      f"Tiempo total {r['tiempo'][i, j]:.1f} s, "
+                      f"Fuerza total de inpacto {r['fuerza'][i, j]:.1f} kg{estado}")
+        return
+
+    if args.sensibilidades:
+        casos = list(config.items())
+        p = parametros_lote(casos)
+        with _fase("sensibilidades"):
+            r = sensibilidades_lote(p)
+        for i, (diam, _) in enumerate(casos):
+            if not r["llego"][i]:
+                print(f"{diam}: no llega en el tiempo máximo, sin sensibilidades")
+                continue
+            print(f"{diam}: Tiempo total {r['tiempo'][i]:.2f} s, velocidad final {r['velocidad'][i]:.3f} m/s")
+            # Elasticidad: % de cambio del tiempo por 1 % de cambio del parámetro
+            elasticidad = {c: r["dtiempo"][c][i] * p[c][i] / r["tiempo"][i] for c in CAMPOS_SENSIBILIDAD}
+            for c in sorted(CAMPOS_SENSIBILIDAD, key=lambda c: -abs(elasticidad[c])):
+                print(f"  {c:22s} elasticidad {elasticidad[c]:+8.3f}   "
+                      f"dT/dp {r['dtiempo'][c][i]:+.4g}   dv/dp {r['dvelocidad'][c][i]:+.4g}")
+        return
+
+    if args.resolver:
+        if (args.tiempo_objetivo is None) == (args.fuerza_max is None):
+            parser.error("--resolver requiere uno de --tiempo_objetivo o --fuerza_max.")
+        variable = "caudal_lpm" if args.resolver == "caudal" else "viscosidad_marsh_seg"
+        unidad = "L/min" if args.resolver == "caudal" else "s Marsh"
+        objetivo, limite = ("tiempo", args.tiempo_objetivo) if args.tiempo_objetivo is not None else ("fuerza", args.fuerza_max)
+        casos = list(config.items())
+        with _fase("resolver"):
+            r = resolver_operacion(parametros_lote(casos), variable, objetivo, limite)
+        cota = ("máxim" if r["maximo"] else "mínim") + ("o" if args.resolver == "caudal" else "a")
+        for i, (diam, cfg) in enumerate(casos):
+            if r["sin_solucion"][i]:
+                print(f"{diam} ({cfg['angulo_deg']}°): ningún {args.resolver} en {RANGOS_OPERACION[variable]} cumple el objetivo")
+                continue
+            borde = " (todo el rango cumple)" if r["en_borde"][i] else ""
+            print(f"{diam} ({cfg['angulo_deg']}°): {args.resolver} {cota} {r['valor'][i]:.2f} {unidad}{borde}, "
+                  f"{objetivo} {r['metrica'][i]:.2f}, sensibilidad {r['sensibilidad'][i]:.4g} por {unidad}")
+        return
+
+    if args.construir_tablas:
+        for diam, cfg in config.items():
+            ruta = os.path.join(args.construir_tablas, diam)
+            with _fase("construir_tabla", diam):
+                tabla = construir_tabla(ruta, diam, cfg)
+            forma = " x ".join(str(tabla.ejes[e][2]) for e in EJES_TABLA)
+            print(f"{diam}: tabla {forma} en {ruta}")
+        return
+
+    if args.consultar_tablas:
+        for diam, cfg in config.items():
+            tabla = TablaOperacion(os.path.join(args.consultar_tablas, diam))
+            try:
+                r = tabla.consultar(cfg["angulo_deg"], cfg["caudal_lpm"], cfg["viscosidad_marsh_seg"])
+            except ValueError as e:
+                print(f"{diam}: {e}")
+                continue
+            print(f"{diam}: Tiempo total {r['tiempo']:.1f} s, velocidad final {r['velocidad']:.2f} m/s, "
+                  f"velocidad terminal {r['terminal']:.2f} m/s, fuerza {r['fuerza']:.1f} kg, "
+                  f"ángulo crítico {r['angulo_critico']:.1f}°")
+        return
+
+    if args.guardar_trayectoria:
+        os.makedirs(args.guardar_trayectoria, exist_ok=True)
+        for diam in config:
+            sim = SimuladorTestigo(config[diam], diam)
+            if args.integrador:
+                sim.integrador = args.integrador
+            if args.tolerancia:
+                sim.tolerancia = args.tolerancia
+            ruta = os.path.join(args.guardar_trayectoria, f"{diam}_trayectoria.npy")
+            with _fase("guardar_trayectoria", diam):
+                filas = sim.guardar_trayectoria(ruta, cada=args.cada)
+            print(f"{diam}: {filas} registros en {ruta}")
+        return
+
+    if args.monte_carlo:
+        for diam, cfg in config.items():
+            if "monte_carlo" not in cfg:
+                continue
+            with _fase("monte_carlo", diam):
+                r = simular_monte_carlo(diam, cfg)
+            etiquetas = "/".join(f"P{p:g}" for p in r["percentiles"])
+            print(f"{diam}: {r['muestras']} muestras, "
+                  f"probabilidad de que no descienda {100 * r['prob_no_desciende']:.2f} %, "
+                  f"de que no llegue en el tiempo máximo {100 * r['prob_no_llega']:.2f} %")
+            print(f"  Tiempo total {etiquetas}: " + ", ".join(f"{x:.1f}" for x in r["tiempo"]) + " s")
+            print(f"  Velocidad terminal {etiquetas}: " + ", ".join(f"{x:.2f}" for x in r["velocidad_terminal"]) + " m/s")
+            print(f"  Fuerza de impacto {etiquetas}: " + ", ".join(f"{x:.1f}" for x in r["fuerza"]) + " kg")
+        return
+
+    modo_default = not (args.graficar or args.graficar_viscosidad or args.graficar_angulo or args.graficar_caudal or args.mapa_limite)
+    if modo_default:
+        # --- Gráfica integrada de 6 cuadros ---
+        modos = ["graficar_reporte"]
+    else:
+        # --- Modos separados normales ---
+        modos = [modo for modo, activo in (("graficar_simulacion", args.graficar),
+                                           ("graficar_viscosidad_limite", args.graficar_viscosidad),
+                                           ("graficar_angulo_limite", args.graficar_angulo),
+                                           ("graficar_caudal_limite", args.graficar_caudal),
+                                           ("graficar_mapa_limite", args.mapa_limite)) if activo]
+
+    opciones = {"integrador": args.integrador, "tolerancia": args.tolerancia,
+                "salida": args.salida, "formato": args.formato,
+                "cache": args.cache, "cache_max_mb": args.cache_max_mb, "solo_graficar": args.solo_graficar,
+                "perfil": _perfil is not None,
+                "mapa": (args.mapa_limite, args.criterio, args.tolerancia_mapa)}
+    tareas = [(diam, config[diam], modo, opciones) for diam in config for modo in modos]
+
+    try:
+        if args.jobs > 1:
+            # Cada proceso dibuja y guarda sus figuras sin pantalla; map conserva el orden
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+                resultados = list(pool.map(_ejecutar_tarea, tareas))
         else:
-            # --- Modos separados normales ---
-            if args.graficar:
-                sim.graficar_simulacion()
-            if args.graficar_viscosidad:
-                sim.graficar_viscosidad_limite()
-            if args.graficar_angulo:
-                sim.graficar_angulo_limite()
-            if args.graficar_caudal:
-                sim.graficar_caudal_limite()
+            resultados = [_ejecutar_tarea(tarea) for tarea in tareas]
+    except LookupError as e:
+        parser.exit(1, f"{e}\n")
+
+    for diam, modo, resumen, datos_perfil in resultados:
+        if args.salida and resumen:
+            print(f"{diam}: {resumen}")
+        if datos_perfil is not None:
+            _perfil.combinar(datos_perfil)
+
+def _ejecutar_tarea(tarea):
+    # Cada tarea mide con su propio Perfil (también dentro del pool de procesos)
+    # y devuelve sus datos para combinarlos en el proceso principal
+    global _perfil
+    diam, config, modo, opciones = tarea
+    anterior = _perfil
+    if opciones["perfil"]:
+        _perfil = Perfil()
+    try:
+        resumen = _graficar_tarea(diam, config, modo, opciones)
+        datos_perfil = _perfil.datos() if opciones["perfil"] else None
+    finally:
+        _perfil = anterior
+    return diam, modo, resumen, datos_perfil
+
+def _graficar_tarea(diam, config, modo, opciones):
+    if opciones["salida"]:
+        modo_sin_pantalla()
+    sim = SimuladorTestigo(config, diam)
+    if opciones["integrador"]:
+        sim.integrador = opciones["integrador"]
+    if opciones["tolerancia"]:
+        sim.tolerancia = opciones["tolerancia"]
+    ejes_mapa, sim.criterio_mapa, sim.tolerancia_mapa = opciones["mapa"]
+    if ejes_mapa:
+        sim.ejes_mapa = tuple(ejes_mapa)
+    if opciones["salida"]:
+        sim.salida = opciones["salida"]
+        sim.formato = opciones["formato"]
+    if opciones["cache"]:
+        sim.cache = CacheResultados(opciones["cache"], int(opciones["cache_max_mb"] * 2**20))
+        sim.solo_graficar = opciones["solo_graficar"]
+
+    with _fase(modo, diam):
+        getattr(sim, modo)()
+    return getattr(sim, "subtitulo_resultados", None)
 
 if __name__ == "__main__":
     main()